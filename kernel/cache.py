@@ -0,0 +1,88 @@
+"""
+Bounded caches shared by the pyOS kernel.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable
+
+
+class _Missing:
+    def __repr__(self) -> str:
+        return "MISSING"
+
+
+# Returned by LRUCache.get when a key is not cached (None is a valid value)
+MISSING: Any = _Missing()
+
+
+class LRUCache:
+    """Thread-safe least recently used cache with hit/miss counters."""
+
+    def __init__(self, size: int) -> None:
+        """Initialize the cache.
+
+        Args:
+            size: Maximum number of entries, 0 disables caching
+        """
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """Return the cached value for key, marking it as recently used."""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store value for key, evicting the least recently used entries."""
+        with self._lock:
+            if self.size <= 0:
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def discard(self, key: Hashable) -> None:
+        """Remove key from the cache if it is present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def resize(self, size: int) -> None:
+        """Change the maximum size, evicting entries if needed."""
+        with self._lock:
+            self.size = size
+            while len(self._data) > max(size, 0):
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return the cache size and hit/miss counters."""
+        return {
+            "size": len(self._data),
+            "maxsize": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,92 @@
+"""
+Remembered program locations, like the ``hash`` table of a Unix shell.
+"""
+
+import posixpath
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass
+class _Entry:
+    path: str
+    search: str  # the $PATH the command was found with
+    uses: int = 1
+
+
+class CommandHash:
+    """Maps command names to the program paths they resolved to.
+
+    An entry is only used while the shell searches the same ``$PATH`` it
+    was resolved with, and is dropped when a path it depends on changes.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._table: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def lookup(self, name: str, search: str) -> Optional[str]:
+        """Return the remembered path of name for the given $PATH."""
+        with self._lock:
+            entry = self._table.get(name)
+            if entry is None or entry.search != search:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry.uses += 1
+            return entry.path
+
+    def remember(self, name: str, path: str, search: str) -> None:
+        """Record that name resolved to path while searching $PATH."""
+        with self._lock:
+            self._table[name] = _Entry(path, search)
+
+    def forget(self, name: Optional[str] = None) -> None:
+        """Drop the entry of name, or every entry if no name is given."""
+        with self._lock:
+            if name is None:
+                self._table.clear()
+            else:
+                self._table.pop(name, None)
+
+    def invalidate(self, path: str) -> None:
+        """Drop the entries a change of path could make stale.
+
+        That is every entry resolved to path or below it, and the entry
+        of the command name path would provide, which may now be shadowed.
+        """
+        path = path.rstrip("/") or "/"
+        name = posixpath.basename(path)
+        if name.endswith(".py"):
+            name = name[:-3]
+        prefix = path.rstrip("/") + "/"
+        with self._lock:
+            for key, entry in list(self._table.items()):
+                if (
+                    key == name
+                    or entry.path == path
+                    or entry.path.startswith(prefix)
+                ):
+                    del self._table[key]
+
+    def items(self) -> List[Tuple[str, str, int]]:
+        """Return (name, path, uses) for every entry, sorted by name."""
+        with self._lock:
+            return [
+                (name, entry.path, entry.uses)
+                for name, entry in sorted(self._table.items())
+            ]
+
+    def stats(self) -> Dict[str, int]:
+        """Return the table size and hit/miss counters."""
+        return {
+            "size": len(self._table),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
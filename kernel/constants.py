@@ -1,6 +1,6 @@
 import os
 import sys
-from typing import Final, List
+from typing import Final, List, Optional
 from enum import IntEnum
 
 
@@ -39,6 +39,46 @@ else:
     METADATAFILE = os.path.join(BASEPATH, "data/data")
     USERDATAFILE = os.path.join(BASEPATH, "data/userdata")
 
+# Database connection tuning
+DBPOOLSIZE: Final[int] = 8  # idle connections kept per database
+DBCACHESIZE: Final[int] = -8000  # page cache per connection, negative is KiB
+DBSYNCMODE: Final[str] = "NORMAL"  # safe with WAL, avoids fsync per commit
+METADATACACHESIZE: Final[int] = 4096  # cached metadata rows, 0 disables
+PERMISSIONCACHESIZE: Final[int] = 4096  # cached permission decisions
+PROGRAMCACHESIZE: Final[int] = 256  # loaded program modules
+EXPANSIONCACHESIZE: Final[int] = 256  # expanded command lines
+EXPANSIONCACHEWORDS: Final[int] = 64  # longer expansions are not cached
+# words the braces of a command line may expand to, {a,b}{c,d}... grows
+# exponentially and every word is kept until the command runs
+BRACEEXPANSIONMAX: Final[int] = 100000
+PIPESIZE: Final[int] = 1024  # lines buffered between piped programs
+PIPEBYTESIZE: Final[int] = 1 << 20  # bytes of raw chunks buffered in a pipe
+PIPECHUNKSIZE: Final[int] = 64 * 1024  # bytes read at a time by byte copies
+# bytes a pipe keeps in memory before spilling to a temporary file instead
+# of blocking its writer, None disables spilling
+PIPESPILLSIZE: Final[Optional[int]] = None
+PIPESPILLCOMPRESS: Final[bool] = False  # zlib-compress spilled lines
+# run consecutive filter programs (those with a transform function) of a
+# pipeline as chained generators in one shell instead of one each
+PIPEFUSE: Final[bool] = True
+WORKERPOOLSIZE: Final[int] = 8  # idle shell threads kept for reuse
+# shells running at once, later ones wait for a free worker; None for no
+# limit, as pipeline stages waiting on each other can not share workers
+WORKERPOOLMAX: Final[Optional[int]] = None
+WORKERKEEPALIVE: Final[float] = 30.0  # seconds an idle shell thread is kept
+# idle worker processes kept for programs marked cpu_bound, which then run
+# outside of the GIL; 0 runs them in threads like every other program
+PROCESSPOOLSIZE: Final[int] = 0
+PROCESSBATCHSIZE: Final[int] = 256  # lines sent at a time to/from a process
+# threads running the blocking calls (SysCalls) of async programs, which
+# all share one event loop
+SCHEDULEREXECUTORSIZE: Final[int] = 8
+# frozen layers of variables a shell keeps before merging them, bounds the
+# lookup cost while keeping the creation of child shells constant time
+ENVLAYERS: Final[int] = 8
+HISTSIZE: Final[int] = 1000  # commands of a session kept in memory
+HISTPAGESIZE: Final[int] = 100  # commands read at a time by history
+
 # Special Characters/strings
 VARCHAR: Final[str] = "$"
 PATHCHAR: Final[str] = "/"
@@ -0,0 +1,121 @@
+"""
+Pooled SQLite connections for the pyOS databases.
+"""
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+
+from kernel.constants import DBCACHESIZE, DBPOOLSIZE, DBSYNCMODE
+
+
+class ConnectionPool:
+    """Long-lived SQLite connections, one checked out per thread.
+
+    A thread keeps the same connection for as long as it holds it, so
+    nested ``connection()`` blocks share one transaction which is only
+    committed (or rolled back) by the outermost block.  Released
+    connections are parked for the next thread instead of being closed.
+    """
+
+    def __init__(
+        self, database: Callable[[], str], size: int = DBPOOLSIZE
+    ) -> None:
+        """Initialize the pool.
+
+        Args:
+            database: Callable returning the database file to connect to.
+                      It is called on every checkout so patched paths
+                      are picked up.
+            size: Maximum number of idle connections kept per database
+        """
+        self._database = database
+        self.size = size
+        self._lock = threading.Lock()
+        self._idle: Dict[str, List[sqlite3.Connection]] = {}
+        self._open: List[sqlite3.Connection] = []
+        self._local = threading.local()
+
+    def _connect(self, database: str) -> sqlite3.Connection:
+        con = sqlite3.connect(
+            database,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+        )
+        cur = con.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=%s" % (DBSYNCMODE,))
+        cur.execute("PRAGMA cache_size=%d" % (DBCACHESIZE,))
+        cur.close()
+        with self._lock:
+            self._open.append(con)
+        return con
+
+    def _acquire(self, database: str) -> sqlite3.Connection:
+        with self._lock:
+            idle = self._idle.get(database)
+            if idle:
+                return idle.pop()
+        return self._connect(database)
+
+    def _release(self, database: str, con: sqlite3.Connection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(database, [])
+            if con in self._open and len(idle) < self.size:
+                idle.append(con)
+                return
+            if con in self._open:
+                self._open.remove(con)
+        con.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Check out this thread's connection for the duration of the block."""
+        database = self._database()
+        held = getattr(self._local, "held", None)
+        if held is not None and held[0] == database:
+            self._local.depth += 1
+            try:
+                yield held[1]
+            finally:
+                self._local.depth -= 1
+            return
+
+        con = self._acquire(database)
+        self._local.held = (database, con)
+        self._local.depth = 0
+        try:
+            yield con
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        finally:
+            self._local.held = None
+            self._release(database, con)
+
+    @property
+    def in_use(self) -> bool:
+        """Whether the current thread is inside a ``connection()`` block."""
+        return getattr(self._local, "held", None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of open and idle connections."""
+        with self._lock:
+            return {
+                "open": len(self._open),
+                "idle": sum(len(x) for x in self._idle.values()),
+            }
+
+    def close(self) -> None:
+        """Close every connection opened by this pool."""
+        with self._lock:
+            connections = self._open
+            self._open = []
+            self._idle = {}
+        for con in connections:
+            try:
+                con.close()
+            except sqlite3.Error:
+                pass
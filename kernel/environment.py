@@ -0,0 +1,127 @@
+"""
+Copy-on-write variables, aliases and history shared by a shell and its
+children.
+
+A child shell does not copy anything from its parent: it reads through to
+layers the parent no longer writes to, and writes to a layer of its own.
+"""
+
+from collections import ChainMap, deque
+from typing import (
+    Any,
+    Deque,
+    Iterator,
+    List,
+    Mapping,
+    Sequence,
+    Union,
+    overload,
+)
+
+from kernel.constants import ENVLAYERS, HISTSIZE
+
+
+class Environment(ChainMap[str, str]):
+    """Variables or aliases, written to the first layer only.
+
+    The other layers are frozen and may be shared with other shells.
+    """
+
+    def fork(self) -> "Environment":
+        """Return a child that sees the values as they are now."""
+        if self.maps[0]:
+            # what was written so far is frozen, and shared with the child
+            self.maps.insert(0, {})
+            if len(self.maps) > ENVLAYERS:
+                self.maps = [{}, dict(ChainMap(*self.maps))]
+        return Environment({}, *self.maps[1:])
+
+    @classmethod
+    def child_of(cls, parent: Mapping[str, str]) -> "Environment":
+        if isinstance(parent, Environment):
+            return parent.fork()
+        return cls({}, dict(parent))
+
+
+class History(Sequence[str]):
+    """The last HISTSIZE commands of a shell, those of its parent first.
+
+    Commands are only ever appended, so the parent's history is shared
+    instead of copied. Commands are found by their position among all the
+    commands ever seen, which does not change when the oldest are dropped:
+    the child sees those of the parent up to the one last seen when it
+    started, as long as the parent still keeps them. Older commands are
+    kept in the user's history store.
+    """
+
+    def __init__(self, parent: Sequence[str] = ()) -> None:
+        self._parent = parent
+        if isinstance(parent, History):
+            self._start = parent.seen()
+        else:
+            self._start = len(parent)
+        self._own: Deque[str] = deque(maxlen=HISTSIZE)
+        self._appended = 0
+
+    def seen(self) -> int:
+        """Return the number of commands ever in the history, kept or not."""
+        return self._start + self._appended
+
+    def first(self) -> int:
+        """Return the position of the oldest command that is still kept."""
+        if isinstance(self._parent, History):
+            parent = self._parent.first()
+        else:
+            parent = 0
+        return max(self.seen() - HISTSIZE, min(parent, self._start))
+
+    def at(self, position: int) -> str:
+        """Return the command at position, counted from the first seen."""
+        if position >= self._start:
+            return self._own[position - self.seen() + len(self._own)]
+        if isinstance(self._parent, History):
+            return self._parent.at(position)
+        return self._parent[position]
+
+    def __len__(self) -> int:
+        return self.seen() - self.first()
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[str]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        first = self.first()
+        size = self.seen() - first
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("history index out of range")
+        return self.at(first + index)
+
+    def __iter__(self) -> Iterator[str]:
+        for position in range(self.first(), self._start):
+            yield self.at(position)
+        # every command of this shell is kept while any older one is
+        yield from self._own
+
+    def __reversed__(self) -> Iterator[str]:
+        yield from reversed(self._own)
+        for position in range(self._start - 1, self.first() - 1, -1):
+            yield self.at(position)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return "History(%r)" % (list(self),)
+
+    def append(self, command: str) -> None:
+        self._own.append(command)
+        self._appended += 1
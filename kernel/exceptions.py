@@ -54,6 +54,16 @@ class InvalidPathError(PyOSError):
         super().__init__(message)
 
 
+class BrokenPipeError(PyOSError):
+    """Raised when writing to a pipe whose reader has stopped reading."""
+
+    def __init__(self, name: str = "", message: Optional[str] = None):
+        self.name = name
+        if message is None:
+            message = f"Broken pipe: {name}"
+        super().__init__(message)
+
+
 class CommandNotFoundError(PyOSError):
     """Raised when a command is not found."""
 
@@ -62,3 +72,13 @@ class CommandNotFoundError(PyOSError):
         if message is None:
             message = f"Command not found: {command}"
         super().__init__(message)
+
+
+class ExpansionError(PyOSError):
+    """Raised when a command line cannot be expanded."""
+
+    def __init__(self, word: str, message: Optional[str] = None):
+        self.word = word
+        if message is None:
+            message = f"Expansion too large: {word}"
+        super().__init__(message)
@@ -2,7 +2,9 @@
 Common file operation utilities for pyOS programs.
 """
 
-from typing import Any, List, Callable, Optional
+from typing import Any, List, Callable, Optional, Tuple
+
+from kernel.exceptions import BrokenPipeError
 
 
 def process_files_with_callback(
@@ -24,29 +26,80 @@ def process_files_with_callback(
     """
     for path in paths:
         abs_path = shell.sabs_path(path)
-        if shell.syscall.is_dir(abs_path):
-            if recursive:
-                if dir_callback:
-                    dir_callback(abs_path)
-                # Process all items in the directory recursively
-                items = shell.syscall.list_dir(abs_path)
-                sub_paths = [
-                    shell.syscall.join_path(abs_path, item) for item in items
-                ]
-                process_files_with_callback(
-                    shell, sub_paths, file_callback, dir_callback, recursive
-                )
-            elif dir_callback:
+        _process_path(
+            shell,
+            path,
+            abs_path,
+            shell.syscall.is_dir(abs_path),
+            file_callback,
+            dir_callback,
+            recursive,
+        )
+
+
+def _process_path(
+    shell: Any,
+    path: str,
+    abs_path: str,
+    is_dir: bool,
+    file_callback: Callable[[str], None],
+    dir_callback: Optional[Callable[[str], None]],
+    recursive: bool,
+) -> None:
+    if is_dir:
+        if recursive:
+            if dir_callback:
                 dir_callback(abs_path)
-            else:
-                shell.stderr.write(f"{path} is a directory")
+            # Process all items in the directory recursively, the listing
+            # already tells which entries are directories
+            for entry in shell.syscall.scan_dir(abs_path):
+                _process_path(
+                    shell,
+                    entry.path,
+                    entry.path,
+                    entry.is_dir,
+                    file_callback,
+                    dir_callback,
+                    recursive,
+                )
+        elif dir_callback:
+            dir_callback(abs_path)
+        else:
+            shell.stderr.write(f"{path} is a directory")
+    else:
+        try:
+            file_callback(abs_path)
+        except IOError:
+            shell.stderr.write(f"{path} does not exist")
+        except BrokenPipeError:
+            raise
+        except Exception as e:
+            shell.stderr.write(f"Error processing {path}: {str(e)}")
+
+
+def collect_tree(shell: Any, path: str) -> List[Tuple[str, bool]]:
+    """
+    List a directory tree, parents before their contents.
+
+    Args:
+        shell: The shell object
+        path: Absolute path of the directory to walk
+
+    Returns:
+        List of (path, is_dir) pairs, starting with path itself
+    """
+    tree = [(path, True)]
+    try:
+        entries = shell.syscall.scan_dir(path)
+    except OSError:
+        shell.stderr.write(f"{path} does not exist")
+        return tree
+    for entry in entries:
+        if entry.is_dir:
+            tree.extend(collect_tree(shell, entry.path))
         else:
-            try:
-                file_callback(abs_path)
-            except IOError:
-                shell.stderr.write(f"{path} does not exist")
-            except Exception as e:
-                shell.stderr.write(f"Error processing {path}: {str(e)}")
+            tree.append((entry.path, False))
+    return tree
 
 
 def read_file_lines(shell: Any, path: str) -> List[str]:
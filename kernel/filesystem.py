@@ -2,11 +2,14 @@ import os
 import shutil
 import glob
 import importlib.util
+import stat
 from typing import List, Tuple, Any
 from contextlib import contextmanager
 
-from kernel.constants import BASEPATH
+from kernel.cache import MISSING, LRUCache
+from kernel.constants import BASEPATH, PROGRAMCACHESIZE
 from kernel.exceptions import FileNotFoundError, DirectoryNotEmptyError
+from kernel.models import DirEntry
 
 
 def abs_path(path: str) -> str:
@@ -105,26 +108,56 @@ def get_size(path: str) -> int:
     return os.path.getsize(abs_path(path))
 
 
-def list_dir(path: str) -> List[str]:
-    return sorted(
-        x
-        for x in os.listdir(abs_path(path))
-        if ".git" not in x and not x.endswith(".pyc")
+def is_listed(name: str) -> bool:
+    # hides development files from the virtual filesystem, including the
+    # bytecode the program loader leaves in __pycache__
+    return (
+        ".git" not in name
+        and not name.endswith(".pyc")
+        and name != "__pycache__"
     )
 
 
+def list_dir(path: str) -> List[str]:
+    return sorted(x for x in os.listdir(abs_path(path)) if is_listed(x))
+
+
+def scan_dir(path: str) -> List[DirEntry]:
+    # one os.scandir pass, entries carry their type, size and mtime
+    entries = []
+    with os.scandir(abs_path(path)) as listing:
+        for entry in listing:
+            if not is_listed(entry.name):
+                continue
+            try:
+                st = entry.stat()
+                size, mtime = st.st_size, st.st_mtime
+            except OSError:
+                size, mtime = 0, 0.0
+            entries.append(
+                DirEntry(
+                    name=entry.name,
+                    path=join_path(path, entry.name),
+                    is_dir=entry.is_dir(),
+                    is_file=entry.is_file(),
+                    size=size,
+                    mtime=mtime,
+                )
+            )
+    return sorted(entries, key=lambda x: x.name)
+
+
 def list_glob(expression: str) -> List[str]:
     return [iabs_path(x) for x in glob.glob(abs_path(expression))]
 
 
 def list_all(path: str = "/") -> List[str]:
     listing = [path]
-    for x in list_dir(path):
-        new = join_path(path, x)
-        if is_dir(new):
-            listing.extend(list_all(new))
+    for entry in scan_dir(path):
+        if entry.is_dir:
+            listing.extend(list_all(entry.path))
         else:
-            listing.append(new)
+            listing.append(entry.path)
     return listing
 
 
@@ -147,18 +180,34 @@ def open_file(path: str, mode: str) -> Any:
     return open(abs_path(path), mode)
 
 
+# loaded programs keyed by external path, with the (mtime, size) they
+# were loaded from
+program_cache = LRUCache(PROGRAMCACHESIZE)
+
+
 def open_program(path: str) -> Any:
     x = abs_path(path)
-    if not is_dir(path):
-        try:
-            spec = importlib.util.spec_from_file_location("program", x)
-            if spec and spec.loader:
-                program = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(program)
-            else:
-                program = False
-        except (IOError, FileNotFoundError):
+    try:
+        info = os.stat(x)
+    except OSError:
+        program_cache.discard(x)
+        return False
+    if not stat.S_ISREG(info.st_mode):
+        return False
+
+    version = (info.st_mtime_ns, info.st_size)
+    cached = program_cache.get(x)
+    if cached is not MISSING and cached[0] == version:
+        return cached[1]
+    try:
+        # the source loader keeps compiled bytecode in __pycache__
+        spec = importlib.util.spec_from_file_location("program", x)
+        if spec and spec.loader:
+            program = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(program)
+        else:
             program = False
-    else:
+    except (IOError, FileNotFoundError):
         program = False
+    program_cache.put(x, (version, program))
     return program
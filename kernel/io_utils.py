@@ -2,7 +2,55 @@
 Standard I/O utilities for pyOS programs.
 """
 
-from typing import Any, List, Callable
+from typing import Any, Callable, Iterator, List
+
+from kernel.constants import PIPECHUNKSIZE
+from kernel.exceptions import BrokenPipeError
+from kernel.stream import Stream
+
+
+def is_stream(stream: Any) -> bool:
+    """
+    Check whether a stream is a pyOS stream, a pipe or a redirected file.
+
+    Args:
+        stream: A shell's stdin or stdout
+
+    Returns:
+        True if write_bytes/read_chunks can be used on the stream
+    """
+    return isinstance(stream, Stream)
+
+
+def is_piped(stream: Any) -> bool:
+    """
+    Check whether output goes to another program or a file, not the terminal.
+
+    Args:
+        stream: A shell's stdout
+
+    Returns:
+        True if bytes written to the stream are passed on as they are
+    """
+    return is_stream(stream) and getattr(stream, "reader", True) is not None
+
+
+def read_file_chunks(f: Any, size: int = PIPECHUNKSIZE) -> Iterator[bytes]:
+    """
+    Read a file opened in binary mode in chunks.
+
+    Args:
+        f: The file object
+        size: Maximum number of bytes per chunk
+
+    Returns:
+        Iterator over the chunks of the file
+    """
+    while True:
+        chunk = f.read(size)
+        if not chunk:
+            return
+        yield chunk
 
 
 def read_stdin_lines(shell: Any) -> List[str]:
@@ -38,6 +86,8 @@ def process_stdin_lines(
         try:
             for line in shell.stdin.read():
                 processor_func(line)
+        except BrokenPipeError:
+            raise
         except Exception as e:
             shell.stderr.write(f"Error processing stdin: {str(e)}")
 
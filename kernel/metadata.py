@@ -1,9 +1,14 @@
+import dataclasses
 import datetime
+import itertools
 import sqlite3
-from typing import Union, List, Tuple, Optional, Any, Dict
+import threading
+from typing import Union, List, Tuple, Optional, Any, Dict, Iterable, Iterator
 from contextlib import contextmanager
 
-from kernel.constants import METADATAFILE
+from kernel.cache import LRUCache, MISSING
+from kernel.constants import METADATAFILE, METADATACACHESIZE
+from kernel.database import ConnectionPool
 from kernel.utils import calc_permission_number, calc_permission_string
 from kernel.utils import convert_many
 from kernel.models import FileMetadata
@@ -26,9 +31,120 @@ sqlite3.register_converter("timestamp", convert_datetime)
 sqlite3.register_converter("TIMESTAMP", convert_datetime)
 
 
+# Schema migrations, applied in order and tracked with PRAGMA user_version
+_MIGRATIONS: List[List[str]] = [
+    # 1: path primary key, secondary indexes for owner and modified
+    [
+        """CREATE TABLE IF NOT EXISTS metadata (
+                path TEXT,
+                owner TEXT,
+                permission TEXT,
+                created TIMESTAMP,
+                accessed TIMESTAMP,
+                modified TIMESTAMP)""",
+        """CREATE TABLE metadata_new (
+                path TEXT PRIMARY KEY,
+                owner TEXT,
+                permission TEXT,
+                created TIMESTAMP,
+                accessed TIMESTAMP,
+                modified TIMESTAMP) WITHOUT ROWID""",
+        # the first row of a path is the one lookups used to return
+        """INSERT OR IGNORE INTO metadata_new
+                SELECT * FROM metadata WHERE path IS NOT NULL
+                ORDER BY rowid""",
+        "DROP TABLE metadata",
+        "ALTER TABLE metadata_new RENAME TO metadata",
+        "CREATE INDEX metadata_owner ON metadata (owner)",
+        "CREATE INDEX metadata_modified ON metadata (modified)",
+    ],
+    # 2: directory mtimes seen by the last startup reconciliation
+    [
+        """CREATE TABLE dirsnapshot (
+                path TEXT PRIMARY KEY,
+                mtime INTEGER) WITHOUT ROWID""",
+    ],
+]
+
+SCHEMA_VERSION = len(_MIGRATIONS)
+
+
+def migrate(con: sqlite3.Connection) -> int:
+    """Bring the metadata schema up to SCHEMA_VERSION.
+
+    Returns the version the database was at before migrating.
+    """
+    cur = con.cursor()
+    version = cur.execute("PRAGMA user_version").fetchone()[0]
+    if version < SCHEMA_VERSION:
+        if not con.in_transaction:
+            cur.execute("BEGIN")
+        for statements in _MIGRATIONS[version:]:
+            for statement in statements:
+                cur.execute(statement)
+        cur.execute("PRAGMA user_version = %d" % (SCHEMA_VERSION,))
+    return int(version)
+
+
+def _prefix_range(prefix: str) -> Tuple[str, str]:
+    """Return the (lower, upper) bounds of all strings starting with prefix."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
 # For testing with in-memory databases, we need to maintain a single connection
 _test_metadata_connection = None
 
+# Long-lived connections for the on-disk database, reused across Shell threads
+_pool = ConnectionPool(lambda: METADATAFILE)
+
+# Recently used rows by path (None for paths known to be missing), kept
+# coherent by every write in this module
+cache = LRUCache(METADATACACHESIZE)
+
+# Bumped whenever owners, permissions or existing paths change, so anything
+# derived from them (such as permission decisions) can tell it is stale
+_generations = itertools.count(1)
+generation = 0
+
+
+def _bump_generation() -> None:
+    global generation
+    generation = next(_generations)
+
+
+# Counts writes, the ends of batches and failed queries. A row read from
+# the database is only cached if none of those happened while it was being
+# read, and no batch is open: its writes are not visible to other
+# connections yet. A failed query returns None, which is not a missing row.
+_writes = 0
+_batches = 0
+_fill_lock = threading.Lock()
+
+
+def _written() -> None:
+    global _writes
+    with _fill_lock:
+        _writes += 1
+
+
+def _clear_cache() -> None:
+    _written()
+    cache.clear()
+
+
+def _fill(
+    seen: int, rows: Iterable[Tuple[str, Optional[FileMetadata]]]
+) -> None:
+    """Cache rows read by a query that started when _writes was seen."""
+    with _fill_lock:
+        if seen == _writes and not _batches:
+            for path, row in rows:
+                cache.put(path, row)
+
+
+# Per-thread transaction state, see batch()
+_local = threading.local()
+
 
 def _get_test_connection() -> sqlite3.Connection:
     """Get or create a test connection for in-memory databases."""
@@ -38,16 +154,10 @@ def _get_test_connection() -> sqlite3.Connection:
             METADATAFILE, detect_types=sqlite3.PARSE_DECLTYPES
         )
         # Create the metadata table
-        cur = _test_metadata_connection.cursor()
-        cur.execute(
-            """CREATE TABLE IF NOT EXISTS metadata (
-                            path TEXT,
-                            owner TEXT,
-                            permission TEXT,
-                            created TIMESTAMP,
-                            accessed TIMESTAMP,
-                            modified TIMESTAMP)"""
-        )
+        migrate(_test_metadata_connection)
+        _test_metadata_connection.commit()
+        _clear_cache()
+        _bump_generation()
     return _test_metadata_connection
 
 
@@ -59,25 +169,92 @@ def get_db_connection() -> Any:
 
     if is_memory_db:
         con = _get_test_connection()
+        # Only the outermost block on this thread ends the transaction
+        depth = getattr(_local, "depth", 0)
+        _local.depth = depth + 1
         try:
             yield con
-            con.commit()
+            if not depth:
+                con.commit()
         except Exception:
-            con.rollback()
+            if not depth:
+                con.rollback()
             raise
+        finally:
+            _local.depth = depth
         # Don't close the connection for in-memory databases during testing
     else:
-        con = sqlite3.connect(
-            METADATAFILE, detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        try:
+        with _pool.connection() as con:
             yield con
-            con.commit()
-        except Exception:
-            con.rollback()
-            raise
-        finally:
-            con.close()
+
+
+def _pending() -> Optional[List[Tuple[str, List[Tuple[Any, ...]]]]]:
+    return getattr(_local, "pending", None)
+
+
+def _flush(con: sqlite3.Connection) -> None:
+    """Send the writes queued by the current batch to the database."""
+    pending = _pending()
+    if pending:
+        cur = con.cursor()
+        while pending:
+            query, params_list = pending.pop(0)
+            cur.executemany(query, params_list)
+
+
+def _write(query: str, params_list: List[Tuple[Any, ...]]) -> None:
+    """Execute a write, or queue it while a batch is open."""
+    pending = _pending()
+    if pending is None:
+        with get_db_connection() as con:
+            con.cursor().executemany(query, params_list)
+        # before the caller updates the cache, see _fill
+        _written()
+    elif pending and pending[-1][0] == query:
+        pending[-1][1].extend(params_list)
+    else:
+        pending.append((query, list(params_list)))
+
+
+@contextmanager
+def batch() -> Iterator[None]:
+    """Group all metadata writes made in the block into one transaction.
+
+    Writes are queued and sent with executemany, in order, before the next
+    query that needs the database and when the block ends. Nested batches
+    join the outer one. If the block raises, everything is rolled back.
+    """
+    global _batches, _writes
+    if _pending() is not None:
+        yield
+        return
+    with _fill_lock:
+        _batches += 1
+    try:
+        with get_db_connection() as con:
+            _local.pending = []
+            try:
+                yield
+                _flush(con)
+            finally:
+                _local.pending = None
+    except Exception:
+        # cached rows may describe writes that were rolled back
+        _clear_cache()
+        _bump_generation()
+        raise
+    finally:
+        # committed or rolled back, reads that overlapped it are stale
+        with _fill_lock:
+            _batches -= 1
+            _writes += 1
+
+
+def close_connections() -> None:
+    """Close all pooled database connections."""
+    _pool.close()
+    _clear_cache()
+    _bump_generation()
 
 
 def execute_query(
@@ -86,6 +263,7 @@ def execute_query(
     """Execute a database query with error handling."""
     try:
         with get_db_connection() as con:
+            _flush(con)
             cur = con.cursor()
             cur.execute(query, params)
             if fetch == "one":
@@ -110,6 +288,7 @@ def execute_query(
             # Type cast to satisfy mypy
             return result  # type: ignore
     except Exception:
+        _written()
         return None
 
 
@@ -117,8 +296,10 @@ def execute_many(query: str, params_list: List[Tuple[Any, ...]]) -> bool:
     """Execute a database query with multiple parameter sets."""
     try:
         with get_db_connection() as con:
+            _flush(con)
             cur = con.cursor()
             cur.executemany(query, params_list)
+        _written()
         return True
     except Exception:
         return False
@@ -129,49 +310,160 @@ def build_meta_data_database(fsmatches: List[str]) -> None:
 
     delsql = "DELETE FROM metadata WHERE path = ?"
     addsql = "INSERT INTO metadata VALUES (?, ?, ?, ?, ?, ?)"
-    tablesql = """CREATE TABLE IF NOT EXISTS metadata (
-                    path TEXT,
-                    owner TEXT,
-                    permission TEXT,
-                    created TIMESTAMP,
-                    accessed TIMESTAMP,
-                    modified TIMESTAMP)"""
 
-    try:
-        with get_db_connection() as con:
-            cur = con.cursor()
-            cur.execute("SELECT path FROM metadata")
-            fsmatches_set = set(fsmatches)
-            dbmatches = set(x[0] for x in cur.fetchall())
-
-            for x in fsmatches_set.difference(dbmatches):
-                cur.execute(addsql, ((x, "root", "rwxrwxrwx", now, now, now)))
-            for x in dbmatches.difference(fsmatches_set):
-                cur.execute(delsql, (x,))
-    except Exception:
-        with get_db_connection() as con2:
-            try:
-                items = (
-                    (x, "root", "rwxrwxrwx", now, now, now) for x in fsmatches
-                )
-                cur = con2.cursor()
-                cur.execute(tablesql)
-                cur.executemany(addsql, items)
-            except Exception:
-                pass
+    with get_db_connection() as con:
+        migrate(con)
+        cur = con.cursor()
+        cur.execute("SELECT path FROM metadata")
+        fsmatches_set = set(fsmatches)
+        dbmatches = set(x[0] for x in cur.fetchall())
+
+        cur.executemany(
+            addsql,
+            (
+                (x, "root", "rwxrwxrwx", now, now, now)
+                for x in fsmatches_set.difference(dbmatches)
+            ),
+        )
+        cur.executemany(
+            delsql, ((x,) for x in dbmatches.difference(fsmatches_set))
+        )
+    _clear_cache()
+    _bump_generation()
+
+
+def migrate_database() -> int:
+    """Bring the on-disk schema up to date, see migrate()."""
+    with get_db_connection() as con:
+        return migrate(con)
+
+
+def get_dir_snapshot() -> Dict[str, int]:
+    """Return the directory mtimes (in ns) recorded by sync_meta_data."""
+    data = execute_query("SELECT path, mtime FROM dirsnapshot", (), "all")
+    return {path: mtime for (path, mtime) in data or []}
+
+
+def get_children(path: str) -> List[str]:
+    """Return the paths in the metadata directly inside path."""
+    prefix = path.rstrip("/") + "/"
+    data = execute_query(
+        """SELECT path FROM metadata
+            WHERE path >= ? AND path < ? AND path != ?
+            AND instr(substr(path, ?), '/') = 0""",
+        _prefix_range(prefix) + (path, len(prefix) + 1),
+        "all",
+    )
+    return [x[0] for x in data or []]
+
+
+def sync_meta_data(
+    added: List[str],
+    removed: List[str],
+    dirs: Dict[str, int],
+    removed_dirs: List[str],
+) -> None:
+    """Apply the differences found by a startup reconciliation at once.
+
+    Args:
+        added: New paths, owned by root with full permissions
+        removed: Paths that no longer exist, together with everything
+                 below them
+        dirs: Rescanned directories and their current mtime (in ns)
+        removed_dirs: Directories to drop from the snapshot, together
+                      with everything below them
+    """
+    now = datetime.datetime.now()
+    with batch():
+        _write(
+            "INSERT OR IGNORE INTO metadata VALUES (?, ?, ?, ?, ?, ?)",
+            [(x, "root", "rwxrwxrwx", now, now, now) for x in added],
+        )
+        _write(
+            "DELETE FROM metadata WHERE path = ? OR (path >= ? AND path < ?)",
+            [(x,) + _prefix_range(x.rstrip("/") + "/") for x in removed],
+        )
+        _write(
+            "DELETE FROM dirsnapshot WHERE path = ?",
+            [(x,) for x in removed_dirs],
+        )
+        # a directory replaced by a file keeps its row, not its subtree
+        _write(
+            "DELETE FROM metadata WHERE path >= ? AND path < ?",
+            [_prefix_range(x.rstrip("/") + "/") for x in removed_dirs],
+        )
+        _write(
+            "INSERT OR REPLACE INTO dirsnapshot VALUES (?, ?)",
+            list(dirs.items()),
+        )
+    if added or removed or removed_dirs:
+        _clear_cache()
+        _bump_generation()
 
 
 def get_meta_data(path: str) -> Optional[FileMetadata]:
+    cached = cache.get(path)
+    if cached is not MISSING:
+        return cached  # type: ignore
+    seen = _writes
     data = execute_query(
         "SELECT * FROM metadata WHERE path = ?", (path,), "one"
     )
-    return FileMetadata.from_tuple(data) if data else None  # type: ignore
+    result = FileMetadata.from_tuple(data) if data else None  # type: ignore
+    _fill(seen, [(path, result)])
+    return result
+
+
+def get_many_meta_data(paths: List[str]) -> List[Optional[FileMetadata]]:
+    """Look up several paths, such as a path and its ancestors, at once.
+
+    Rows that are not cached are fetched with a single query. The result
+    is in the same order as paths, with None for missing paths.
+    """
+    found: Dict[str, Optional[FileMetadata]] = {}
+    missing = []
+    for path in paths:
+        cached = cache.get(path)
+        if cached is MISSING:
+            missing.append(path)
+        else:
+            found[path] = cached
+
+    if missing:
+        unique = tuple(dict.fromkeys(missing))
+        seen = _writes
+        data = execute_query(
+            "SELECT * FROM metadata WHERE path IN (%s)"
+            % ", ".join("?" * len(unique)),
+            unique,
+            "all",
+        )
+        for item in data or []:
+            row = FileMetadata.from_tuple(item)
+            if row is not None:
+                found[row.path] = row
+        _fill(seen, [(path, found.get(path)) for path in unique])
+    return [found.get(path) for path in paths]
+
+
+def _cache_update(path: str, **changes: Any) -> None:
+    """Apply column changes to the cached row for path, if any."""
+    cached = cache.get(path)
+    if cached is None or cached is MISSING:
+        cache.discard(path)
+    else:
+        cache.put(path, dataclasses.replace(cached, **changes))
 
 
 def get_all_meta_data(path: str = "/") -> Optional[List[FileMetadata]]:
-    data = execute_query(
-        "SELECT * FROM metadata WHERE path LIKE ?", (path + "%",), "all"
-    )
+    if path:
+        data = execute_query(
+            "SELECT * FROM metadata WHERE path >= ? AND path < ?",
+            _prefix_range(path),
+            "all",
+        )
+    else:
+        data = execute_query("SELECT * FROM metadata", (), "all")
     return [FileMetadata.from_tuple(item) for item in data] if data else None  # type: ignore
 
 
@@ -183,9 +475,19 @@ def add_path(path: str, owner: str, permission: str) -> None:
 
     data = convert_many(path, owner, permission, now, now, now)
 
-    addsql = "INSERT INTO metadata VALUES (?, ?, ?, ?, ?, ?)"
+    # paths that already have metadata keep it
+    addsql = "INSERT OR IGNORE INTO metadata VALUES (?, ?, ?, ?, ?, ?)"
 
-    execute_many(addsql, data)
+    existing = get_many_meta_data([row[0] for row in data])
+    try:
+        _write(addsql, data)
+    except Exception:
+        for row in data:
+            cache.discard(row[0])
+    else:
+        for row, old in zip(data, existing):
+            if old is None:
+                cache.put(row[0], FileMetadata.from_tuple(row))
 
 
 def copy_path(src: str, dst: str) -> None:
@@ -195,25 +497,21 @@ def copy_path(src: str, dst: str) -> None:
     dst_converted = convert_many(dst)
     assert len(src_converted) == len(dst_converted)
 
-    selsql = "SELECT owner,permission FROM metadata WHERE path = ?"
-    addsql = "INSERT INTO metadata VALUES (?, ?, ?, ?, ?, ?)"
+    addsql = "INSERT OR IGNORE INTO metadata VALUES (?, ?, ?, ?, ?, ?)"
 
-    with get_db_connection() as con:
-        cur = con.cursor()
-        temp = []
-        for x in src_converted:
-            cur.execute(selsql, x)
-            temp.append(cur.fetchone())
-
-        # fix for ignored files
-        zipped = (
-            (x, y) for (x, y) in zip(dst_converted, temp) if y is not None
-        )
-        data = [
-            (path, owner, perm, now, now, now)
-            for ((path,), (owner, perm)) in zipped
-        ]
-        cur.executemany(addsql, data)
+    temp = get_many_meta_data([x for (x,) in src_converted])
+
+    # fix for ignored files
+    zipped = ((x, y) for (x, y) in zip(dst_converted, temp) if y is not None)
+    data = [
+        (path, row.owner, row.permission, now, now, now)
+        for ((path,), row) in zipped
+    ]
+    existing = get_many_meta_data([row[0] for row in data])
+    _write(addsql, data)
+    for row, old in zip(data, existing):
+        if old is None:
+            cache.put(row[0], FileMetadata.from_tuple(row))
 
 
 def move_path(src: str, dst: str) -> None:
@@ -225,18 +523,31 @@ def move_path(src: str, dst: str) -> None:
 
     data = [(x, now, y) for ((x,), (y,)) in zip(dst_converted, src_converted)]
 
-    with get_db_connection() as con:
-        cur = con.cursor()
-        cur.executemany(
-            "UPDATE metadata SET path = ?, modified = ? WHERE path = ?", data
+    try:
+        _write(
+            "UPDATE OR REPLACE metadata SET path = ?, modified = ? WHERE path = ?",
+            data,
         )
+    finally:
+        for x, _, y in data:
+            cache.discard(x)
+            cache.discard(y)
+        _bump_generation()
 
 
 def delete_path(path: str) -> None:
     path_converted = convert_many(path)
     delsql = "DELETE FROM metadata WHERE path = ?"
 
-    execute_many(delsql, path_converted)
+    try:
+        _write(delsql, path_converted)
+    except Exception:
+        for (x,) in path_converted:
+            cache.discard(x)
+    else:
+        for (x,) in path_converted:
+            cache.put(x, None)
+    _bump_generation()
 
 
 def validate_permission(value: str) -> None:
@@ -264,12 +575,12 @@ def set_permission_string(path: str, value: str) -> None:
     validate_permission(value)
     now = datetime.datetime.now()
 
-    with get_db_connection() as con:
-        cur = con.cursor()
-        cur.execute(
-            "UPDATE metadata SET permission = ?, modified = ? WHERE path = ?",
-            (value, now, path),
-        )
+    _write(
+        "UPDATE metadata SET permission = ?, modified = ? WHERE path = ?",
+        [(value, now, path)],
+    )
+    _cache_update(path, permission=value, modified=now)
+    _bump_generation()
 
 
 def set_permission_number(path: str, value: str) -> None:
@@ -306,11 +617,14 @@ def set_time_list(path: str, value: Union[Tuple[Any, ...], List[Any]]) -> None:
 
     a = [x + " = ?" for (x, y) in zip(columns, value) if y is not None]
     b = tuple(x for x in value if x is not None)
+    if not a:
+        return
     upsql = "UPDATE metadata SET %s WHERE path = ?" % ", ".join(a)
 
-    with get_db_connection() as con:
-        cur = con.cursor()
-        cur.execute(upsql, b + (path,))
+    _write(upsql, [b + (path,)])
+    _cache_update(
+        path, **{x: y for (x, y) in zip(columns, value) if y is not None}
+    )
 
 
 def set_time_dict(path: str, value: Optional[Dict[str, Any]] = None) -> None:
@@ -399,9 +713,9 @@ def set_owner(path: str, owner: str) -> None:
 
     value = validate_owner(owner)
 
-    with get_db_connection() as con:
-        cur = con.cursor()
-        cur.execute(
-            "UPDATE metadata SET owner = ?, modified = ? WHERE path = ?",
-            (value, now, path),
-        )
+    _write(
+        "UPDATE metadata SET owner = ?, modified = ? WHERE path = ?",
+        [(value, now, path)],
+    )
+    _cache_update(path, owner=value, modified=now)
+    _bump_generation()
@@ -57,3 +57,15 @@ class UserData:
             shell=data[4],
             password=data[5],
         )
+
+
+@dataclass
+class DirEntry:
+    """Data class for a directory listing entry."""
+
+    name: str
+    path: str
+    is_dir: bool
+    is_file: bool
+    size: int
+    mtime: float
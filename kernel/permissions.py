@@ -3,8 +3,18 @@ Elegant permission checking decorators for pyOS.
 """
 
 from functools import wraps
-from typing import Callable, Any, Union
+from typing import Callable, Any, Dict, List, Optional, Tuple, Union
+from kernel.cache import LRUCache, MISSING
+from kernel.constants import PERMISSIONCACHESIZE
 from kernel.logging import logger
+from kernel.models import FileMetadata
+from kernel.utils import calc_permission_number
+
+ACCESS_BITS: Dict[str, int] = {"r": 4, "w": 2, "x": 1}
+
+# has_permission results by (user, path, access), stored together with the
+# metadata generation they were computed under
+decisions = LRUCache(PERMISSIONCACHESIZE)
 
 
 class PermissionChecker:
@@ -18,7 +28,8 @@ class PermissionChecker:
                          Use 'r' for read, 'w' for write, 'x' for execute.
                          Use digits to reference other arguments (e.g., '1' means use permission from args[1]).
         """
-        self.permissions = permissions
+        # "rw" is shorthand for ("r", "w")
+        self.permissions = tuple("".join(permissions))
 
     def __call__(self, func: Callable[..., Any]) -> Callable[..., Any]:
         """Decorator implementation."""
@@ -105,32 +116,7 @@ class PermissionChecker:
         Returns:
             True if the user has permission, False otherwise
         """
-        dirpaths = [path]
-        temppath = path
-        while temppath != "/":
-            temppath = system.filesystem.dir_name(temppath)
-            dirpaths.append(temppath)
-        if not all(
-            self._compare_permission(x, user, 5, system) for x in dirpaths[1:]
-        ):
-            # does not have read permissions all the way to path
-            return False
-
-        if system.filesystem.is_dir(dirpaths[0]):
-            if not self._compare_permission(dirpaths[0], user, access, system):
-                # does not have access permissions on folder
-                return False
-        else:
-            if not self._compare_permission(dirpaths[1], user, access, system):
-                # does not have access permissions for containing folder
-                return False
-            try:
-                self._compare_permission(dirpaths[0], user, access, system)
-            except TypeError:
-                if access != "w":
-                    # you can not read a file that does not exist
-                    return False
-        return True
+        return has_permission(path, user, access, system)
 
     def _compare_permission(
         self, path: str, user: str, access: Union[int, str], system: Any
@@ -146,18 +132,101 @@ class PermissionChecker:
         Returns:
             True if the user has the specified permission, False otherwise
         """
-        metadata = system.metadata.get_meta_data(path)
-        if not metadata:
-            return False
-
-        owner = metadata.owner
-        permissions = system.metadata.get_permission_number(path)
-        if isinstance(access, int):
-            compare = [access * (user == owner), 0, access]
-        else:
-            d = {"r": 4, "w": 2, "x": 1}
-            compare = [d[access] * (owner == user), 0, d[access]]
-        return any(int(x) & y for (x, y) in zip(permissions, compare))
+        return row_allows(system.metadata.get_meta_data(path), user, access)
+
+
+def ancestor_paths(path: str, system: Any) -> List[str]:
+    """Return path followed by each of its parent directories up to /."""
+    dirpaths = [path]
+    temppath = path
+    while temppath != "/":
+        parent = system.filesystem.dir_name(temppath)
+        if parent == temppath:
+            break
+        temppath = parent
+        dirpaths.append(temppath)
+    return dirpaths
+
+
+def row_allows(
+    metadata: Optional[FileMetadata], user: str, access: Union[int, str]
+) -> bool:
+    """Check a metadata row for the given access.
+
+    Args:
+        metadata: The row to check, None if the path has no metadata
+        user: The user to check permissions for
+        access: The access bits (int) or type ('r', 'w', 'x')
+
+    Returns:
+        True if the user has the specified permission, False otherwise
+    """
+    if not metadata:
+        return False
+
+    if isinstance(access, int):
+        bits = access
+    else:
+        bits = ACCESS_BITS[access]
+    compare = [bits * (user == metadata.owner), 0, bits]
+    permissions = calc_permission_number(metadata.permission)
+    return any(int(x) & y for (x, y) in zip(permissions, compare))
+
+
+def has_permission(
+    path: str, user: str, access: Union[int, str], system: Any
+) -> bool:
+    """Check if a user has permission for a path.
+
+    Decisions are memoized per (user, path, access) until the metadata
+    generation changes. Otherwise the metadata for the path and all of its
+    ancestors is fetched at once and the chain is evaluated in one pass.
+
+    Args:
+        path: The path to check
+        user: The user to check permissions for
+        access: The access type ('r', 'w', 'x')
+        system: The system instance
+
+    Returns:
+        True if the user has permission, False otherwise
+    """
+    generation = getattr(system.metadata, "generation", None)
+    if not isinstance(generation, int):
+        return _resolve_permission(path, user, access, system)[0]
+
+    key = (user, path, access)
+    cached = decisions.get(key)
+    if cached is not MISSING and cached[0] == generation:
+        return bool(cached[1])
+
+    allowed, complete = _resolve_permission(path, user, access, system)
+    if complete:
+        # only cache when every row existed, adding a path can not change it
+        decisions.put(key, (generation, allowed))
+    return allowed
+
+
+def _resolve_permission(
+    path: str, user: str, access: Union[int, str], system: Any
+) -> Tuple[bool, bool]:
+    """Evaluate the ancestor chain for path.
+
+    Returns:
+        (allowed, complete) where complete is False if any row was missing
+    """
+    dirpaths = ancestor_paths(path, system)
+    rows = system.metadata.get_many_meta_data(dirpaths)
+    complete = all(rows)
+    if not all(row_allows(row, user, 5) for row in rows[1:]):
+        # does not have read permissions all the way to path
+        return False, complete
+
+    if len(rows) == 1 or system.filesystem.is_dir(dirpaths[0]):
+        # does not have access permissions on folder
+        return row_allows(rows[0], user, access), complete
+    # does not have access permissions for containing folder
+    return row_allows(rows[1], user, access), complete
 
 
 # Convenience decorators
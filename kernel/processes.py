@@ -0,0 +1,343 @@
+"""
+Worker processes that run cpu_bound programs outside of the GIL.
+
+A program module opts in with ``cpu_bound = True``. It then runs on a
+stand-in shell in a worker process, whose system calls, stdin and
+stdout/stderr are forwarded over a multiprocessing connection to the
+shell in the kernel, which serves them until the program is done.
+"""
+
+import multiprocessing
+import os
+import threading
+import traceback
+from itertools import islice
+from multiprocessing.connection import Connection
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+import kernel.filesystem
+import kernel.stream
+import kernel.system
+from kernel.constants import BASEPATH, PROCESSBATCHSIZE
+from kernel.logging import logger
+
+# SysCall methods that only compute paths, done in the worker itself
+LOCALCALLS = frozenset(
+    [
+        "abs_path",
+        "rel_path",
+        "irel_path",
+        "iabs_path",
+        "dir_name",
+        "base_name",
+        "split",
+        "join_path",
+    ]
+)
+
+
+class ProcessPool:
+    """Runs programs in worker processes that are reused between runs.
+
+    Like the WorkerPool, a new process is started when none is idle and
+    up to size idle ones are kept, so pipeline stages never wait on each
+    other for a worker.
+    """
+
+    def __init__(self, size: int) -> None:
+        """Initialize the pool, no process is started until a program runs.
+
+        Args:
+            size: Most idle processes kept, 0 disables the pool
+        """
+        self.size = size
+        self.started = 0  # processes created
+        self.completed = 0  # programs run
+        self._idle: List["_Worker"] = []
+        self._busy = 0
+        self._lock = threading.Lock()
+
+    def accepts(self, program: Any) -> bool:
+        """Return whether program should run in a worker process."""
+        return self.size > 0 and getattr(program, "cpu_bound", False) is True
+
+    def run(self, shell: Any, program: Any, args: List[str]) -> None:
+        """Run program for shell in a worker process, like program.run."""
+        with self._lock:
+            if self._idle:
+                worker = self._idle.pop()
+            else:
+                worker = _Worker()
+                self.started += 1
+            self._busy += 1
+        try:
+            worker.run(shell, program.__file__, args)
+        except BaseException:
+            # the program may still be writing, it can not be reused
+            worker.alive = False
+            raise
+        finally:
+            with self._lock:
+                self._busy -= 1
+                self.completed += 1
+                reuse = worker.alive and len(self._idle) < self.size
+                if reuse:
+                    self._idle.append(worker)
+            if not reuse:
+                worker.stop()
+
+    def close(self) -> None:
+        """Stop the idle processes, busy ones stop when done."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the process counts and program counters."""
+        with self._lock:
+            return {
+                "workers": len(self._idle) + self._busy,
+                "idle": len(self._idle),
+                "started": self.started,
+                "completed": self.completed,
+            }
+
+
+class _Worker:
+    """A worker process and the kernel's end of its connection."""
+
+    def __init__(self) -> None:
+        # forking a process with running threads is not safe
+        context = multiprocessing.get_context("spawn")
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=serve, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        self.alive = True
+
+    def run(self, shell: Any, path: str, args: List[str]) -> None:
+        stdin = shell.stdin
+        self.conn.send(
+            (path, args, shell.path, shell.vars, shell.pid, bool(stdin))
+        )
+        lines: Optional[Iterator[str]] = None
+        chunks: Optional[Iterator[bytes]] = None
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                self.alive = False
+                shell.stderr.write("%s: worker process died" % (path,))
+                return
+            kind = message[0]
+            if kind == "out":
+                for item in message[1]:
+                    if isinstance(item, bytes):
+                        shell.stdout.write_bytes(item)
+                    else:
+                        shell.stdout.write(item)
+            elif kind == "err":
+                for item in message[1]:
+                    shell.stderr.write(item)
+            elif kind == "lines":
+                if lines is None:
+                    lines = iter(stdin.read())
+                self.conn.send(("ret", list(islice(lines, PROCESSBATCHSIZE))))
+            elif kind == "chunks":
+                if chunks is None:
+                    chunks = iter(stdin.read_chunks())
+                self.conn.send(("ret", list(islice(chunks, 1))))
+            elif kind == "close":
+                stdin.close_reader()
+            elif kind == "call":
+                self._call(shell, *message[1:])
+            elif kind == "error":
+                logger.error("%s failed in a worker process\n%s", *message[1:])
+                return
+            else:
+                return
+
+    def _call(
+        self, shell: Any, name: str, args: List[Any], kwargs: Dict[str, Any]
+    ) -> None:
+        try:
+            if name == "open_file":
+                # checked and recorded here, the worker opens the real file
+                shell.syscall.open_file(*args, **kwargs).close()
+                value: Any = shell.syscall.abs_path(args[0])
+            elif name == "open_program":
+                # modules do not pickle, the worker loads it itself
+                program = shell.syscall.open_program(*args, **kwargs)
+                value = program.__file__ if program else False
+            else:
+                value = getattr(shell.syscall, name)(*args, **kwargs)
+        except Exception as e:
+            try:
+                self.conn.send(("raise", e))
+            except Exception:
+                self.conn.send(("raise", OSError(str(e))))
+        else:
+            self.conn.send(("ret", value))
+
+    def stop(self) -> None:
+        if self.alive:
+            self.alive = False
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+        self.process.join(0.1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+#############################################
+# the worker process side
+
+
+class _Connection:
+    """The worker's end, output is batched until a request is made."""
+
+    def __init__(self, conn: Connection) -> None:
+        self.conn = conn
+        self.out: List[Union[str, bytes]] = []
+        self.err: List[str] = []
+
+    def flush(self) -> None:
+        if self.out:
+            self.conn.send(("out", self.out))
+            self.out = []
+        if self.err:
+            self.conn.send(("err", self.err))
+            self.err = []
+
+    def request(self, *message: Any) -> Any:
+        self.flush()
+        self.conn.send(message)
+        kind, value = self.conn.recv()
+        if kind == "raise":
+            raise value
+        return value
+
+
+class ProcessReader(kernel.stream.Stream):
+    """Stdin of a program in a worker, read from the kernel in batches."""
+
+    def __init__(self, conn: _Connection) -> None:
+        self._conn = conn
+        self._lines: Optional[Iterator[str]] = None
+        self._chunk = memoryview(b"")
+
+    def read(self) -> Iterator[str]:
+        while batch := self._conn.request("lines"):
+            yield from batch
+
+    def read_chunks(self) -> Iterator[bytes]:
+        while batch := self._conn.request("chunks"):
+            yield from batch
+
+    def readinto(self, buffer: Union[bytearray, memoryview]) -> int:
+        if not self._chunk:
+            chunk = next(self.read_chunks(), b"")
+            self._chunk = memoryview(chunk)
+        n = min(len(buffer), len(self._chunk))
+        buffer[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+    def readline(self) -> str:
+        if self._lines is None:
+            self._lines = self.read()
+        return next(self._lines, "")
+
+    def readlines(self) -> List[Union[str, None]]:
+        return list(self.read())
+
+    def close_reader(self) -> None:
+        self._conn.flush()
+        self._conn.conn.send(("close",))
+
+
+class ProcessWriter(kernel.stream.Stream):
+    """Stdout or stderr of a program in a worker, sent in batches."""
+
+    def __init__(self, conn: _Connection, name: str) -> None:
+        self.name = name
+        self._conn = conn
+
+    def write(self, value: Any) -> None:
+        batch = self._conn.out if self.name == "out" else self._conn.err
+        batch.append(str(value))
+        if len(batch) >= PROCESSBATCHSIZE:
+            self._conn.flush()
+
+    def write_bytes(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        self._conn.out.append(bytes(data))
+        self._conn.flush()
+
+    def close(self) -> None:
+        self._conn.flush()
+
+
+class SysCallProxy(object):
+    """Forwards the system calls of a program in a worker to the kernel."""
+
+    def __init__(self, conn: _Connection, local: Any) -> None:
+        self._conn = conn
+        self._local = local
+
+    def __getattr__(self, name: str) -> Any:
+        if name in LOCALCALLS:
+            return getattr(self._local, name)
+
+        def call(*args: Any, **kwargs: Any) -> Any:
+            return self._conn.request("call", name, args, kwargs)
+
+        return call
+
+    def open_file(self, path: str, mode: str) -> Any:
+        f = open(
+            self._conn.request("call", "open_file", (path, mode), {}), mode
+        )
+        # access and modification times are recorded through the kernel
+        return kernel.system.FileDecorator(f, path, metadata_service=self)
+
+    def open_program(self, path: str) -> Any:
+        found = self._conn.request("call", "open_program", (path,), {})
+        return found and load_program(found)
+
+
+def load_program(path: str) -> Any:
+    """Load the program module at the real path, through the program cache."""
+    return kernel.filesystem.open_program(os.path.relpath(path, BASEPATH))
+
+
+def serve(conn: Connection) -> None:
+    """Run the programs sent over conn until None or EOF is received."""
+    import kernel.shell
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        path, args, cwd, variables, pid, stdin = task
+        channel = _Connection(conn)
+        shell = kernel.shell.Shell(pid, args=args, path=cwd)
+        shell.vars = variables
+        shell.syscall = SysCallProxy(channel, shell.syscall)
+        shell.stdin = ProcessReader(channel) if stdin else None
+        shell.stdout = ProcessWriter(channel, "out")
+        shell.stderr = ProcessWriter(channel, "err")
+        try:
+            load_program(path).run(shell, args)
+        except Exception:
+            channel.flush()
+            conn.send(("error", path, traceback.format_exc()))
+        else:
+            channel.flush()
+            conn.send(("done",))
@@ -0,0 +1,97 @@
+"""
+The process table of a system, shells by PID.
+"""
+
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+NEW = "new"  # created, not started yet
+RUNNING = "running"
+
+
+@dataclass
+class ProcessInfo:
+    pid: int
+    item: Any  # the shell
+    ppid: Optional[int] = None
+    state: str = NEW
+    started: float = field(default_factory=time.time)
+    children: Set[int] = field(default_factory=set)
+
+
+class ProcessTable:
+    """Maps PIDs to shells, lookups in either direction are O(1).
+
+    PIDs only ever increase, a PID is never reused by a later process.
+    """
+
+    def __init__(self) -> None:
+        self._table: Dict[int, ProcessInfo] = {}
+        self._pids: Dict[int, int] = {}  # id(item) -> pid
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self._table))
+
+    def __contains__(self, pid: object) -> bool:
+        return pid in self._table
+
+    def __getitem__(self, pid: int) -> Any:
+        return self._table[pid].item
+
+    def allocate(self) -> int:
+        """Return a new PID, to be passed to add."""
+        with self._lock:
+            return next(self._counter)
+
+    def add(
+        self, item: Any, pid: Optional[int] = None, parent: Any = None
+    ) -> int:
+        """Record item as a child of parent, under pid or a new PID."""
+        with self._lock:
+            if pid is None:
+                pid = next(self._counter)
+            ppid = self._pids.get(id(parent)) if parent is not None else None
+            self._table[pid] = ProcessInfo(pid, item, ppid)
+            self._pids[id(item)] = pid
+            if ppid is not None:
+                self._table[ppid].children.add(pid)
+            return pid
+
+    def pid_of(self, item: Any) -> Optional[int]:
+        return self._pids.get(id(item))
+
+    def get(self, pid: int) -> Optional[ProcessInfo]:
+        return self._table.get(pid)
+
+    def set_state(self, item: Any, state: str) -> None:
+        with self._lock:
+            pid = self._pids.get(id(item))
+            if pid is not None:
+                self._table[pid].state = state
+
+    def remove(self, item: Any) -> bool:
+        """Drop the entry of item, returns False if it has none."""
+        with self._lock:
+            pid = self._pids.pop(id(item), None)
+            if pid is None:
+                return False
+            info = self._table.pop(pid)
+            parent = (
+                self._table.get(info.ppid) if info.ppid is not None else None
+            )
+            if parent is not None:
+                parent.children.discard(pid)
+            return True
+
+    def processes(self) -> List[ProcessInfo]:
+        """Return a snapshot of every entry, sorted by PID."""
+        with self._lock:
+            return sorted(self._table.values(), key=lambda x: x.pid)
@@ -3,7 +3,7 @@ Protocol-based interfaces for pyOS.
 """
 
 from typing import Protocol, List, Any, Optional, Union, Dict, Tuple
-from kernel.models import FileMetadata, UserData
+from kernel.models import DirEntry, FileMetadata, UserData
 
 
 class FilesystemProtocol(Protocol):
@@ -41,6 +41,8 @@ class FilesystemProtocol(Protocol):
 
     def list_dir(self, path: str) -> List[str]: ...
 
+    def scan_dir(self, path: str) -> List[DirEntry]: ...
+
     def list_glob(self, expression: str) -> List[str]: ...
 
     def list_all(self, path: str = "/") -> List[str]: ...
@@ -63,6 +65,10 @@ class MetadataProtocol(Protocol):
         self, path: str = "/"
     ) -> Optional[List[FileMetadata]]: ...
 
+    def get_many_meta_data(
+        self, paths: List[str]
+    ) -> List[Optional[FileMetadata]]: ...
+
     def add_path(self, path: str, owner: str, permission: str) -> None: ...
 
     def copy_path(self, src: str, dst: str) -> None: ...
@@ -107,6 +113,8 @@ class MetadataProtocol(Protocol):
 
     def set_owner(self, path: str, owner: str) -> None: ...
 
+    def batch(self) -> Any: ...
+
 
 class UserProtocol(Protocol):
     """Protocol for user operations."""
@@ -151,6 +159,22 @@ class UserProtocol(Protocol):
 
     def correct_password(self, user: str, password: str) -> bool: ...
 
+    def add_history(self, user: str, command: str) -> None: ...
+
+    def count_history(self, user: str) -> int: ...
+
+    def get_history(
+        self, user: str, after: int = 0, limit: int = -1
+    ) -> List[Tuple[int, str]]: ...
+
+    def get_history_command(self, user: str, number: int) -> str: ...
+
+    def get_recent_history(self, user: str, limit: int) -> List[str]: ...
+
+    def find_history(
+        self, user: str, value: str, start: bool = True
+    ) -> str: ...
+
 
 class SystemProtocol(Protocol):
     """Protocol for system operations."""
@@ -0,0 +1,116 @@
+"""
+An asyncio event loop for programs with an ``async def run(shell, args)``.
+
+Such programs do not get a thread of their own: they all share the loop
+of their system, and the blocking calls they make (SysCalls doing file
+or SQLite I/O) run in a small executor instead.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import threading
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Optional
+
+from kernel.logging import logger
+
+
+class Scheduler:
+    """Runs coroutines on an event loop in a thread of its own."""
+
+    def __init__(self, executor_size: int) -> None:
+        """Initialize the scheduler, the loop is started on first use.
+
+        Args:
+            executor_size: Most blocking calls running at once
+        """
+        self.executor_size = executor_size
+        self.submitted = 0
+        self.completed = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.executor_size, thread_name_prefix="blocking"
+                )
+                self._loop = asyncio.new_event_loop()
+                self._loop.set_default_executor(self._executor)
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="scheduler", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def submit(
+        self, coroutine: Coroutine[Any, Any, Any]
+    ) -> "concurrent.futures.Future[Any]":
+        """Schedule coroutine on the loop, from any other thread."""
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        with self._lock:
+            self.submitted += 1
+        future.add_done_callback(self._done)
+        return future
+
+    def run(self, coroutine: Coroutine[Any, Any, Any]) -> Any:
+        """Run coroutine on the loop and wait for its result."""
+        return self.submit(coroutine).result()
+
+    def blocking(self, func: Callable[..., Any], *args: Any) -> Awaitable[Any]:
+        """Run func(*args) in the executor, await it from the loop."""
+        return self.loop.run_in_executor(None, functools.partial(func, *args))
+
+    def close(self) -> None:
+        """Stop the loop and the executor, they restart when used again."""
+        with self._lock:
+            loop, self._loop = self._loop, None
+            thread, self._thread = self._thread, None
+            executor, self._executor = self._executor, None
+        if loop is not None and thread is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of coroutines submitted, running and done."""
+        with self._lock:
+            return {
+                "submitted": self.submitted,
+                "running": self.submitted - self.completed,
+                "completed": self.completed,
+            }
+
+    def _done(self, future: "concurrent.futures.Future[Any]") -> None:
+        with self._lock:
+            self.completed += 1
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(
+                "scheduled program failed", exc_info=future.exception()
+            )
+
+
+class AsyncSysCall(object):
+    """The SysCalls of a shell as coroutines, run in the scheduler's executor.
+
+    ``await shell.asyscall.is_file(path)`` is shell.syscall.is_file(path)
+    without blocking the loop.
+    """
+
+    def __init__(self, syscall: Any, scheduler: Scheduler) -> None:
+        self._syscall = syscall
+        self._scheduler = scheduler
+
+    def __getattr__(self, name: str) -> Callable[..., Awaitable[Any]]:
+        func = getattr(self._syscall, name)
+
+        def call(*args: Any) -> Awaitable[Any]:
+            return self._scheduler.blocking(func, *args)
+
+        return call
@@ -3,7 +3,7 @@ Service classes for pyOS operations.
 """
 
 from typing import Any, List, Optional, Union, Dict, Tuple
-from kernel.models import FileMetadata, UserData
+from kernel.models import DirEntry, FileMetadata, UserData
 from kernel.protocols import FilesystemProtocol, MetadataProtocol, UserProtocol
 
 
@@ -61,6 +61,9 @@ class FilesystemService:
     def list_dir(self, path: str) -> List[str]:
         return self.fs.list_dir(path)
 
+    def scan_dir(self, path: str) -> List[DirEntry]:
+        return self.fs.scan_dir(path)
+
     def list_glob(self, expression: str) -> List[str]:
         return self.fs.list_glob(expression)
 
@@ -94,6 +97,11 @@ class MetadataService:
     ) -> Optional[List[FileMetadata]]:
         return self.md.get_all_meta_data(path)
 
+    def get_many_meta_data(
+        self, paths: List[str]
+    ) -> List[Optional[FileMetadata]]:
+        return self.md.get_many_meta_data(paths)
+
     def add_path(self, path: str, owner: str, permission: str) -> None:
         self.md.add_path(path, owner, permission)
 
@@ -152,6 +160,9 @@ class MetadataService:
     def set_owner(self, path: str, owner: str) -> None:
         self.md.set_owner(path, owner)
 
+    def batch(self) -> Any:
+        return self.md.batch()
+
 
 class UserService:
     """Service class for user operations."""
@@ -214,3 +225,23 @@ class UserService:
 
     def correct_password(self, user: str, password: str) -> bool:
         return self.ud.correct_password(user, password)
+
+    def add_history(self, user: str, command: str) -> None:
+        self.ud.add_history(user, command)
+
+    def count_history(self, user: str) -> int:
+        return self.ud.count_history(user)
+
+    def get_history(
+        self, user: str, after: int = 0, limit: int = -1
+    ) -> List[Tuple[int, str]]:
+        return self.ud.get_history(user, after, limit)
+
+    def get_history_command(self, user: str, number: int) -> str:
+        return self.ud.get_history_command(user, number)
+
+    def get_recent_history(self, user: str, limit: int) -> List[str]:
+        return self.ud.get_recent_history(user, limit)
+
+    def find_history(self, user: str, value: str, start: bool = True) -> str:
+        return self.ud.find_history(user, value, start)
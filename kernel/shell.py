@@ -1,16 +1,36 @@
+import inspect
 import threading
-from typing import Optional, Any, List, Dict, TYPE_CHECKING
+from typing import (
+    Optional,
+    Any,
+    List,
+    MutableMapping,
+    Sequence,
+    Tuple,
+    TYPE_CHECKING,
+)
 
 import kernel.stream
 import kernel.system
+from kernel.common import handle_file_operation
 from kernel.constants import PROGRAMSDIR, VARCHAR, BASEDIR
-from kernel.exceptions import CommandNotFoundError
+from kernel.environment import Environment, History
+from kernel.exceptions import BrokenPipeError, CommandNotFoundError
+from kernel.proctable import RUNNING
+from kernel.scheduler import AsyncSysCall
 
 if TYPE_CHECKING:
     from kernel.system import System
 
 
-class Shell(threading.Thread):
+class Shell(object):
+    """A running program, executed on a worker of the system's pool.
+
+    start() and join() behave like those of a thread, run() runs the
+    program in the calling thread. Programs with an ``async def run``
+    are started on the system's scheduler instead.
+    """
+
     def __init__(
         self,
         pid: int,
@@ -21,9 +41,10 @@ class Shell(threading.Thread):
         path: str = BASEDIR,
         system_instance: Optional["System"] = None,
     ) -> None:
-        super(Shell, self).__init__()
         self.programname = program
         self.args: List[str] = args or []
+        # set beforehand to run a program object instead of looking it up
+        self.program: Any = None
 
         self._path = path
         self._oldpath = path
@@ -36,36 +57,150 @@ class Shell(threading.Thread):
         self.syscall = kernel.system.SysCall(self, self.system)
 
         if self.parent:
-            self.vars: Dict[str, str] = self.parent.vars.copy()
-            self.aliases: Dict[str, str] = self.parent.aliases.copy()
-            self.prevcommands: List[str] = self.parent.prevcommands[:]
+            # shared with the parent, copied on write
+            self.vars: MutableMapping[str, str] = Environment.child_of(
+                self.parent.vars
+            )
+            self.aliases: MutableMapping[str, str] = Environment.child_of(
+                self.parent.aliases
+            )
+            self.prevcommands: Sequence[str] = History(self.parent.prevcommands)
         else:
-            self.vars = {
-                "PATH": PROGRAMSDIR,
-                "HOME": BASEDIR,
-                "PWD": self._path,
-                "OLDPWD": self._oldpath,
-            }
-            self.aliases = dict()
-            self.prevcommands = []
+            self.vars = Environment(
+                {
+                    "PATH": PROGRAMSDIR,
+                    "HOME": BASEDIR,
+                    "PWD": self._path,
+                    "OLDPWD": self._oldpath,
+                }
+            )
+            self.aliases = Environment()
+            self.prevcommands = History()
 
         self.stdin = stdin
         self.stdout = kernel.stream.Pipe(name="out", writer=self)
         self.stderr = kernel.stream.Pipe(name="err", writer=self)
+        self._redirects: Tuple[str, Optional[Tuple[str, str]]] = ("", None)
+        self._started = False
+        self._looked_up = False
+        self._done = threading.Event()
 
-    def run(self) -> None:
+    def start(self) -> None:
+        """Run the shell on a worker of the system's pool, or scheduler."""
+        if self._started:
+            raise RuntimeError("shells can only be started once")
+        self._started = True
+        # the program decides where the shell runs
+        self._load_program()
+        if self.is_async():
+            self.system.scheduler.submit(self._arun())
+        else:
+            self.system.workers.submit(self._bootstrap)
+
+    def is_async(self) -> bool:
+        return inspect.iscoroutinefunction(getattr(self.program, "run", None))
+
+    def _bootstrap(self) -> None:
         try:
+            self.run()
+        finally:
+            self._done.set()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """Wait until the started shell is done, or timeout seconds."""
+        if not self._started:
+            raise RuntimeError("cannot join shell before it is started")
+        self._done.wait(timeout)
+
+    def _load_program(self) -> None:
+        """Look up the program once, it stays False if it is not found."""
+        if self.program is None and not self._looked_up:
+            self._looked_up = True
             self.program = self.find_program(self.programname)
-            if self.program:
-                self.program.run(self, self.args)
+
+    def is_alive(self) -> bool:
+        return self._started and not self._done.is_set()
+
+    @property
+    def asyscall(self) -> AsyncSysCall:
+        """The syscalls as coroutines, for async programs."""
+        return AsyncSysCall(self.syscall, self.system.scheduler)
+
+    def run(self) -> None:
+        self.system.pids.set_state(self, RUNNING)
+        try:
+            if self.open_redirects():
+                self._load_program()
+                if self.system.processes.accepts(self.program):
+                    self.system.processes.run(self, self.program, self.args)
+                elif self.is_async():
+                    self.system.scheduler.run(self.program.run(self, self.args))
+                elif self.program:
+                    self.program.run(self, self.args)
         except CommandNotFoundError:
             # TODO # add back "is a directory"
             self.stderr.write("%s: command not found\n" % (self.programname,))
-        # cleanup
+        except BrokenPipeError:
+            # the reader is gone, stop quietly like SIGPIPE
+            pass
+        finally:
+            self._exit()
+
+    async def _arun(self) -> None:
+        """Like run, for an async program on the system's scheduler."""
+        self.system.pids.set_state(self, RUNNING)
+        try:
+            if await self.system.scheduler.blocking(self.open_redirects):
+                await self.program.run(self, self.args)
+        except BrokenPipeError:
+            pass
+        finally:
+            self._exit()
+            self._done.set()
+
+    def _exit(self) -> None:
+        # cleanup, a reader waiting on stdout must always be woken
+        if isinstance(self.stdin, kernel.stream.Stream):
+            self.stdin.close_reader()
         self.stdout.close()
         self.stderr.close()
         self.system.kill(self)
 
+    def redirect(
+        self, stdin: str = "", stdout: Optional[Tuple[str, str]] = None
+    ) -> None:
+        """Read stdin from and write stdout (path, mode) to files.
+
+        The files are opened by open_redirects when the shell runs.
+        """
+        self._redirects = (stdin, stdout)
+
+    def open_redirects(self) -> bool:
+        """Bind stdin and stdout to their redirection files, if any.
+
+        Returns:
+            False if a file could not be opened
+        """
+        stdin, stdout = self._redirects
+        if stdin:
+            path = self.sabs_path(stdin)
+            f = handle_file_operation(self, path, "open", "rb")
+            if not f:
+                return False
+            if isinstance(self.stdin, kernel.stream.Stream):
+                # a pipe into this shell is left unread
+                self.stdin.close_reader()
+            self.stdin = kernel.stream.FileReader(f, name=path)
+        if stdout:
+            path = self.sabs_path(stdout[0])
+            f = handle_file_operation(self, path, "open", stdout[1] + "b")
+            if not f:
+                return False
+            # a reader piped from this shell gets no input
+            self.stdout.close()
+            self.stdout = kernel.stream.FileWriter(f, name=path)
+        return True
+
     @property
     def path(self) -> str:
         """Get the current path."""
@@ -120,28 +255,71 @@ class Shell(threading.Thread):
         self.vars[name] = value
 
     def hist_find(self, value: str, start: bool = True) -> str:
-        done = ""
         for x in reversed(self.prevcommands):
             if start and x.startswith(value):
-                done = x
-                break
+                return x
             elif not start and value in x:
-                done = x
-                break
-        return done
+                return x
+        # not in this session, look through the older ones of the user
+        user = self.get_var("USER")
+        if user:
+            return self.syscall.find_history(user, value, start)
+        return ""
+
+    def hist_get(self, number: int) -> str:
+        """Return command number as listed by history, "" if there is none.
+
+        Negative numbers count back from the last command.
+        """
+        user = self.get_var("USER")
+        if user:
+            # the history of the user, older sessions included
+            if number < 0:
+                number += self.syscall.count_history(user)
+            if number < 0:
+                return ""
+            return self.syscall.get_history_command(user, number)
+        try:
+            return self.prevcommands[number]
+        except IndexError:
+            return ""
 
     def find_program(self, name: str) -> Any:
+        return self.resolve_program(name)[0]
+
+    def resolve_program(self, name: str) -> Tuple[Any, Optional[str]]:
+        """Find the program for name, using the system's command hash.
+
+        Returns:
+            The loaded program (False if not found) and its path
+        """
+        if "/" in name:
+            return self.search_program(name)
+        commands = self.system.commands
+        search = self.get_var("PATH")
+        path = commands.lookup(name, search)
+        if path is not None:
+            program = self.syscall.open_program(path)
+            if program:
+                return program, path
+            commands.forget(name)
+        program, path = self.search_program(name)
+        if program and path is not None:
+            commands.remember(name, path, search)
+        return program, path
+
+    def search_program(self, name: str) -> Tuple[Any, Optional[str]]:
+        program = False
         for x in self.program_paths(name):
             if not x.endswith(".py"):
                 x += ".py"
             program = self.syscall.open_program(x)
             if program:
-                break
-            else:
-                program = self.syscall.open_program(x[:-3])
+                return program, x
+            program = self.syscall.open_program(x[:-3])
             if program:
-                break
-        return program
+                return program, x[:-3]
+        return program, None
 
     def __repr__(self) -> str:
         return "<Shell(pid=%d, program=%s, args=%s, path=%s)>" % (
@@ -1,4 +1,10 @@
+import kernel.metadata
+import kernel.userdata
+
+
 def run() -> None:
     from kernel.logging import logger
 
     logger.info("SHUTTING DOWN")
+    kernel.metadata.close_connections()
+    kernel.userdata.close_connections()
@@ -1,11 +1,103 @@
+import os
+import stat
+import time
+from typing import Any, Dict, List
+
 import kernel.filesystem
 import kernel.metadata
 import kernel.userdata
 
 
+def reconcile(root: str = "/") -> Dict[str, Any]:
+    """Bring the metadata in line with the filesystem below root.
+
+    Only directories whose mtime differs from the last recorded snapshot
+    are listed; unchanged directories are skipped, but their
+    subdirectories are still checked. All differences are written in a
+    single transaction.
+
+    Returns:
+        Counters and per-phase timings (in seconds)
+    """
+    fs = kernel.filesystem
+    md = kernel.metadata
+    timings: Dict[str, float] = {}
+
+    start = time.perf_counter()
+    md.migrate_database()
+    snapshot = md.get_dir_snapshot()
+    known_dirs: Dict[str, List[str]] = {}
+    for path in snapshot:
+        if path != root:
+            known_dirs.setdefault(fs.dir_name(path), []).append(path)
+    timings["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    added: List[str] = []
+    removed: List[str] = []
+    changed: Dict[str, int] = {}
+    visited = set()
+    if md.get_meta_data(root) is None:
+        added.append(root)
+
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            st = os.stat(fs.abs_path(path))
+        except OSError:
+            continue
+        if not stat.S_ISDIR(st.st_mode):
+            # replaced by a file, what was below it goes with the snapshot
+            continue
+        mtime = st.st_mtime_ns
+        visited.add(path)
+        if snapshot.get(path) == mtime:
+            # same entries as last time, only subdirectories may differ
+            stack.extend(known_dirs.get(path, []))
+            continue
+
+        changed[path] = mtime
+        on_disk = set()
+        with os.scandir(fs.abs_path(path)) as entries:
+            for entry in entries:
+                if not fs.is_listed(entry.name):
+                    continue
+                child = fs.join_path(path, entry.name)
+                on_disk.add(child)
+                if entry.is_dir():
+                    stack.append(child)
+        in_db = set(md.get_children(path))
+        added.extend(on_disk - in_db)
+        removed.extend(in_db - on_disk)
+    timings["scan"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    removed_dirs = [x for x in snapshot if x not in visited]
+    md.sync_meta_data(added, removed, changed, removed_dirs)
+    timings["sync"] = time.perf_counter() - start
+
+    return {
+        "scanned": len(changed),
+        "skipped": len(visited) - len(changed),
+        "added": len(added),
+        "removed": len(removed),
+        "timings": timings,
+    }
+
+
 def run() -> None:
     from kernel.logging import logger
 
     logger.info("STARTING")
     kernel.userdata.build_user_data_database()
-    kernel.metadata.build_meta_data_database(kernel.filesystem.list_all("/"))
+    stats = reconcile("/")
+    logger.info(
+        "metadata: %d directories scanned, %d unchanged, %d added, %d removed",
+        stats["scanned"],
+        stats["skipped"],
+        stats["added"],
+        stats["removed"],
+    )
+    for phase, seconds in stats["timings"].items():
+        logger.info("metadata %s: %.3fs", phase, seconds)
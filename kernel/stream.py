@@ -1,14 +1,251 @@
-from typing import Any, Optional, List, Union
+import asyncio
+import struct
+import tempfile
+import threading
+import zlib
+from collections import deque
+from typing import (
+    IO,
+    Any,
+    AsyncIterator,
+    Deque,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from kernel.constants import (
+    PIPEBYTESIZE,
+    PIPECHUNKSIZE,
+    PIPESIZE,
+    PIPESPILLCOMPRESS,
+    PIPESPILLSIZE,
+)
+from kernel.exceptions import BrokenPipeError
 from kernel.logging import logger
 
+SPILLBLOCKSIZE = 64 * 1024  # bytes of lines written to disk at a time
+
+# what a pipe carries: a line of text or a chunk of raw bytes
+Item = Union[str, bytes]
+
+_LINES = 0
+_CHUNK = 1
+
+# returned by Pipe._take when there is nothing to take yet
+_WAIT: Any = object()
+
+
+def encode_lines(lines: List[str]) -> bytes:
+    """Return lines as bytes, each one terminated by a newline."""
+    return "".join(x + "\n" for x in lines).encode("utf-8", "surrogatepass")
+
+
+def iter_chunks(items: List[Item]) -> Iterator[bytes]:
+    """Yield items as byte chunks, runs of lines are encoded together."""
+    lines: List[str] = []
+    for item in items:
+        if isinstance(item, str):
+            lines.append(item)
+            continue
+        if lines:
+            yield encode_lines(lines)
+            lines = []
+        yield item
+    if lines:
+        yield encode_lines(lines)
+
+
+class LineDecoder:
+    """Splits byte chunks into lines, keeping unterminated ends."""
+
+    def __init__(self) -> None:
+        self._partial = b""
+
+    def feed(self, chunk: bytes) -> List[str]:
+        data = self._partial + chunk if self._partial else chunk
+        parts = data.split(b"\n")
+        self._partial = parts.pop()
+        return [x.decode("utf-8", "replace") for x in parts]
+
+    def decode(self, items: List[Item]) -> List[str]:
+        lines: List[str] = []
+        for item in items:
+            if isinstance(item, str):
+                lines.extend(self.flush())
+                lines.append(item)
+            else:
+                lines.extend(self.feed(item))
+        return lines
+
+    def take_partial(self) -> bytes:
+        partial, self._partial = self._partial, b""
+        return partial
+
+    def flush(self) -> List[str]:
+        """Return the unterminated last line, if there is one."""
+        partial = self.take_partial()
+        return [partial.decode("utf-8", "replace")] if partial else []
+
+
+class SpillFile:
+    """First in, first out queue of pipe items kept in a temporary file.
+
+    Lines are gathered into blocks of about SPILLBLOCKSIZE bytes, byte
+    chunks are stored as blocks of their own. Every block has a kind and
+    length prefix and is optionally zlib-compressed. Lines of the block
+    being gathered are handed out directly.
+    """
+
+    def __init__(self, compress: bool = False) -> None:
+        self.compress = compress
+        self.items = 0
+        self._file: Optional[IO[bytes]] = None
+        self._blocks = 0
+        self._read_pos = 0
+        self._write_pos = 0
+        self._pending: List[str] = []
+        self._pending_bytes = 0
+
+    def __len__(self) -> int:
+        return self.items
+
+    def append(self, item: Item) -> None:
+        self.items += 1
+        if isinstance(item, str):
+            self._pending.append(item)
+            self._pending_bytes += len(item) + 1
+            if self._pending_bytes >= SPILLBLOCKSIZE:
+                self._flush()
+        else:
+            self._flush()
+            self._write_block(_CHUNK, item)
+
+    def _flush(self) -> None:
+        if self._pending:
+            data = "\n".join(self._pending).encode("utf-8", "surrogatepass")
+            self._write_block(_LINES, data)
+            self._pending = []
+            self._pending_bytes = 0
+
+    def _write_block(self, kind: int, data: bytes) -> None:
+        if self.compress:
+            data = zlib.compress(data)
+        if self._file is None:
+            self._file = tempfile.TemporaryFile()
+        self._file.seek(self._write_pos)
+        self._file.write(struct.pack(">BI", kind, len(data)))
+        self._file.write(data)
+        self._write_pos = self._file.tell()
+        self._blocks += 1
+
+    def take(self) -> List[Item]:
+        """Remove and return the oldest block of items."""
+        items: List[Item]
+        if self._blocks and self._file is not None:
+            self._file.seek(self._read_pos)
+            kind, length = struct.unpack(">BI", self._file.read(5))
+            data = self._file.read(length)
+            self._read_pos += 5 + length
+            self._blocks -= 1
+            if not self._blocks:
+                # everything on disk has been read, start over
+                self._file.seek(0)
+                self._file.truncate()
+                self._read_pos = self._write_pos = 0
+            if self.compress:
+                data = zlib.decompress(data)
+            if kind == _CHUNK:
+                items = [data]
+            else:
+                items = list(data.decode("utf-8", "surrogatepass").split("\n"))
+        else:
+            items = list(self._pending)
+            self._pending = []
+            self._pending_bytes = 0
+        self.items -= len(items)
+        return items
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._blocks = self._read_pos = self._write_pos = 0
+        self._pending = []
+        self._pending_bytes = 0
+        self.items = 0
+
+
+def _wake(future: Any) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class Stream:
+    """Base of what a shell reads its stdin from and writes its stdout to.
+
+    Streams carry lines (``write``/``read``) as well as raw bytes
+    (``write_bytes``/``read_chunks``/``readinto``).
+    """
+
+    def __bool__(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        """Finish writing."""
+
+    def close_reader(self) -> None:
+        """Finish reading."""
+
+    # Coroutine versions for async programs, streams that never wait on
+    # another program (files) just do the work in place.
+
+    async def aread(self) -> AsyncIterator[str]:
+        for line in self.read():  # type: ignore[attr-defined]
+            yield line
+
+    async def awrite(self, value: Any) -> None:
+        self.write(value)  # type: ignore[attr-defined]
+
+    async def awrite_bytes(
+        self, data: Union[bytes, bytearray, memoryview]
+    ) -> None:
+        self.write_bytes(data)  # type: ignore[attr-defined]
+
+
+class Pipe(Stream):
+    """Stream of lines, or raw byte chunks, between two shells.
+
+    A pipe nobody reads from (the terminal, stderr) keeps every line in
+    ``value`` and logs them when it is closed. Once a reader is attached
+    items go through a buffer of at most ``size`` items and PIPEBYTESIZE
+    bytes of chunks instead: writers block while it is full and readers
+    block until items arrive or the pipe is closed. Once the reader has
+    called ``close_reader`` writes raise BrokenPipeError. ``aread`` and
+    ``awrite`` wait the same way, but without blocking an event loop.
+
+    ``write`` and ``read`` deal in lines, ``write_bytes``, ``read_chunks``
+    and ``readinto`` in bytes. Either side may use either form, chunks
+    are split into lines and lines are joined into chunks as needed, so
+    programs that only pass data through can avoid per-line objects.
+
+    With ``spill`` set writers never block: past ``spill`` bytes of
+    buffered items, further items go to a SpillFile until the reader
+    has caught up again.
+    """
 
-class Pipe:
     def __init__(
         self,
         name: str = "",
         value: Optional[List[str]] = None,
         writer: Optional[Any] = None,
         reader: Optional[Any] = None,
+        size: int = PIPESIZE,
+        spill: Optional[int] = PIPESPILLSIZE,
+        compress: bool = PIPESPILLCOMPRESS,
     ) -> None:
         if value is None:
             self.value: List[Union[str, None]] = []
@@ -17,46 +254,316 @@ class Pipe:
         self.writer = writer
         self.reader = reader
         self.name = name
+        self.size = size
+        self.spill = spill
         self._line = 0
+        self._buffer: Deque[Item] = deque()
+        # bytes in _buffer, only chunks are counted unless spilling
+        self._buffered = 0
+        self._spill = SpillFile(compress)
+        self._cond = threading.Condition()
+        # coroutines waiting for the pipe, woken along with the threads
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, Any]] = []
+        self._reader_closed = False
         self.closed = False
-
-    def __bool__(self) -> bool:
-        return True
+        # reader side state, or writer side for pipes without a reader
+        self._decoder = LineDecoder()
+        self._lines: Deque[str] = deque()
+        self._chunks: Optional[Iterator[bytes]] = None
+        self._chunk = memoryview(b"")
 
     def set_reader(self, callback: Any) -> None:
-        self.reader = callback
+        with self._cond:
+            self.reader = callback
+            self._buffer.extend(x for x in self.value if x is not None)
+            self.value = []
         callback.stdin = self
 
     def set_writer(self, callback: Any) -> None:
         self.writer = callback
 
     def write(self, value: Any) -> None:
-        if not self.closed:
-            self.value.extend(str(value).split("\n"))
+        lines = str(value).split("\n")
+        with self._cond:
+            if self.closed:
+                return
+            if self.reader is None:
+                self.value.extend(self._decoder.flush())
+                self.value.extend(lines)
+                return
+            self._put(lines)
 
-    def read(self) -> Any:
-        for line in self.value[self._line :]:
-            if line is None:
-                break
-            yield line
-            self._line += 1
+    def write_bytes(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        """Write a chunk of raw bytes, mutable buffers are copied once."""
+        chunk = data if isinstance(data, bytes) else bytes(data)
+        if not chunk:
+            return
+        with self._cond:
+            if self.closed:
+                return
+            if self.reader is None:
+                self.value.extend(self._decoder.feed(chunk))
+                return
+            self._put([chunk])
+
+    def _put(self, items: Sequence[Item]) -> None:
+        if self.spill is not None:
+            if self._reader_closed:
+                raise BrokenPipeError(self.name)
+            for item in items:
+                # once spilled, items stay on disk until the reader catches up
+                if self._spill or self._buffered >= self.spill:
+                    self._spill.append(item)
+                else:
+                    self._buffer.append(item)
+                    self._buffered += len(item)
+            self._notify()
+            return
+
+        for item in items:
+            while self._full():
+                self._cond.wait()
+            self._add(item)
+
+    def _full(self) -> bool:
+        return not self._reader_closed and (
+            len(self._buffer) >= self.size or self._buffered >= PIPEBYTESIZE
+        )
+
+    def _add(self, item: Item) -> None:
+        if self._reader_closed:
+            raise BrokenPipeError(self.name)
+        if not self._buffer:
+            self._notify()
+        self._buffer.append(item)
+        if isinstance(item, bytes):
+            self._buffered += len(item)
+
+    def _take(self) -> Any:
+        """Return the next items, None once drained, or _WAIT."""
+        items: List[Item]
+        if self._buffer:
+            # take everything at once so the writer can refill, the
+            # buffer only grows while nothing is spilled
+            items = list(self._buffer)
+            self._buffer.clear()
+            self._buffered = 0
+        elif self._spill:
+            items = self._spill.take()
+        elif self.closed:
+            self._spill.close()
+            return None
+        else:
+            return _WAIT
+        self._notify()
+        return items
+
+    def _next_items(self) -> Optional[List[Item]]:
+        """Block for the next items, None once the pipe is drained."""
+        with self._cond:
+            while (items := self._take()) is _WAIT:
+                self._cond.wait()
+            return items  # type: ignore[no-any-return]
+
+    def _notify(self) -> None:
+        self._cond.notify_all()
+        waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def _waiter(self) -> Any:
+        """Return a future the next _notify completes, lock held."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiters.append((loop, future))
+        return future
+
+    async def _anext_items(self) -> Optional[List[Item]]:
+        while True:
+            with self._cond:
+                items = self._take()
+                if items is _WAIT:
+                    future = self._waiter()
+            if items is not _WAIT:
+                return items  # type: ignore[no-any-return]
+            await future
+
+    async def aread(self) -> AsyncIterator[str]:
+        """Like read, waiting for lines without blocking the event loop."""
+        if self.reader is None:
+            for line in self.read():
+                yield line
+            return
+
+        while True:
+            if self._lines:
+                lines = list(self._lines)
+                self._lines.clear()
+            else:
+                items = await self._anext_items()
+                if items is None:
+                    lines = self._decoder.flush()
+                    if not lines:
+                        return
+                else:
+                    lines = self._decoder.decode(items)
+            for line in lines:
+                yield line
+
+    async def awrite(self, value: Any) -> None:
+        """Like write, waiting for room without blocking the event loop."""
+        await self._aput(str(value).split("\n"))
+
+    async def awrite_bytes(
+        self, data: Union[bytes, bytearray, memoryview]
+    ) -> None:
+        """Like write_bytes, without blocking the event loop."""
+        chunk = data if isinstance(data, bytes) else bytes(data)
+        if chunk:
+            await self._aput([chunk])
+
+    async def _aput(self, items: Sequence[Item]) -> None:
+        done = 0
+        while done < len(items):
+            with self._cond:
+                if self.closed or self.reader is None or self.spill is not None:
+                    # writing does not wait, see write and _put
+                    break
+                while done < len(items) and not self._full():
+                    self._add(items[done])
+                    done += 1
+                if done == len(items):
+                    return
+                future = self._waiter()
+            await future
+        for item in items[done:]:
+            if isinstance(item, bytes):
+                self.write_bytes(item)
+            else:
+                self.write(item)
+
+    def _next_lines(self) -> Optional[List[str]]:
+        if self._lines:
+            lines = list(self._lines)
+            self._lines.clear()
+            return lines
+        while True:
+            items = self._next_items()
+            if items is None:
+                return self._decoder.flush() or None
+            lines = self._decoder.decode(items)
+            if lines:
+                return lines
+
+    def read(self) -> Iterator[str]:
+        if self.reader is None:
+            # nothing is attached, hand out what has been written so far
+            for line in self.value[self._line :]:
+                if line is None:
+                    break
+                yield line
+                self._line += 1
+            return
+
+        while True:
+            lines = self._next_lines()
+            if lines is None:
+                return
+            yield from lines
 
     def readline(self) -> str:
-        line = self.value[self._line] if self._line < len(self.value) else None
-        self._line += 1
-        return line if line is not None else ""
+        if self.reader is None:
+            line = (
+                self.value[self._line] if self._line < len(self.value) else None
+            )
+            self._line += 1
+            return line if line is not None else ""
+
+        if not self._lines:
+            self._lines.extend(self._next_lines() or [])
+        return self._lines.popleft() if self._lines else ""
 
     def readlines(self) -> List[Union[str, None]]:
-        return self.value
+        if self.reader is None:
+            return self.value
+        return list(self.read())
+
+    def read_chunks(self) -> Iterator[bytes]:
+        """Yield the stream as byte chunks, as written where possible."""
+        if self.reader is None:
+            lines = []
+            for line in self.value[self._line :]:
+                if line is None:
+                    break
+                lines.append(line)
+            self._line += len(lines)
+            if lines:
+                yield encode_lines(lines)
+            return
+
+        if self._lines:
+            yield encode_lines(list(self._lines))
+            self._lines.clear()
+        partial = self._decoder.take_partial()
+        if partial:
+            yield partial
+        while True:
+            items = self._next_items()
+            if items is None:
+                return
+            yield from iter_chunks(items)
+
+    def readinto(self, buffer: Union[bytearray, memoryview]) -> int:
+        """Fill buffer with the next bytes of the stream.
+
+        Returns:
+            The number of bytes copied, 0 at the end of the stream
+        """
+        while not self._chunk:
+            if self._chunks is None:
+                self._chunks = self.read_chunks()
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._chunk = memoryview(chunk)
+        view = memoryview(buffer).cast("B")
+        n = min(len(view), len(self._chunk))
+        view[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
 
     def close(self) -> None:
-        self.closed = True
-        self.value.append(None)
+        with self._cond:
+            self.closed = True
+            if self.reader is None:
+                self.value.extend(self._decoder.flush())
+                self.value.append(None)
+            self._notify()
         self.broadcast()
 
+    def close_reader(self) -> None:
+        """Stop reading, blocked and later writes raise BrokenPipeError."""
+        with self._cond:
+            self._reader_closed = True
+            self._buffer.clear()
+            self._buffered = 0
+            self._spill.close()
+            self._lines.clear()
+            self._chunk = memoryview(b"")
+            self._notify()
+
     def clear(self) -> None:
-        self.value = []
-        self._line = 0
+        with self._cond:
+            self.value = []
+            self._buffer.clear()
+            self._buffered = 0
+            self._spill.close()
+            self._decoder = LineDecoder()
+            self._lines.clear()
+            self._chunks = None
+            self._chunk = memoryview(b"")
+            self._line = 0
+            self._notify()
 
     def get_value(self) -> List[Union[str, None]]:
         return self.value
@@ -106,3 +613,71 @@ class Pipe:
             self.value[self._line] if self._line < len(self.value) else ""
         )
         return "<Pipe %d: %s>" % (self._line, line_value)
+
+
+class FileReader(Stream):
+    """Stdin read straight from a file opened in binary mode, as for <."""
+
+    def __init__(self, f: Any, name: str = "") -> None:
+        self.name = name
+        self._file = f
+        self._decoder = LineDecoder()
+
+    def read_chunks(self) -> Iterator[bytes]:
+        while not self._file.closed:
+            chunk = self._file.read(PIPECHUNKSIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def readinto(self, buffer: Union[bytearray, memoryview]) -> int:
+        if self._file.closed:
+            return 0
+        return int(self._file.readinto(buffer) or 0)
+
+    def read(self) -> Iterator[str]:
+        for chunk in self.read_chunks():
+            yield from self._decoder.feed(chunk)
+        yield from self._decoder.flush()
+
+    def readline(self) -> str:
+        if self._file.closed:
+            return ""
+        line = self._file.readline()
+        return str(line.rstrip(b"\n").decode("utf-8", "replace"))
+
+    def readlines(self) -> List[Union[str, None]]:
+        return list(self.read())
+
+    def close_reader(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+    def __repr__(self) -> str:
+        return "<FileReader(name=%s)>" % (self.name,)
+
+
+class FileWriter(Stream):
+    """Stdout written straight to a file opened in binary mode, as for >."""
+
+    def __init__(self, f: Any, name: str = "") -> None:
+        self.name = name
+        self._file = f
+        self.closed = False
+
+    def write(self, value: Any) -> None:
+        if not self.closed:
+            data = str(value) + "\n"
+            self._file.write(data.encode("utf-8", "surrogatepass"))
+
+    def write_bytes(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        if not self.closed:
+            self._file.write(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self._file.close()
+
+    def __repr__(self) -> str:
+        return "<FileWriter(name=%s)>" % (self.name,)
@@ -3,10 +3,24 @@ import kernel.filesystem
 import kernel.metadata
 import kernel.userdata
 
+import kernel.processes
 import kernel.shell
-from kernel.constants import KERNELDIR, SystemState
+from kernel.commandhash import CommandHash
+from kernel.proctable import ProcessTable
+from kernel.scheduler import Scheduler
+from kernel.constants import (
+    KERNELDIR,
+    PROCESSPOOLSIZE,
+    SCHEDULEREXECUTORSIZE,
+    WORKERKEEPALIVE,
+    WORKERPOOLMAX,
+    WORKERPOOLSIZE,
+    SystemState,
+)
 from kernel.services import FilesystemService, MetadataService, UserService
-from kernel.permissions import PermissionChecker
+from kernel.workers import WorkerPool
+import kernel.permissions
+from kernel.permissions import PermissionChecker, row_allows
 from kernel.protocols import (
     SystemProtocol,
     FilesystemProtocol,
@@ -16,10 +30,10 @@ from kernel.protocols import (
 from typing import Dict, Any, List, Optional, TYPE_CHECKING, Union, Tuple
 
 if TYPE_CHECKING:
-    from kernel.models import FileMetadata, UserData
+    from kernel.models import DirEntry, FileMetadata, UserData
 else:
     # For runtime imports
-    from kernel.models import FileMetadata, UserData
+    from kernel.models import DirEntry, FileMetadata, UserData
 
 
 class System(SystemProtocol):
@@ -43,8 +57,14 @@ class System(SystemProtocol):
         self._metadata = metadata or kernel.metadata
         self._userdata = userdata or kernel.userdata
 
-        self.pids: List[int] = []
+        self.pids = ProcessTable()
         self._state = SystemState.IDLE
+        self.commands = CommandHash()
+        self.workers = WorkerPool(
+            WORKERPOOLSIZE, WORKERPOOLMAX, WORKERKEEPALIVE
+        )
+        self.processes = kernel.processes.ProcessPool(PROCESSPOOLSIZE)
+        self.scheduler = Scheduler(SCHEDULEREXECUTORSIZE)
 
         # Auto-login attributes for testing
         self._auto_login_user: Optional[str] = None
@@ -90,32 +110,27 @@ class System(SystemProtocol):
         path = self.filesystem.join_path(KERNELDIR, "shutdown.py")
         program = self.filesystem.open_program(path)
         program.run()
+        self.workers.close()
+        self.processes.close()
+        self.scheduler.close()
 
     def new_shell(self, *args: Any, **kwargs: Any) -> Any:
         kwargs["system_instance"] = self
-        y = kernel.shell.Shell(len(self.pids), *args, **kwargs)
-        self.new_pid(y)
+        pid = self.pids.allocate()
+        y = kernel.shell.Shell(pid, *args, **kwargs)
+        self.pids.add(y, pid, parent=y.parent)
         self.state = SystemState.RUNNING
         return y
 
     def get_pid(self, item: Any) -> Optional[int]:
-        try:
-            x = self.pids.index(item)
-        except Exception:
-            x = None
-        return x
+        return self.pids.pid_of(item)
 
     def get_process(self, pid: int) -> Any:
-        try:
-            x = self.pids[pid]
-        except Exception:
-            x = None
-        return x
+        info = self.pids.get(pid)
+        return info.item if info is not None else None
 
     def new_pid(self, item: Any) -> int:
-        x = len(self.pids)
-        self.pids.append(item)
-        return x
+        return self.pids.add(item)
 
     def get_events(self, _type: Any = None) -> str:
         if _type is None:
@@ -124,11 +139,8 @@ class System(SystemProtocol):
             return "some"
 
     def kill(self, shell: Any) -> None:
-        try:
-            self.pids.remove(shell)
-        except ValueError:
-            # Shell not in list, ignore
-            pass
+        # a shell that is not in the table is ignored
+        self.pids.remove(shell)
 
 
 def compare_permission(
@@ -138,18 +150,7 @@ def compare_permission(
     system_instance: Optional["System"] = None,
 ) -> bool:
     system = system_instance or System()
-    metadata = system.metadata.get_meta_data(path)
-    if not metadata:
-        return False
-
-    owner = metadata.owner
-    permissions = system.metadata.get_permission_number(path)
-    if isinstance(access, int):
-        compare = [access * (user == owner), 0, access]
-    else:
-        d = {"r": 4, "w": 2, "x": 1}
-        compare = [d[access] * (owner == user), 0, d[access]]
-    return any(int(x) & y for (x, y) in zip(permissions, compare))
+    return row_allows(system.metadata.get_meta_data(path), user, access)
 
 
 def has_permission(
@@ -159,31 +160,7 @@ def has_permission(
     system_instance: Optional["System"] = None,
 ) -> bool:
     system = system_instance or System()
-    dirpaths = [path]
-    temppath = path
-    while temppath != "/":
-        temppath = system.filesystem.dir_name(temppath)
-        dirpaths.append(temppath)
-    if not all(compare_permission(x, user, 5, system) for x in dirpaths[1:]):
-        # does not have read permissions all the way to path
-        return False
-
-    if system.filesystem.is_dir(dirpaths[0]):
-        if not compare_permission(dirpaths[0], user, access, system):
-            # does not have access permissions on folder
-            return False
-    else:
-        if not compare_permission(dirpaths[1], user, access, system):
-            # does not have access permissions for containing folder
-            return False
-        try:
-            compare_permission(dirpaths[0], user, access, system)
-        except TypeError:
-            if access != "w":
-                # TODO # maybe remove?
-                # you can not read a file that does not exist
-                return False
-    return True
+    return kernel.permissions.has_permission(path, user, access, system)
 
 
 class SysCall(object):
@@ -240,16 +217,19 @@ class SysCall(object):
     def copy(self, src: str, dst: str) -> None:
         self.fs_service.copy(src, dst)
         self.md_service.copy_path(src, dst)
+        self.system.commands.invalidate(dst)
 
     @PermissionChecker("w")
     def remove(self, path: str) -> None:
         self.fs_service.remove(path)
         self.md_service.delete_path(path)
+        self.system.commands.invalidate(path)
 
     @PermissionChecker("w")
     def remove_dir(self, path: str) -> None:
         self.fs_service.remove_dir(path)
         self.md_service.delete_path(path)
+        self.system.commands.invalidate(path)
 
     @PermissionChecker("r")
     def get_size(self, path: str) -> int:
@@ -259,6 +239,10 @@ class SysCall(object):
     def list_dir(self, path: str) -> List[str]:
         return self.fs_service.list_dir(path)
 
+    @PermissionChecker("r")
+    def scan_dir(self, path: str) -> List[DirEntry]:
+        return self.fs_service.scan_dir(path)
+
     @PermissionChecker("r")
     def list_glob(self, expression: str) -> List[str]:
         return self.fs_service.list_glob(expression)
@@ -266,25 +250,30 @@ class SysCall(object):
     @PermissionChecker("r")  # ? #
     def list_all(self, path: str = "/") -> List[str]:
         listing = [path]
-        for x in self.list_dir(path):
-            new = self.join_path(path, x)
-            if self.is_dir(new):
-                listing.extend(self.list_all(new))
+        for entry in self.scan_dir(path):
+            if entry.is_dir:
+                listing.extend(self.list_all(entry.path))
             else:
-                listing.append(new)
+                listing.append(entry.path)
         return listing
 
     @PermissionChecker("w")
     def make_dir(self, path: str) -> None:
         self.fs_service.make_dir(path)
         self.md_service.add_path(path, "root", "rwxrwxrwx")
+        self.system.commands.invalidate(path)
 
     @PermissionChecker("1")
     def open_file(self, path: str, mode: str) -> Any:
         temp = self.fs_service.is_file(path)
-        x = FileDecorator(self.fs_service.open_file(path, mode), path)
+        x = FileDecorator(
+            self.fs_service.open_file(path, mode),
+            path,
+            metadata_service=self.md_service,
+        )
         if not temp:
             self.md_service.add_path(path, "root", "rwxrwxrwx")
+            self.system.commands.invalidate(path)
         return x
 
     @PermissionChecker("x")
@@ -361,6 +350,10 @@ class SysCall(object):
     def set_owner(self, path: str, owner: str) -> None:
         return self.md_service.set_owner(path, owner)
 
+    def transaction(self) -> Any:
+        """Group the metadata writes of a whole command into one commit."""
+        return self.md_service.batch()
+
     def correct_password(self, user: str, password: str) -> bool:
         return self.ud_service.correct_password(user, password)
 
@@ -421,6 +414,26 @@ class SysCall(object):
     def set_password(self, user: str, value: str) -> None:
         return self.ud_service.set_password(user, value)
 
+    def add_history(self, user: str, command: str) -> None:
+        return self.ud_service.add_history(user, command)
+
+    def count_history(self, user: str) -> int:
+        return self.ud_service.count_history(user)
+
+    def get_history(
+        self, user: str, after: int = 0, limit: int = -1
+    ) -> List[Tuple[int, str]]:
+        return self.ud_service.get_history(user, after, limit)
+
+    def get_history_command(self, user: str, number: int) -> str:
+        return self.ud_service.get_history_command(user, number)
+
+    def get_recent_history(self, user: str, limit: int) -> List[str]:
+        return self.ud_service.get_recent_history(user, limit)
+
+    def find_history(self, user: str, value: str, start: bool = True) -> str:
+        return self.ud_service.find_history(user, value, start)
+
 
 class FileDecorator(object):
     def __init__(
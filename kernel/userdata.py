@@ -2,14 +2,38 @@ from typing import Optional, List, Tuple, Any, Union
 import sqlite3
 from contextlib import contextmanager
 
+from kernel.database import ConnectionPool
 from kernel.utils import convert_many
 from kernel.models import UserData
 
 
+# Commands of every session, numbered from 0 per user as history lists
+# them. The indexes serve lookups per user by number and by prefix.
+_HISTORY_TABLES = [
+    """CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY,
+            username TEXT,
+            number INTEGER,
+            command TEXT)""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS history_number "
+    "ON history (username, number)",
+    "CREATE INDEX IF NOT EXISTS history_command ON history (username, command)",
+]
+
 # For testing with in-memory databases, we need to maintain a single connection
 _test_userdata_connection = None
 
 
+def _database_file() -> str:
+    from kernel.constants import USERDATAFILE
+
+    return USERDATAFILE
+
+
+# Long-lived connections for the on-disk database, reused across Shell threads
+_pool = ConnectionPool(_database_file)
+
+
 def _get_test_connection() -> sqlite3.Connection:
     """Get or create a test connection for in-memory databases."""
     global _test_userdata_connection
@@ -30,6 +54,8 @@ def _get_test_connection() -> sqlite3.Connection:
                             shell TEXT,
                             password TEXT)"""
         )
+        for sql in _HISTORY_TABLES:
+            cur.execute(sql)
     return _test_userdata_connection
 
 
@@ -51,17 +77,13 @@ def get_db_connection() -> Any:
             raise
         # Don't close the connection for in-memory databases during testing
     else:
-        con = sqlite3.connect(
-            USERDATAFILE, detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        try:
+        with _pool.connection() as con:
             yield con
-            con.commit()
-        except Exception:
-            con.rollback()
-            raise
-        finally:
-            con.close()
+
+
+def close_connections() -> None:
+    """Close all pooled database connections."""
+    _pool.close()
 
 
 def build_user_data_database() -> None:
@@ -93,6 +115,8 @@ def build_user_data_database() -> None:
     with get_db_connection() as con:
         cur = con.cursor()
         cur.execute(tablesql)
+        for sql in _HISTORY_TABLES:
+            cur.execute(sql)
         # Always insert the users - in tests, we start with a clean database
         cur.execute(addsql, root)
         cur.execute(addsql, chris)
@@ -271,3 +295,78 @@ def correct_password(user: str, password: str) -> bool:
         return user_data.password == password
     except (TypeError, IndexError):
         return False
+
+
+#######################################
+
+
+def add_history(user: str, command: str) -> None:
+    execute_many(
+        "INSERT INTO history (username, number, command) "
+        "SELECT ?, COALESCE(MAX(number) + 1, 0), ? FROM history "
+        "WHERE username = ?",
+        [(user, command, user)],
+    )
+
+
+def count_history(user: str) -> int:
+    data = execute_query(
+        "SELECT COALESCE(MAX(number) + 1, 0) FROM history WHERE username = ?",
+        (user,),
+        "one",
+    )
+    return data[0] if data else 0  # type: ignore
+
+
+def get_history(
+    user: str, after: int = 0, limit: int = -1
+) -> List[Tuple[int, str]]:
+    """Return up to limit (id, command) of user after id, oldest first."""
+    data = execute_query(
+        "SELECT id, command FROM history WHERE username = ? AND id > ? "
+        "ORDER BY id LIMIT ?",
+        (user, after, limit),
+        "all",
+    )
+    return data or []  # type: ignore
+
+
+def get_history_command(user: str, number: int) -> str:
+    """Return command number of user, counted from 0, "" if there is none."""
+    data = execute_query(
+        "SELECT command FROM history WHERE username = ? AND number = ?",
+        (user, number),
+        "one",
+    )
+    return data[0] if data else ""  # type: ignore
+
+
+def get_recent_history(user: str, limit: int) -> List[str]:
+    """Return the last limit commands of user, oldest first."""
+    data = execute_query(
+        "SELECT command FROM history WHERE username = ? "
+        "ORDER BY id DESC LIMIT ?",
+        (user, limit),
+        "all",
+    )
+    return [x[0] for x in reversed(data or [])]
+
+
+def find_history(user: str, value: str, start: bool = True) -> str:
+    """Return the last command of user starting with or containing value."""
+    if start:
+        # a range over the index instead of LIKE, which is case insensitive
+        data = execute_query(
+            "SELECT command FROM history WHERE username = ? "
+            "AND command >= ? AND command < ? ORDER BY id DESC LIMIT 1",
+            (user, value, value + "\U0010ffff"),
+            "one",
+        )
+    else:
+        data = execute_query(
+            "SELECT command FROM history WHERE username = ? "
+            "AND instr(command, ?) > 0 ORDER BY id DESC LIMIT 1",
+            (user, value),
+            "one",
+        )
+    return data[0] if data else ""  # type: ignore
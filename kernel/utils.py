@@ -1,4 +1,5 @@
 import argparse
+import threading
 from typing import Union, List, Tuple, Any, Optional
 
 
@@ -17,10 +18,25 @@ class Parser(argparse.ArgumentParser):
             self.name = program
         else:
             self.name = name
-        self.help = False
+        # programs are cached and may run in several shells at once, so
+        # the per-run state lives in the running shell's thread
+        self._state = threading.local()
+
+    @property
+    def help(self) -> bool:
+        return getattr(self._state, "help", False)
+
+    @help.setter
+    def help(self, value: bool) -> None:
+        self._state.help = value
+
+    @property
+    def shell(self) -> Any:
+        return self._state.shell
 
     def add_shell(self, shell: Any) -> None:
-        self.shell = shell
+        self._state.shell = shell
+        self._state.help = False
 
     def exit(self, *args: Any, **kwargs: Any) -> None:  # type: ignore
         pass
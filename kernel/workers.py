@@ -0,0 +1,104 @@
+"""
+Reusable worker threads that run the shells of a system.
+"""
+
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+from kernel.logging import logger
+
+
+class WorkerPool:
+    """Runs tasks on threads that are kept around and reused.
+
+    A task is handed to an idle worker if there is one, otherwise a new
+    worker is started. Tasks only wait in the queue once max_workers are
+    busy: the stages of a pipeline block on each other, so a stage queued
+    behind its own pipeline would never run.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        max_workers: Optional[int] = None,
+        keepalive: float = 30.0,
+    ) -> None:
+        """Initialize the pool, no thread is started until a task comes.
+
+        Args:
+            size: Most idle workers kept for reuse
+            max_workers: Most workers at once, None for no limit
+            keepalive: Seconds an idle worker waits for a task before exiting
+        """
+        self.size = size
+        self.max_workers = max_workers
+        self.keepalive = keepalive
+        self.started = 0  # threads created
+        self.completed = 0  # tasks run
+        self._tasks: Deque[Callable[[], None]] = deque()
+        self._cond = threading.Condition()
+        self._workers = 0
+        self._idle = 0
+        self._retire = 0
+
+    def submit(self, task: Callable[[], None]) -> None:
+        """Run task on a worker, queueing it if all workers are busy."""
+        with self._cond:
+            self._tasks.append(task)
+            if self._idle >= len(self._tasks):
+                self._cond.notify()
+                return
+            if self.max_workers is not None and (
+                self._workers >= self.max_workers
+            ):
+                return
+            self._workers += 1
+            self.started += 1
+            name = "worker-%d" % (self.started,)
+        threading.Thread(target=self._work, name=name, daemon=True).start()
+
+    def close(self) -> None:
+        """Let the idle workers exit now, busy ones exit when done."""
+        with self._cond:
+            self._retire = self._idle
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the worker counts and task counters."""
+        with self._cond:
+            return {
+                "workers": self._workers,
+                "idle": self._idle,
+                "queued": len(self._tasks),
+                "started": self.started,
+                "completed": self.completed,
+            }
+
+    def _next_task(self) -> Optional[Callable[[], None]]:
+        with self._cond:
+            while not self._tasks:
+                if self._idle >= self.size or self._retire:
+                    self._retire = max(self._retire - 1, 0)
+                    break
+                self._idle += 1
+                woken = self._cond.wait(self.keepalive)
+                self._idle -= 1
+                if not woken and not self._tasks:
+                    break
+            else:
+                return self._tasks.popleft()
+            self._workers -= 1
+            return None
+
+    def _work(self) -> None:
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            try:
+                task()
+            except Exception:
+                logger.exception("%s failed", task)
+            with self._cond:
+                self.completed += 1
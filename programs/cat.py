@@ -2,6 +2,7 @@ from kernel.utils import Parser
 from typing import Any, List
 from kernel.base_command import BaseFileCommand
 from kernel.common import resolve_path, handle_file_operation
+from kernel.io_utils import is_piped, is_stream, read_file_chunks
 
 
 class CatCommand(BaseFileCommand):
@@ -38,6 +39,18 @@ class CatCommand(BaseFileCommand):
     ) -> None:
         """Process a single file."""
         path = resolve_path(shell, filepath)
+        if not number_lines and is_piped(shell.stdout):
+            # nothing to do per line, pass the bytes through
+            f = handle_file_operation(shell, path, "open", "rb")
+            if f:
+                chunk = b""
+                for chunk in read_file_chunks(f):
+                    shell.stdout.write_bytes(chunk)
+                if chunk and not chunk.endswith(b"\n"):
+                    # the next file starts on a line of its own
+                    shell.stdout.write_bytes(b"\n")
+                f.close()
+            return
         f = handle_file_operation(shell, path, "open", "r")
         if f:
             line_num = 1
@@ -51,7 +64,14 @@ class CatCommand(BaseFileCommand):
 
     def process_stdin(self, shell: Any, number_lines: bool = False) -> None:
         """Process input from stdin."""
-        if shell.stdin:
+        if (
+            not number_lines
+            and is_stream(shell.stdin)
+            and is_piped(shell.stdout)
+        ):
+            for chunk in shell.stdin.read_chunks():
+                shell.stdout.write_bytes(chunk)
+        elif shell.stdin:
             line_num = 1
             for line in shell.stdin.read():
                 if number_lines:
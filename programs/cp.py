@@ -6,6 +6,7 @@ from kernel.common import (
     handle_file_operation,
     copy_file_metadata,
 )
+from kernel.file_utils import collect_tree
 
 
 desc = "Copies the given file/directory to the given location."
@@ -32,8 +33,9 @@ def run(shell: Any, args: List[str]) -> None:
                 or len(parsed_args.paths) == 2
                 or not handle_file_operation(shell, dest, "exists")
             ):
-                for src in parsed_args.paths[:-1]:
-                    copy(shell, parsed_args, src, dest)
+                with shell.syscall.transaction():
+                    for src in parsed_args.paths[:-1]:
+                        copy(shell, parsed_args, src, dest)
             else:
                 shell.stderr.write("%s is not a directory" % dest)
         else:
@@ -42,21 +44,12 @@ def run(shell: Any, args: List[str]) -> None:
 
 def copy(shell: Any, args: argparse.Namespace, src: str, dest: str) -> None:
     src = resolve_path(shell, src)
+    src_is_dir = bool(handle_file_operation(shell, src, "is_dir"))
 
-    if args.recursive and handle_file_operation(shell, src, "is_dir"):
-        # This would need to be implemented in the common module if used frequently
-        srcpaths = []
-
-        def collect_paths(current_path: str) -> None:
-            srcpaths.append(current_path)
-            if handle_file_operation(shell, current_path, "is_dir"):
-                for item in shell.syscall.list_dir(current_path):
-                    item_path = shell.syscall.join_path(current_path, item)
-                    collect_paths(item_path)
-
-        collect_paths(src)
+    if args.recursive and src_is_dir:
+        srcpaths = collect_tree(shell, src)
     else:
-        srcpaths = [src]
+        srcpaths = [(src, src_is_dir)]
 
     if handle_file_operation(shell, dest, "is_dir"):
         join = [dest, shell.syscall.base_name(src)]
@@ -64,7 +57,7 @@ def copy(shell: Any, args: argparse.Namespace, src: str, dest: str) -> None:
     else:
         destbase = dest
 
-    for path in srcpaths:
+    for path, is_dir in srcpaths:
         relpath = shell.srel_path(path, src)
         if relpath != ".":
             destpath = shell.syscall.join_path(destbase, relpath)
@@ -75,7 +68,7 @@ def copy(shell: Any, args: argparse.Namespace, src: str, dest: str) -> None:
             shell.stdout.write("Copying %s to %s" % (path, destpath))
 
         try:
-            if handle_file_operation(shell, path, "is_dir"):
+            if is_dir:
                 if args.recursive:
                     copy_dir(shell, path, destpath)
                 else:
@@ -1,6 +1,6 @@
 import re
 import argparse
-from typing import Any, List, Pattern
+from typing import Any, Iterable, Iterator, List, Optional, Pattern
 
 from kernel.utils import Parser
 from kernel.common import resolve_path, handle_file_operation
@@ -8,6 +8,8 @@ from kernel.file_utils import read_file_lines
 
 desc = "Search for lines in a file matching the pattern given."
 parser = Parser("grep", name="Grep", description=desc)
+# may run in a worker process, see kernel.processes
+cpu_bound = True
 pa = parser.add_argument
 pa(
     "paths",
@@ -21,6 +23,14 @@ pa("-v", action="store_true", dest="invert", default=False)
 
 
 def run(shell: Any, args: List[str]) -> None:
+    lines = shell.stdin.read() if shell.stdin else None
+    for line in transform(shell, args, lines):
+        shell.stdout.write(line)
+
+
+def transform(
+    shell: Any, args: List[str], lines: Optional[Iterable[str]]
+) -> Iterator[str]:
     parser.add_shell(shell)
     parsed_args = parser.parse_args(args)
     if not parser.help:
@@ -35,22 +45,22 @@ def run(shell: Any, args: List[str]) -> None:
                 pattern = re.compile(parsed_args.pattern, case)
 
             for path in sorted(parsed_args.paths[skip:]):
-                grep(shell, parsed_args, pattern, path)
+                yield from grep(shell, parsed_args, pattern, path)
 
-            if shell.stdin:
-                for line in shell.stdin.read():
+            if lines is not None:
+                for line in lines:
                     # use xor to invert the selection
                     if bool(re.findall(pattern, line)) ^ parsed_args.invert:
-                        shell.stdout.write(line.strip())
+                        yield line.strip()
             if not shell.stdout:
-                shell.stdout.write("")
+                yield ""
         else:
             shell.stderr.write("missing file operand")
 
 
 def grep(
     shell: Any, args: argparse.Namespace, pattern: Pattern[str], path: str
-) -> None:
+) -> Iterator[str]:
     newpath = resolve_path(shell, path)
     if handle_file_operation(shell, newpath, "is_file"):
         lines = read_file_lines(shell, newpath)
@@ -58,9 +68,9 @@ def grep(
             # use xor to invert the selection
             if bool(re.findall(pattern, line)) ^ args.invert:
                 if shell.stdout:
-                    shell.stdout.write(line.rstrip())
+                    yield line.rstrip()
                 else:
-                    shell.stdout.write("%s:%s" % (path, line.rstrip()))
+                    yield "%s:%s" % (path, line.rstrip())
     else:
         shell.stderr.write("%s does not exist" % (newpath,))
 
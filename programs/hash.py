@@ -0,0 +1,49 @@
+from typing import Any, List
+from kernel.utils import Parser
+
+desc = "Remembers or shows the locations of programs."
+parser = Parser("hash", name="Hash", description=desc)
+pa = parser.add_argument
+pa(
+    "names",
+    type=str,
+    nargs="*",
+)
+pa("-r", action="store_true", dest="reset", default=False)
+pa("-d", action="store_true", dest="delete", default=False)
+pa("-s", action="store_true", dest="stats", default=False)
+
+
+def run(shell: Any, args: List[str]) -> None:
+    parser.add_shell(shell)
+    parsed_args = parser.parse_args(args)
+    if not parser.help and parsed_args.delete and not parsed_args.names:
+        shell.stderr.write("hash: -d: option requires an argument")
+        parser.print_usage()
+    elif not parser.help:
+        commands = shell.system.commands
+        if parsed_args.reset:
+            commands.forget()
+        for name in parsed_args.names:
+            if parsed_args.delete:
+                commands.forget(name)
+            elif not shell.find_program(name):
+                shell.stderr.write("hash: %s: not found" % (name,))
+        if parsed_args.stats:
+            stats = commands.stats()
+            shell.stdout.write(
+                "%d entries, %d hits, %d misses"
+                % (stats["size"], stats["hits"], stats["misses"])
+            )
+        elif not parsed_args.names and not parsed_args.reset:
+            items = commands.items()
+            if not items:
+                shell.stdout.write("hash: hash table empty")
+            else:
+                shell.stdout.write("hits\tcommand")
+                for _, path, uses in items:
+                    shell.stdout.write("%4d\t%s" % (uses, path))
+
+
+def help() -> str:
+    return parser.help_msg()
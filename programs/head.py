@@ -1,4 +1,5 @@
-from typing import Any, List
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Optional
 from kernel.utils import Parser
 from kernel.common import resolve_path
 from kernel.file_utils import read_file_lines
@@ -15,27 +16,34 @@ pa("-n", action="store", type=int, dest="lineamount", default=5)
 
 
 def run(shell: Any, args: List[str]) -> None:
+    lines = shell.stdin.read() if shell.stdin else None
+    for line in transform(shell, args, lines):
+        shell.stdout.write(line)
+
+
+def transform(
+    shell: Any, args: List[str], lines: Optional[Iterable[str]]
+) -> Iterator[str]:
     parser.add_shell(shell)
     parsed_args = parser.parse_args(args)
     if not parser.help:
         for x in parsed_args.paths:
             path = resolve_path(shell, x)
-            if len(parsed_args.paths) > 1 or shell.stdin:
-                shell.stdout.write("==> %s <==" % (x,))
-            lines = read_file_lines(shell, path)
-            for line in lines[: parsed_args.lineamount]:
-                shell.stdout.write(line.rstrip())
-        if shell.stdin:
+            if len(parsed_args.paths) > 1 or lines is not None:
+                yield "==> %s <==" % (x,)
+            file_lines = read_file_lines(shell, path)
+            for line in file_lines[: parsed_args.lineamount]:
+                yield line.rstrip()
+        if lines is not None:
             if parsed_args.paths:
-                shell.stdout.write("==> %% stdin %% <==")
+                yield "==> %% stdin %% <=="
             stdin_lines = []
             try:
-                stdin_lines = list(shell.stdin.read())
+                stdin_lines = list(islice(lines, parsed_args.lineamount))
             except Exception:
                 pass
-            for line in stdin_lines[: parsed_args.lineamount]:
-                shell.stdout.write(line)
-            shell.stdout.write("")
+            yield from stdin_lines
+            yield ""
         else:
             if not parsed_args.paths:
                 shell.stderr.write("missing file operand")
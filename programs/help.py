@@ -4,11 +4,9 @@ from typing import Any, List
 def run(shell: Any, args: List[str]) -> None:
     if len(args) >= 1:
         name = args[0]
-        for x in shell.program_paths(name):
-            program = shell.syscall.open_program(x)
-            if program:
-                shell.stdout.write(program.help())
-                break
+        program = shell.find_program(name)
+        if program:
+            shell.stdout.write(program.help())
         else:
             shell.stderr.write("%s: command not found" % (name,))
     else:
@@ -1,23 +1,41 @@
-from typing import Any, List
+from typing import Any, Iterator, List, Tuple
+from kernel.constants import HISTPAGESIZE
 from kernel.utils import Parser
 
 desc = "Returns the command history."
 parser = Parser("history", name="History", description=desc)
 pa = parser.add_argument
 pa(
-    "bla",
-    type=str,
-    nargs="*",
+    "count",
+    type=int,
+    nargs="?",
 )
 
 
 def run(shell: Any, args: List[str]) -> None:
     parser.add_shell(shell)
-    args = parser.parse_args(args)
+    parsed_args = parser.parse_args(args)
     if not parser.help:
-        mlen = len(str(len(shell.prevcommands))) + 1
+        user = shell.get_var("USER")
+        if user:
+            total = shell.syscall.count_history(user)
+            if parsed_args.count is not None:
+                recent = shell.syscall.get_recent_history(
+                    user, max(parsed_args.count, 0)
+                )
+                lines: Iterator[Tuple[int, str]] = enumerate(
+                    recent, total - len(recent)
+                )
+            else:
+                lines = stored_history(shell, user)
+        else:
+            total = len(shell.prevcommands)
+            count = total if parsed_args.count is None else parsed_args.count
+            start = total - min(max(count, 0), total)
+            lines = enumerate(shell.prevcommands[start:], start)
+        mlen = len(str(total)) + 1
         format = "{0:%dd}  {1}" % mlen
-        for i, line in enumerate(shell.prevcommands):
+        for i, line in lines:
             if not shell.stdout:
                 msg = format.format(i, line)
             else:
@@ -25,5 +43,15 @@ def run(shell: Any, args: List[str]) -> None:
             shell.stdout.write(msg)
 
 
+def stored_history(shell: Any, user: str) -> Iterator[Tuple[int, str]]:
+    """Yield the numbered commands of user, read a page at a time."""
+    i = 0
+    after = 0
+    while page := shell.syscall.get_history(user, after, HISTPAGESIZE):
+        for after, command in page:
+            yield i, command
+            i += 1
+
+
 def help() -> str:
     return parser.help_msg()
@@ -1,15 +1,42 @@
+import itertools
+import math
 import re
-from typing import Any, List, Tuple, Optional, Union, Match, Dict, Callable
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Match,
+    Optional,
+    Tuple,
+    Union,
+)
 
+from kernel.cache import MISSING, LRUCache
 from kernel.constants import (
+    BRACEEXPANSIONMAX,
+    EXPANSIONCACHESIZE,
+    EXPANSIONCACHEWORDS,
+    HISTSIZE,
     OSNAME,
+    PROGRAMSDIR,
     SystemState,
+    PIPEFUSE,
     PIPECHAR,
     VARCHAR,
     INCHAR,
     OUTCHAR,
     APPENDCHAR,
 )
+from kernel.exceptions import (
+    BrokenPipeError,
+    CommandNotFoundError,
+    ExpansionError,
+)
+from kernel.logging import logger
+from kernel.stream import Pipe
 
 varparse = re.compile(r"\%s\w*" % (VARCHAR,))
 stdioparse = re.compile(r"([%s%s]+\s*\w+)" % (OUTCHAR, INCHAR))
@@ -18,10 +45,27 @@ subparse = re.compile(r"""s(?P<lim>.)(.*?)(?P=lim)(.*?)(?P=lim)""")
 bangparse = re.compile(r"""(\!+[^!]*)""")
 # r"""(\!\!|(?<!\\)\![^!\s]*|\s+)"""
 braceparse = re.compile(r"""((?<!\$)\{[^\{\}]*\})""")
+tildeparse = re.compile(r"~[\+-]?")
+bracechars = frozenset("{}")
+globchars = frozenset("*?")
+globset = frozenset("[]")
+
+# lines split into words with the variables they use, and the words of
+# short lines after expansion, for the values of those variables
+parse_cache = LRUCache(EXPANSIONCACHESIZE)
+expansion_cache = LRUCache(EXPANSIONCACHESIZE)
+
+# programs that only look at or change the interpreter itself, they run
+# in its thread when they are a command of their own
+BUILTINS = frozenset(["alias", "cd", "echo", "history", "pwd", "which"])
 
 
 def run(shell: Any, args: List[str]) -> None:
     user = shell.get_var("USER")
+    if user and not shell.prevcommands:
+        # continue the history of the user's last session
+        for command in shell.syscall.get_recent_history(user, HISTSIZE):
+            shell.prevcommands.append(command)
     while int(shell.system.state) >= SystemState.RUNNING:
         try:
             data = input("%s@%s:%s$ " % (user, OSNAME, shell.path))
@@ -36,10 +80,18 @@ def run(shell: Any, args: List[str]) -> None:
             continue
         data = data.strip()
         if data:
-            cleaned, command = shell_expansion(shell, data)
+            try:
+                cleaned, command = shell_expansion(shell, data)
+            except ExpansionError as e:
+                print(e)
+                continue
             shell.prevcommands.append(command)
+            if user:
+                shell.syscall.add_history(user, command)
 
             programs = eval_input(shell, cleaned)
+            if run_builtin(shell, programs):
+                continue
             shells = start_shells(shell, programs)
             for x in shells:
                 x.start()
@@ -77,7 +129,11 @@ def get_hist(shell: Any, value: str) -> Tuple[List[str], bool]:
         elif search.isdigit() or (
             search.startswith("-") and search[1:].isdigit()
         ):
-            command = shell.prevcommands[int(search)]
+            command = shell.hist_get(int(search))
+            if not command:
+                raise ExpansionError(
+                    "!" + search, "!%s: event not found" % search
+                )
         else:
             command = shell.hist_find(search)
 
@@ -170,67 +226,54 @@ def bang_replacement(shell: Any, listing: List[str]) -> Tuple[List[str], bool]:
     return bang, execute
 
 
+def is_quoted(part: str) -> bool:
+    return part.startswith(('"', "'"))
+
+
+def is_glob(part: str) -> bool:
+    return not is_quoted(part) and bool(
+        globchars.intersection(part) or globset.issubset(part)
+    )
+
+
 def filename_expansion(shell: Any, listing: List[str]) -> List[str]:
     filenames = []
-    inter = set("*?").intersection
-    sub = set("[]").issubset
     for part in listing:
-        if not part.startswith(('"', "'")) and (inter(part) or sub(part)):
+        if is_glob(part):
             filenames.extend(shell.syscall.list_glob(shell.sabs_path(part)))
         else:
             filenames.append(part)
     return filenames
 
 
-def brace_expansion(shell: Any, listing: List[str]) -> List[str]:
-    def expand(
-        remaining: List[List[str]], curlist: Optional[List[str]] = None
-    ) -> List[str]:
-        """
-        {a,b}{c,d}{e,f}
-
-                a               b
-           ac      ad      bc      bd
-        ace acf ade adf bce bcf bde bdf
-        """
-        out = []
-        if curlist is None:
-            out = remaining[0]
-        else:
-            for base in curlist:
-                for end in remaining[0]:
-                    out.append(base + end)
-        if len(remaining) > 1:
-            out = expand(remaining[1:], out)
-        return out
-
-    def compress(item: List[str]) -> List[List[str]]:
-        out = []
-        if len(item) > 1:
-            # used to find the last iteration
-            len2 = (len(item) / 2) - 1
-            for i, (start, end) in enumerate(zip(item[::2], item[1::2])):
-                temp2 = []
-                # [1:-1] removes braces
-                for part in end[1:-1].split(","):
-                    if i == len2:
-                        temp2.append(start + part + item[-1])
-                    else:
-                        temp2.append(start + part)
-                out.append(temp2)
-        else:
-            out.append(item)
-        return out
+def brace_expansion(shell: Any, listing: Iterable[str]) -> Iterator[str]:
+    """Expand the braces of words, one word at a time.
+
+    {a,b}{c,d}{e,f} gives ace acf ade adf bce bcf bde bdf.
 
-    braces = []
-    inter = set("{}").intersection
+    Raises:
+        ExpansionError: Before a word would take the number of words past
+            BRACEEXPANSIONMAX
+    """
+    total = 0
     for part in listing:
-        if not part.startswith(('"', "'")) and inter(part):
-            compressed = compress(re.split(braceparse, part))
-            braces.extend(expand(compressed))
-        else:
-            braces.append(part)
-    return braces
+        if is_quoted(part) or not bracechars.intersection(part):
+            total += 1
+            yield part
+            continue
+        # the text around the braces, and the choices inside each pair
+        pieces = re.split(braceparse, part)
+        texts = pieces[::2]
+        choices = [x[1:-1].split(",") for x in pieces[1::2]]
+        total += math.prod(len(x) for x in choices)
+        if total > BRACEEXPANSIONMAX:
+            raise ExpansionError(
+                part,
+                "%s: expands to more than %d words" % (part, BRACEEXPANSIONMAX),
+            )
+        for chosen in itertools.product(*choices):
+            words = itertools.chain.from_iterable(zip(texts, chosen))
+            yield "".join(words) + texts[-1]
 
 
 def tilde_expansion(match: Match[str]) -> str:
@@ -246,41 +289,76 @@ def tilde_expansion(match: Match[str]) -> str:
 
 def shell_expansion(shell: Any, string: str) -> Tuple[List[str], str]:
     # http://tldp.org/LDP/Bash-Beginners-Guide/html/sect_03_04.html
-    quote = quote_split(string)
-
-    # replace bang
-    if shell.prevcommands:
-        bang, execute = bang_replacement(shell, quote)
-    else:
-        bang = quote
+    parsed = parse_cache.get(string)
+    if parsed is MISSING:
+        quote = tuple(quote_split(string))
+        bangs = any("!" in x for x in quote if not is_quoted(x))
+        # the words are only generated to find their variables
+        names = expansion_names(static_expansion(shell, quote))
+        parsed = (quote, bangs, names)
+        parse_cache.put(string, parsed)
+    quote, bangs, names = parsed
+
+    # replace bang, its result depends on the history so it is not cached
+    bang = list(quote)
+    if bangs and shell.prevcommands:
+        bang, execute = bang_replacement(shell, bang)
+        if bang != list(quote):
+            names = expansion_names(static_expansion(shell, bang))
+    line = tuple(bang)
 
     # if execute:
 
-    braces = brace_expansion(shell, bang)
-
-    # tilde expansion
-    subed = [re.sub(r"~[\+-]?", tilde_expansion, xs) for xs in braces]
-
-    # replace $vars
-    cleaned = [
-        (
-            re.sub(varparse, lambda m: str(shell.get_var(m.group(0))), xs)
-            if not xs.startswith(("'", '"'))
-            else xs
-        )
-        for xs in subed
-    ]
+    # replace $vars, cached for the values of the variables used
+    values = tuple(str(shell.get_var(x)) for x in names)
+    expanded = expansion_cache.get((line, values))
+    if expanded is MISSING:
+        lookup = dict(zip(names, values))
+        cleaned = [
+            (
+                varparse.sub(lambda m: lookup[m.group(0)], xs)
+                if VARCHAR in xs and not is_quoted(xs)
+                else xs
+            )
+            for xs in static_expansion(shell, line)
+        ]
+        expanded = (cleaned, any(is_glob(x) for x in cleaned))
+        # braces can give many words, those lines are expanded every time
+        if len(cleaned) <= EXPANSIONCACHEWORDS:
+            expansion_cache.put((line, values), expanded)
+    cleaned, globbed = expanded
 
     # command sub
 
     # process sub
-    filenames = filename_expansion(shell, cleaned)
+    filenames = filename_expansion(shell, cleaned) if globbed else cleaned
 
     # strip quotes
     unquoted = [x.strip('"').strip("'") for x in filenames]
     return unquoted, " ".join(bang)
 
 
+def static_expansion(shell: Any, quote: Iterable[str]) -> Iterator[str]:
+    """Expand the braces and tildes of words, which only depend on them.
+
+    The words are yielded one at a time, as brace_expansion gives them.
+    """
+    for xs in brace_expansion(shell, quote):
+        # tilde expansion
+        yield tildeparse.sub(tilde_expansion, xs) if "~" in xs else xs
+
+
+def expansion_names(words: Iterable[str]) -> Tuple[str, ...]:
+    """Return the variables used by words, sorted."""
+    names = {
+        name
+        for xs in words
+        if VARCHAR in xs and not is_quoted(xs)
+        for name in varparse.findall(xs)
+    }
+    return tuple(sorted(names))
+
+
 def eval_input(
     shell: Any, cleaned: List[str]
 ) -> List[List[Union[str, List[str], str, Tuple[str, str], None]]]:
@@ -297,7 +375,7 @@ def eval_input(
         else:
             if state in [None, PIPECHAR]:
                 if state == PIPECHAR:
-                    b.append(["", [], "", ("", "")])
+                    b.append(["", [], "", None])
                 if part in shell.aliases:
                     part = shell.aliases[part]
                 b[-1][0] = part  # program
@@ -322,40 +400,137 @@ def start_shells(
     path = parent.path
 
     proper = []
-    for programname, args, cin, cout in programs:
-        # hack to convert cin into streams from cat.
-        if cin:
-            newcin = parent.system.new_shell(
-                parent=parent, path=path, program="cat", args=[cin]
-            )
-        else:
-            newcin = cin
-
+    for group in fuse_stages(parent, programs):
+        programname, args, cin, _ = group[0][1]
+        cout = group[-1][1][3]
+        if len(group) > 1:
+            programname = " | ".join(str(x[1][0]) for x in group)
+            args = []
         newshell = parent.system.new_shell(
             parent=parent,
-            stdin=newcin,
             path=path,
             program=programname,
             args=args,
         )
-
-        # hack to convert cout into streams to write
-        if cout:
-            newcout = parent.system.new_shell(
-                parent=parent,
-                stdin=newcin,
-                path=path,
-                program="write",
-                args=cout,
+        if len(group) > 1:
+            newshell.program = FusedFilters(
+                [(program, stage[1]) for program, stage in group]
             )
-        else:
-            newcout = cout
-        proper.extend([x for x in [newcin, newshell, newcout] if x])
-    # (Scin0, shell0, Scout0, Scin1 ...)
+        # < and > files are bound to stdin/stdout by the shell itself
+        newshell.redirect(stdin=cin, stdout=cout)
+        proper.append(newshell)
     connect_shells(proper)
     return proper
 
 
+class FusedFilters:
+    """Filter programs of a pipeline chained as generators in one shell."""
+
+    def __init__(self, stages: List[Tuple[Any, List[str]]]) -> None:
+        self.stages = stages
+
+    def run(self, shell: Any, args: List[str]) -> None:
+        lines = shell.stdin.read() if shell.stdin else None
+        for program, stage_args in self.stages:
+            lines = program.transform(shell, stage_args, lines)
+        for line in lines or ():
+            shell.stdout.write(line)
+
+
+def filter_program(parent: Any, programname: Any, args: List[str]) -> Any:
+    """Return the program of a stage if it can be fused, else None."""
+    if "-h" in args or "--help" in args:
+        # help goes to the shell's stdout, not down the pipeline
+        return None
+    try:
+        program = parent.find_program(programname)
+    except CommandNotFoundError:
+        return None
+    if not hasattr(program, "transform"):
+        return None
+    # it has a process of its own to run in
+    return None if parent.system.processes.accepts(program) else program
+
+
+def fuse_stages(
+    parent: Any,
+    programs: List[List[Union[str, List[str], str, Tuple[str, str], None]]],
+) -> List[List[Tuple[Any, List[Any]]]]:
+    """Group the stages of a pipeline into the shells that will run them.
+
+    Consecutive filter stages share a group, as long as only the first
+    reads a file with < and only the last writes one with >.
+
+    Returns:
+        [[(program, stage), ...], ...] with program None for unfused stages
+    """
+    groups: List[List[Tuple[Any, List[Any]]]] = []
+    joinable = False
+    for stage in programs:
+        programname, args, cin, cout = stage
+        program = None
+        if PIPEFUSE and isinstance(args, list):
+            program = filter_program(parent, programname, args)
+        if program is not None and joinable and not cin:
+            groups[-1].append((program, stage))
+        else:
+            groups.append([(program, stage)])
+        joinable = program is not None and not cout
+    return groups
+
+
+class BuiltinShell:
+    """Stands in for a child shell of parent, to run a builtin in place.
+
+    Everything but the program, args and streams is parent's own.
+    """
+
+    def __init__(self, parent: Any, programname: str, args: List[str]):
+        self.parent = parent
+        self.programname = programname
+        self.args = args
+        self.stdin = None
+        self.stdout = Pipe(name="out", writer=self)
+        self.stderr = Pipe(name="err", writer=self)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.parent, name)
+
+
+def run_builtin(
+    parent: Any,
+    programs: List[List[Union[str, List[str], str, Tuple[str, str], None]]],
+) -> bool:
+    """Run a lone builtin command without a shell, False if it is not one."""
+    if len(programs) != 1:
+        return False
+    programname, args, cin, cout = programs[0]
+    if programname not in BUILTINS or cin or cout:
+        # redirects are opened by the shell
+        return False
+    try:
+        program, path = parent.resolve_program(programname)
+    except CommandNotFoundError:
+        program, path = None, None
+    if not program or not isinstance(args, list):
+        return False
+    if path != parent.syscall.join_path(PROGRAMSDIR, programname + ".py"):
+        # a program of the same name comes first on PATH
+        return False
+    shell = BuiltinShell(parent, str(programname), args)
+    try:
+        program.run(shell, args)
+    except BrokenPipeError:
+        pass
+    except Exception:
+        # the interpreter has to keep going, like after a failed shell
+        logger.exception("%s failed", programname)
+    finally:
+        shell.stdout.close()
+        shell.stderr.close()
+    return True
+
+
 def connect_shells(shells: List[Any]) -> None:
     # connect the seperate programs
     for p0, p1 in zip(shells[:-1], shells[1:]):
@@ -6,6 +6,7 @@ from kernel.common import (
     handle_file_operation,
     copy_file_metadata,
 )
+from kernel.file_utils import collect_tree
 
 
 desc = "Moves the given file/directory to the given location."
@@ -31,8 +32,9 @@ def run(shell: Any, args: List[str]) -> None:
                 handle_file_operation(shell, dest, "is_dir")
                 or len(parsed_args.paths) == 2
             ):
-                for src in parsed_args.paths[:-1]:
-                    move(shell, parsed_args, src, dest)
+                with shell.syscall.transaction():
+                    for src in parsed_args.paths[:-1]:
+                        move(shell, parsed_args, src, dest)
             else:
                 shell.stderr.write("%s is not a directory" % (dest,))
         else:
@@ -43,18 +45,9 @@ def move(shell: Any, args: argparse.Namespace, src: str, dest: str) -> None:
     src = resolve_path(shell, src)
 
     if handle_file_operation(shell, src, "is_dir"):
-        srcpaths = []
-
-        def collect_paths(current_path: str) -> None:
-            srcpaths.append(current_path)
-            if handle_file_operation(shell, current_path, "is_dir"):
-                for item in shell.syscall.list_dir(current_path):
-                    item_path = shell.syscall.join_path(current_path, item)
-                    collect_paths(item_path)
-
-        collect_paths(src)
+        srcpaths = collect_tree(shell, src)
     else:
-        srcpaths = [src]
+        srcpaths = [(src, False)]
 
     if handle_file_operation(shell, dest, "is_dir"):
         join = [dest, shell.syscall.base_name(src)]
@@ -63,7 +56,7 @@ def move(shell: Any, args: argparse.Namespace, src: str, dest: str) -> None:
         destbase = dest
 
     copiedpaths = []
-    for path in srcpaths:
+    for path, is_dir in srcpaths:
         relpath = shell.srel_path(path, src)
         if relpath != ".":
             destpath = shell.syscall.join_path(destbase, relpath)
@@ -71,17 +64,17 @@ def move(shell: Any, args: argparse.Namespace, src: str, dest: str) -> None:
             destpath = destbase
 
         try:
-            if handle_file_operation(shell, path, "is_dir"):
+            if is_dir:
                 copy_dir(shell, path, destpath)
             else:
                 handle_file_operation(shell, path, "copy", destpath)
-            copiedpaths.append(path)
+            copiedpaths.append((path, is_dir))
         except OSError:
             shell.stderr.write("file error " + destpath)
 
-    for path in reversed(copiedpaths):
+    for path, is_dir in reversed(copiedpaths):
         try:
-            if handle_file_operation(shell, path, "is_dir"):
+            if is_dir:
                 handle_file_operation(shell, path, "remove_dir")
             else:
                 handle_file_operation(shell, path, "remove")
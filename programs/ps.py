@@ -0,0 +1,33 @@
+import time
+from typing import Any, List
+from kernel.utils import Parser
+
+desc = "Reports the processes of the system."
+parser = Parser("ps", name="Process Status", description=desc)
+pa = parser.add_argument
+pa("-f", action="store_true", dest="full", default=False)
+
+
+def run(shell: Any, args: List[str]) -> None:
+    parser.add_shell(shell)
+    parsed_args = parser.parse_args(args)
+    if not parser.help:
+        shell.stdout.write("PID\tPPID\tSTATE\tSTART\tCMD")
+        for info in shell.system.pids.processes():
+            command = info.item.programname
+            if parsed_args.full and info.item.args:
+                command += " " + " ".join(info.item.args)
+            shell.stdout.write(
+                "%d\t%s\t%s\t%s\t%s"
+                % (
+                    info.pid,
+                    "-" if info.ppid is None else info.ppid,
+                    info.state,
+                    time.strftime("%H:%M:%S", time.localtime(info.started)),
+                    command,
+                )
+            )
+
+
+def help() -> str:
+    return parser.help_msg()
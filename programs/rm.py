@@ -2,6 +2,7 @@ import argparse
 from kernel.utils import Parser
 from typing import Any, List
 from kernel.common import resolve_path, handle_file_operation
+from kernel.file_utils import collect_tree
 
 
 desc = "Removes the file/directory."
@@ -22,8 +23,9 @@ def run(shell: Any, args: List[str]) -> None:
     parsed_args = parser.parse_args(args)
     if not parser.help:
         if len(parsed_args.paths) >= 1:
-            for path in parsed_args.paths:
-                remove(shell, parsed_args, path)
+            with shell.syscall.transaction():
+                for path in parsed_args.paths:
+                    remove(shell, parsed_args, path)
         else:
             shell.stderr.write("missing file operand")
 
@@ -33,27 +35,18 @@ def remove(shell: Any, args: argparse.Namespace, path: str) -> None:
 
     if handle_file_operation(shell, path, "is_dir"):
         if args.recursive:
-            paths = []
-
-            def collect_paths(current_path: str) -> None:
-                paths.append(current_path)
-                if handle_file_operation(shell, current_path, "is_dir"):
-                    for item in shell.syscall.list_dir(current_path):
-                        item_path = shell.syscall.join_path(current_path, item)
-                        collect_paths(item_path)
-
-            collect_paths(path)
+            paths = collect_tree(shell, path)
         else:
             shell.stderr.write("%s is a directory" % (path,))
             return
     else:
-        paths = [path]
+        paths = [(path, False)]
 
-    for p in reversed(paths):
+    for p, is_dir in reversed(paths):
         if args.verbose:
             shell.stdout.write("Removing %s" % (p,))
         try:
-            if handle_file_operation(shell, p, "is_dir"):
+            if is_dir:
                 handle_file_operation(shell, p, "remove_dir")
             else:
                 handle_file_operation(shell, p, "remove")
@@ -3,9 +3,12 @@ import argparse
 from typing import Any, List, Tuple, Union
 
 from kernel.utils import Parser
+from kernel.exceptions import BrokenPipeError
 
 desc = "Allows editing streams."
 parser = Parser("sed", name="Stream Editor", description=desc)
+# may run in a worker process, see kernel.processes
+cpu_bound = True
 pa = parser.add_argument
 pa(
     "paths",
@@ -92,6 +95,8 @@ def sed(shell: Any, args: argparse.Namespace, path: str) -> None:
                     # TODO # replace
                     shell.syscall.copy(newpath + "~", newpath)
                     shell.syscall.remove(newpath + "~")
+            except BrokenPipeError:
+                raise
             except Exception:
                 shell.stderr.write("No command")
     else:
@@ -1,5 +1,6 @@
 from typing import Any, List
 from kernel.utils import Parser
+from kernel.io_utils import is_stream
 
 
 desc = "Allows tapping into the stdout to write to multiple files."
@@ -23,16 +24,25 @@ def run(shell: Any, args: List[str]) -> None:
             else:
                 mode = "w"
             if parsed_args.paths:
+                binary = is_stream(shell.stdin) and is_stream(shell.stdout)
+                if binary:
+                    mode += "b"
                 files = []
                 for x in parsed_args.paths:
                     try:
                         files.append(shell.syscall.open_file(x, mode))
                     except Exception:
                         pass
-                for line in shell.stdin.read():
-                    for f in files:
-                        f.write(line)
-                    shell.stdout.write(line)
+                if binary:
+                    for chunk in shell.stdin.read_chunks():
+                        for f in files:
+                            f.write(chunk)
+                        shell.stdout.write_bytes(chunk)
+                else:
+                    for line in shell.stdin.read():
+                        for f in files:
+                            f.write("%s\n" % (line,))
+                        shell.stdout.write(line)
                 for f in files:
                     f.close()
         else:
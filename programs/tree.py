@@ -1,4 +1,4 @@
-from typing import Any, List, Union
+from typing import Any, List, Optional, Set, Union
 
 
 def run(shell: Any, args: List[str]) -> None:
@@ -6,23 +6,29 @@ def run(shell: Any, args: List[str]) -> None:
         path = shell.sabs_path(args[0])
     else:
         path = shell.path
-    tree = tree_gen(path, shell.syscall)
-    shell.stdout.write(tree_print(tree, shell.syscall))
+    files: Set[str] = set()
+    tree = tree_gen(path, shell.syscall, files=files)
+    shell.stdout.write(tree_print(tree, shell.syscall, files=files))
 
 
-def sorter(x: str, fs: Any) -> str:
-    return ("f" if fs.is_file(x) else "d") + x.lower()
-
-
-def tree_gen(path: str, fs: Any) -> List[Union[str, List[Any]]]:
+def tree_gen(
+    path: str,
+    fs: Any,
+    is_dir: Optional[bool] = None,
+    files: Optional[Set[str]] = None,
+) -> List[Union[str, List[Any]]]:
     pathtree: List[Union[str, List[Any]]] = [path]
-    if fs.is_dir(path):
+    if is_dir is None:
+        is_dir = fs.is_dir(path)
+    if is_dir:
         listing = sorted(
-            [fs.join_path(path, x) for x in fs.list_dir(path)],
-            key=lambda x: sorter(x, fs),
+            fs.scan_dir(path),
+            key=lambda x: ("f" if x.is_file else "d") + x.path.lower(),
         )
         for x in listing:
-            pathtree.append(tree_gen(fs.join_path(path, x), fs))
+            if files is not None and x.is_file:
+                files.add(x.path)
+            pathtree.append(tree_gen(x.path, fs, x.is_dir, files))
     return pathtree
 
 
@@ -32,6 +38,7 @@ def tree_print(
     level: int = 0,
     extra: str = "",
     idx: bool = None,
+    files: Optional[Set[str]] = None,
 ) -> str:
     string = ""
     for i, x in enumerate(tree):
@@ -39,9 +46,11 @@ def tree_print(
         bar = "|" if (level > 0) else ""
         added = extra + spacing + bar
         if type(x) is list:
-            string += tree_print(x, fs, level + 1, added, len(tree) - 1 == i)
+            last = len(tree) - 1 == i
+            string += tree_print(x, fs, level + 1, added, last, files)
         else:
-            char = "-- " if fs.is_file(x) else "++ "
+            is_file = x in files if files is not None else fs.is_file(x)
+            char = "-- " if is_file else "++ "
             if x != "/":
                 x = fs.base_name(x)
             end = "%s%s\n" % (char if (level > 0) else "", x)
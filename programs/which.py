@@ -3,11 +3,9 @@ from typing import Any, List
 
 def run(shell: Any, args: List[str]) -> None:
     if args:
-        for x in shell.program_paths(args[0]):
-            program = shell.syscall.open_program(x)
-            if program:
-                shell.stdout.write(x)
-                break
+        program, path = shell.resolve_program(args[0])
+        if program:
+            shell.stdout.write(path)
 
 
 def help() -> str:
@@ -1,5 +1,6 @@
 from typing import Any, List
 from kernel.common import resolve_path, handle_file_operation, process_stdin
+from kernel.io_utils import is_stream
 
 
 def run(shell: Any, args: List[str]) -> None:
@@ -13,6 +14,13 @@ def run(shell: Any, args: List[str]) -> None:
                 return
         except IndexError:
             mode = "w"
+        if is_stream(shell.stdin):
+            f = handle_file_operation(shell, path, "open", mode + "b")
+            if f:
+                for chunk in shell.stdin.read_chunks():
+                    f.write(chunk)
+                f.close()
+            return
         f = handle_file_operation(shell, path, "open", mode)
         if f:
 
@@ -5,7 +5,7 @@ from unittest.mock import patch
 
 import kernel.filesystem as fs
 from kernel.constants import BASEPATH
-from typing import Generator
+from typing import Any, Generator, List
 
 
 def test_abs_path() -> None:
@@ -123,6 +123,30 @@ class TestFilesystemOperations:
             assert "test.txt" in listing
             assert "test_dir" in listing
 
+    def test_list_dir_hides_bytecode(self) -> None:
+        """Test that compiled programs are not listed."""
+        os.mkdir(os.path.join(self.temp_dir, "__pycache__"))
+        with open(os.path.join(self.temp_dir, "module.pyc"), "w") as f:
+            f.write("")
+        with patch("kernel.filesystem.BASEPATH", self.temp_dir):
+            assert fs.list_dir("/") == ["test.txt"]
+            assert [x.name for x in fs.scan_dir("/")] == ["test.txt"]
+
+    def test_scan_dir(self) -> None:
+        """Test scan_dir returns typed entries in name order."""
+        os.mkdir(self.test_dir)
+        with open(os.path.join(self.temp_dir, "module.pyc"), "w") as f:
+            f.write("")
+        with patch("kernel.filesystem.BASEPATH", self.temp_dir):
+            entries = fs.scan_dir("/")
+            assert [x.name for x in entries] == ["test.txt", "test_dir"]
+            test_file, test_dir = entries
+            assert test_file.path == "/test.txt"
+            assert test_file.is_file and not test_file.is_dir
+            assert test_file.size == len("test content")
+            assert test_file.mtime == os.stat(self.test_file).st_mtime
+            assert test_dir.is_dir and not test_dir.is_file
+
     def test_make_dir(self) -> None:
         """Test make_dir method."""
         new_dir = os.path.join(self.temp_dir, "new_dir")
@@ -139,9 +163,102 @@ class TestFilesystemOperations:
             f.close()
             assert content == "test content"
 
+    def test_open_program_cached(self) -> None:
+        """Test that open_program reuses modules until the source changes."""
+        source = os.path.join(self.temp_dir, "prog.py")
+        with open(source, "w") as f:
+            f.write("value = 1\n")
+        with patch("kernel.filesystem.BASEPATH", self.temp_dir):
+            first = fs.open_program("prog.py")
+            assert first.value == 1
+            assert fs.open_program("prog.py") is first
+
+            with open(source, "w") as f:
+                f.write("value = 22\n")
+            second = fs.open_program("prog.py")
+            assert second is not first
+            assert second.value == 22
+
+            os.remove(source)
+            assert fs.open_program("prog.py") is False
+            assert fs.open_program("/") is False
+
     def test_remove(self) -> None:
         """Test remove method."""
         with patch("kernel.filesystem.BASEPATH", self.temp_dir):
             assert os.path.exists(self.test_file) is True
             fs.remove("test.txt")
             assert os.path.exists(self.test_file) is False
+
+
+class TestStartupReconcile:
+
+    @pytest.fixture
+    def tree(self, clean_database: Any) -> Generator[str, None, None]:
+        """Create a small tree and point the filesystem at it."""
+        temp_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(temp_dir, "a", "b"))
+        os.mkdir(os.path.join(temp_dir, "c"))
+        for name in ["a/one.txt", "a/b/two.txt", "c/three.txt", "x.pyc"]:
+            with open(os.path.join(temp_dir, name), "w") as f:
+                f.write(name)
+        with patch("kernel.filesystem.BASEPATH", temp_dir):
+            yield temp_dir
+        import shutil
+
+        shutil.rmtree(temp_dir)
+
+    def paths(self) -> List[str]:
+        import kernel.metadata as md
+
+        return sorted(x.path for x in md.get_all_meta_data("/") or [])
+
+    def test_initial_scan(self, tree: str) -> None:
+        """Test that the first boot records every visible path."""
+        import kernel.startup
+
+        stats = kernel.startup.reconcile("/")
+        assert self.paths() == sorted(fs.list_all("/"))
+        assert stats["scanned"] == 4
+        assert set(stats["timings"]) == {"load", "scan", "sync"}
+
+    def test_unchanged_directories_skipped(self, tree: str) -> None:
+        """Test that a second boot only lists directories that changed."""
+        import kernel.startup
+
+        kernel.startup.reconcile("/")
+        os.remove(os.path.join(tree, "a", "b", "two.txt"))
+        with open(os.path.join(tree, "c", "four.txt"), "w") as f:
+            f.write("four")
+
+        with patch("os.scandir", wraps=os.scandir) as scandir:
+            stats = kernel.startup.reconcile("/")
+        assert scandir.call_count == 2
+        assert stats["skipped"] == 2
+        assert (stats["added"], stats["removed"]) == (1, 1)
+        assert self.paths() == sorted(fs.list_all("/"))
+
+    def test_removed_directory(self, tree: str) -> None:
+        """Test that deleting a directory drops its whole subtree."""
+        import shutil
+        import kernel.startup
+
+        kernel.startup.reconcile("/")
+        shutil.rmtree(os.path.join(tree, "a"))
+        kernel.startup.reconcile("/")
+        assert self.paths() == ["/", "/c", "/c/three.txt"]
+        stats = kernel.startup.reconcile("/")
+        assert stats["scanned"] == 0
+
+    def test_directory_replaced_by_file(self, tree: str) -> None:
+        """Test that a directory replaced by a file drops its subtree."""
+        import shutil
+        import kernel.startup
+
+        kernel.startup.reconcile("/")
+        shutil.rmtree(os.path.join(tree, "a"))
+        with open(os.path.join(tree, "a"), "w") as f:
+            f.write("a")
+        kernel.startup.reconcile("/")
+        assert self.paths() == ["/", "/a", "/c", "/c/three.txt"]
+        assert self.paths() == sorted(fs.list_all("/"))
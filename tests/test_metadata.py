@@ -1,9 +1,10 @@
 import pytest
 import datetime
 import sqlite3
+import threading
 from unittest.mock import patch
 from typing import Generator
-from typing import Tuple
+from typing import Tuple, Any, List
 
 import kernel.metadata as md
 
@@ -269,3 +270,290 @@ class TestMetadataFunctions:
 
         with pytest.raises(AssertionError):
             md.validate_permission("rwxrwxrwxextra")
+
+
+class TestConnectionPool:
+
+    def test_connection_is_reused(self, tmp_path: Any) -> None:
+        """Test that on-disk connections are pooled instead of reopened."""
+        with patch.object(md, "METADATAFILE", str(tmp_path / "data")):
+            with md.get_db_connection() as first:
+                pass
+            with md.get_db_connection() as second:
+                pass
+            assert first is second
+            assert md._pool.stats() == {"open": 1, "idle": 1}
+
+            journal = md.execute_query("PRAGMA journal_mode", fetch="one")
+            assert journal == ("wal",)
+
+            md.close_connections()
+            assert md._pool.stats() == {"open": 0, "idle": 0}
+
+    def test_nested_connections_share_transaction(self, tmp_path: Any) -> None:
+        """Test that nested blocks reuse the outer connection."""
+        with patch.object(md, "METADATAFILE", str(tmp_path / "data")):
+            with md.get_db_connection() as outer:
+                outer.execute("CREATE TABLE t (x INTEGER)")
+                with md.get_db_connection() as inner:
+                    assert inner is outer
+                    inner.execute("INSERT INTO t VALUES (1)")
+                assert outer.in_transaction
+            assert md.execute_query("SELECT x FROM t") == [(1,)]
+            md.close_connections()
+
+    def test_shutdown_closes_connections(self, tmp_path: Any) -> None:
+        """Test that the shutdown hook releases pooled connections."""
+        import kernel.shutdown
+
+        with patch.object(md, "METADATAFILE", str(tmp_path / "data")):
+            md.execute_query("SELECT 1")
+            assert md._pool.stats()["open"] == 1
+            kernel.shutdown.run()
+            assert md._pool.stats()["open"] == 0
+
+
+class TestMetadataSchema:
+
+    def test_migrate_legacy_table(self) -> None:
+        """Test that an unindexed legacy table is upgraded in place."""
+        con = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+        con.execute(
+            """CREATE TABLE metadata (
+                        path TEXT,
+                        owner TEXT,
+                        permission TEXT,
+                        created TIMESTAMP,
+                        accessed TIMESTAMP,
+                        modified TIMESTAMP)"""
+        )
+        now = datetime.datetime.now()
+        rows = [
+            ("/a", "root", "rwxrwxrwx", now, now, now),
+            ("/a", "chris", "rwxrwxrwx", now, now, now),
+            ("/b", "root", "rwxrwxrwx", now, now, now),
+        ]
+        con.executemany("INSERT INTO metadata VALUES (?, ?, ?, ?, ?, ?)", rows)
+        con.commit()
+
+        assert md.migrate(con) == 0
+        con.commit()
+        assert con.execute("PRAGMA user_version").fetchone()[0] == (
+            md.SCHEMA_VERSION
+        )
+        assert con.execute("SELECT path, owner FROM metadata").fetchall() == [
+            ("/a", "root"),
+            ("/b", "root"),
+        ]
+        # already up to date
+        assert md.migrate(con) == md.SCHEMA_VERSION
+        con.close()
+
+    def test_lookups_use_indexes(self, clean_database: Tuple[str, str]) -> None:
+        """Test that point and subtree lookups avoid full table scans."""
+        with md.get_db_connection() as conn:
+            plans = [
+                conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+                for sql, params in [
+                    ("SELECT * FROM metadata WHERE path = ?", ("/a",)),
+                    (
+                        "SELECT * FROM metadata WHERE path >= ? AND path < ?",
+                        md._prefix_range("/a"),
+                    ),
+                    ("SELECT * FROM metadata WHERE owner = ?", ("root",)),
+                ]
+            ]
+        for plan in plans:
+            assert "SEARCH" in plan[0][-1]
+
+    def test_get_all_meta_data_prefix(
+        self, clean_database: Tuple[str, str]
+    ) -> None:
+        """Test that subtree lookups match exact prefixes only."""
+        for path in ["/test", "/test/a", "/test_2", "/Test/b", "/tesu"]:
+            md.add_path(path, "root", "rwxrwxrwx")
+
+        result = md.get_all_meta_data("/test")
+        assert result is not None
+        assert sorted(x.path for x in result) == ["/test", "/test/a", "/test_2"]
+        result = md.get_all_meta_data("")
+        assert result is not None
+        assert len(result) == 5
+
+
+class TestMetadataCache:
+
+    def test_repeated_reads_hit_cache(
+        self, clean_database: Tuple[str, str]
+    ) -> None:
+        """Test that repeated lookups are served from memory."""
+        md.add_path("/programs", "root", "rwxr-xr-x")
+        md.cache.clear()
+
+        for _ in range(3):
+            assert md.get_permission_string("/programs") == "rwxr-xr-x"
+            assert md.get_owner("/programs") == "root"
+        assert md.cache.misses == 1
+        assert md.cache.hits == 5
+
+    def test_writes_keep_cache_coherent(
+        self, clean_database: Tuple[str, str]
+    ) -> None:
+        """Test that every write updates or invalidates the cached row."""
+        assert md.get_meta_data("/a") is None
+        md.add_path("/a", "root", "rwxrwxrwx")
+        assert md.get_owner("/a") == "root"
+
+        md.set_owner("/a", "chris")
+        md.set_permission("/a", "750")
+        assert md.get_owner("/a") == "chris"
+        assert md.get_permission_string("/a") == "rwxr-x---"
+
+        md.copy_path("/a", "/b")
+        assert md.get_owner("/b") == "chris"
+
+        md.move_path("/b", "/c")
+        assert md.get_meta_data("/b") is None
+        assert md.get_owner("/c") == "chris"
+
+        md.delete_path("/a")
+        assert md.get_meta_data("/a") is None
+
+        # everything still matches the database
+        md.cache.clear()
+        assert md.get_meta_data("/a") is None
+        assert md.get_meta_data("/b") is None
+        assert md.get_owner("/c") == "chris"
+
+    def test_add_existing_path(self, clean_database: Tuple[str, str]) -> None:
+        """Test that adding or copying onto a known path keeps its row."""
+        md.add_path("/a", "chris", "rwx------")
+        md.add_path("/b", "root", "rwxrwxrwx")
+        md.add_path("/a", "root", "rwxrwxrwx")
+        md.copy_path("/b", "/a")
+        for _ in range(2):
+            assert md.get_owner("/a") == "chris"
+            assert md.get_permission_string("/a") == "rwx------"
+            md.cache.clear()
+
+    def test_fill_skips_failed_queries(
+        self, clean_database: Tuple[str, str]
+    ) -> None:
+        """Test that a failed query is not cached as a missing row."""
+        md.add_path("/f", "root", "rwxrwxrwx")
+        md.add_path("/g", "root", "rwxrwxrwx")
+        md.cache.clear()
+        connect = md.get_db_connection
+        failures: List[Exception] = []
+
+        def locked() -> Any:
+            if failures:
+                raise failures.pop()
+            return connect()
+
+        with patch.object(md, "get_db_connection", side_effect=locked):
+            failures.append(sqlite3.OperationalError("database is locked"))
+            assert md.get_meta_data("/f") is None
+            assert md.get_meta_data("/f") is not None
+
+            failures.append(sqlite3.OperationalError("database is locked"))
+            assert md.get_many_meta_data(["/g"]) == [None]
+            assert md.get_many_meta_data(["/g"])[0] is not None
+
+    def test_fill_skips_rows_read_during_a_write(self, tmp_path: Any) -> None:
+        """Test that a row read while another thread writes is not cached."""
+        query = md.execute_query
+        calls: List[Any] = []
+
+        def racing(*args: Any) -> Any:
+            result = query(*args)
+            if not calls:
+                # the writer commits after the reader got the old row
+                calls.append(args)
+                writer = threading.Thread(
+                    target=md.set_owner, args=("/a", "chris")
+                )
+                writer.start()
+                writer.join()
+            return result
+
+        with patch.object(md, "METADATAFILE", str(tmp_path / "data")):
+            md.build_meta_data_database(["/"])
+            md.add_path("/a", "root", "rwxrwxrwx")
+            md.cache.clear()
+            with patch.object(md, "execute_query", side_effect=racing):
+                assert md.get_owner("/a") == "root"
+            assert calls
+            assert md.get_owner("/a") == "chris"
+
+            md.cache.clear()
+            with md.batch():
+                md.set_owner("/a", "root")
+                # not committed, other connections still see chris
+                assert md.get_owner("/a") == "root"
+                assert "/a" not in md.cache
+            assert md.get_owner("/a") == "root"
+            md.close_connections()
+
+    def test_cache_eviction(self) -> None:
+        """Test that the least recently used entries are evicted."""
+        from kernel.cache import LRUCache, MISSING
+
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+        assert cache.get("b") is MISSING
+        assert cache.get("a") == 1
+
+        cache.resize(1)
+        assert len(cache) == 1
+        assert "a" in cache
+        assert cache.stats() == {"size": 1, "maxsize": 1, "hits": 2, "misses": 1}
+
+
+class TestMetadataBatch:
+
+    def test_batch_commits_once(self, tmp_path: Any) -> None:
+        """Test that writes in a batch become visible in one commit."""
+        database = str(tmp_path / "data")
+        with patch.object(md, "METADATAFILE", database):
+            md.build_meta_data_database(["/"])
+            other = sqlite3.connect(database)
+            with md.batch():
+                for i in range(100):
+                    md.add_path("/f%d" % i, "root", "rwxrwxrwx")
+                md.delete_path("/f0")
+                md.set_owner("/f1", "chris")
+                count = other.execute("SELECT COUNT(*) FROM metadata")
+                assert count.fetchone() == (1,)
+            count = other.execute("SELECT COUNT(*) FROM metadata")
+            assert count.fetchone() == (100,)
+            other.close()
+            md.cache.clear()
+            assert md.get_owner("/f1") == "chris"
+            assert md.get_meta_data("/f0") is None
+            md.close_connections()
+
+    def test_batch_reads_see_queued_writes(
+        self, clean_database: Tuple[str, str]
+    ) -> None:
+        """Test that queries inside a batch flush the queued writes first."""
+        with md.batch():
+            md.add_path("/a", "root", "rwxrwxrwx")
+            md.copy_path("/a", "/b")
+            result = md.get_all_meta_data("/")
+            assert result is not None
+            assert sorted(x.path for x in result) == ["/a", "/b"]
+
+    def test_batch_rolls_back(self, clean_database: Tuple[str, str]) -> None:
+        """Test that an error inside a batch discards all of its writes."""
+        md.add_path("/a", "root", "rwxrwxrwx")
+        with pytest.raises(RuntimeError):
+            with md.batch():
+                md.delete_path("/a")
+                md.add_path("/b", "root", "rwxrwxrwx")
+                raise RuntimeError
+        assert md.get_owner("/a") == "root"
+        assert md.get_meta_data("/b") is None
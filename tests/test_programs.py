@@ -1,9 +1,19 @@
+import io
 import pytest
 from unittest.mock import patch, MagicMock
 
 import programs.ls as ls_program
 import programs.cat as cat_program
-from typing import Any
+import programs.grep as grep_program
+import programs.hash as hash_program
+import programs.head as head_program
+import programs.history as history_program
+import programs.interpreter as interpreter_program
+import programs.ps as ps_program
+import kernel.system
+from kernel.exceptions import ExpansionError
+from kernel.stream import Pipe
+from typing import Any, List
 
 
 class TestLsProgram:
@@ -154,6 +164,50 @@ class TestCatProgram:
                 mock_shell.stdout.write.call_count >= 2
             )  # At least 2 lines written
 
+    def test_cat_file_to_pipe(self, mock_shell: Any) -> None:
+        """Test that cat passes file bytes through to a pipe."""
+        mock_shell.stdin = None
+        mock_shell.stdout = Pipe()
+        mock_shell.stdout.set_reader(MagicMock())
+        files = {
+            "/test/a": b"line1  \nend-of-a",
+            "/test/b": b"start-of-b\n",
+        }
+        mock_shell.syscall.open_file = MagicMock(
+            side_effect=lambda path, mode: io.BytesIO(files[path])
+        )
+
+        with patch(
+            "programs.cat.resolve_path",
+            side_effect=lambda shell, path: f"/test/{path}",
+        ):
+            cat_program.run(mock_shell, ["a", "b"])
+
+        mock_shell.syscall.open_file.assert_any_call("/test/a", "rb")
+        mock_shell.stdout.close()
+        assert list(mock_shell.stdout.read()) == [
+            "line1  ",
+            "end-of-a",
+            "start-of-b",
+        ]
+
+    def test_cat_file_to_terminal(self, mock_shell: Any) -> None:
+        """Test that lines shown on the terminal are stripped."""
+        mock_shell.stdin = None
+        mock_shell.stdout = Pipe()
+        mock_shell.syscall.open_file = MagicMock(
+            side_effect=lambda path, mode: io.StringIO("x  \r\nend-of-a")
+        )
+
+        with patch(
+            "programs.cat.resolve_path",
+            side_effect=lambda shell, path: f"/test/{path}",
+        ):
+            cat_program.run(mock_shell, ["a", "a"])
+
+        mock_shell.syscall.open_file.assert_called_with("/test/a", "r")
+        assert mock_shell.stdout.value == ["x", "end-of-a", "x", "end-of-a"]
+
     def test_cat_run_with_stdin(self, mock_shell: Any) -> None:
         """Test cat run with stdin."""
         mock_shell.stdin = MagicMock()
@@ -165,3 +219,232 @@ class TestCatProgram:
         mock_shell.stdin.read.assert_called_once()
         # Check that stdout was written
         assert mock_shell.stdout.write.call_count == 2
+
+
+class TestPsProgram:
+
+    def test_ps_help(self) -> None:
+        """Test ps help message."""
+        help_text = ps_program.help()
+        assert isinstance(help_text, str)
+        assert len(help_text) > 0
+
+    def test_ps_lists_processes(self) -> None:
+        """Test that ps lists every shell of the system with its parent."""
+        system = kernel.system.System()
+        parent = system.new_shell(program="interpreter")
+        shell = system.new_shell(parent, program="ps", args=["-f"])
+        shell.run()
+        lines = list(shell.stdout.read())
+        assert lines[0] == "PID\tPPID\tSTATE\tSTART\tCMD"
+        assert lines[1].startswith("%d\t-\tnew\t" % (parent.pid,))
+        assert lines[2].startswith(
+            "%d\t%d\trunning\t" % (shell.pid, parent.pid)
+        )
+        assert lines[2].endswith("\tps -f")
+
+
+class TestHashProgram:
+
+    def test_hash_delete_needs_names(self) -> None:
+        """Test that hash -d without names is a usage error."""
+        mock_shell = MagicMock()
+        hash_program.run(mock_shell, ["-d"])
+        errors = [x[0][0] for x in mock_shell.stderr.write.call_args_list]
+        assert errors[0] == "hash: -d: option requires an argument"
+        assert errors[1].startswith("usage: hash")
+        mock_shell.system.commands.forget.assert_not_called()
+        mock_shell.stdout.write.assert_not_called()
+
+        hash_program.run(mock_shell, ["-d", "ls"])
+        mock_shell.system.commands.forget.assert_called_once_with("ls")
+
+
+class TestHistoryProgram:
+
+    def test_history_count(self) -> None:
+        """Test that a count of 0 lists nothing, with or without a user."""
+        mock_shell = MagicMock()
+        mock_shell.prevcommands = ["ls", "pwd"]
+        mock_shell.get_var.return_value = ""
+        for count, expected in [
+            ("0", []),
+            ("1", ["pwd"]),
+            ("5", ["ls", "pwd"]),
+        ]:
+            mock_shell.stdout.reset_mock()
+            history_program.run(mock_shell, [count])
+            written = [x[0][0] for x in mock_shell.stdout.write.call_args_list]
+            assert written == expected
+
+        mock_shell.get_var.return_value = "root"
+        mock_shell.syscall.count_history.return_value = 2
+        mock_shell.syscall.get_recent_history.return_value = []
+        mock_shell.stdout.reset_mock()
+        history_program.run(mock_shell, ["0"])
+        mock_shell.syscall.get_recent_history.assert_called_once_with("root", 0)
+        mock_shell.stdout.write.assert_not_called()
+
+
+class TestInterpreterProgram:
+
+    def test_eval_input_pipeline(self) -> None:
+        """Test that piped programs get no output redirection."""
+        mock_shell = MagicMock()
+        mock_shell.aliases = {}
+        programs = interpreter_program.eval_input(
+            mock_shell, ["cat", "a", "|", "grep", "b", ">", "out"]
+        )
+        assert programs == [
+            ["cat", ["a"], "", None],
+            ["grep", ["b"], "", ("out", "w")],
+        ]
+
+    def test_shell_expansion(self) -> None:
+        """Test expansions, and that cached lines follow their variables."""
+        mock_shell = MagicMock()
+        mock_shell.prevcommands = ["ls /"]
+        variables = {"A": "one", "HOME": "/home"}
+        mock_shell.get_var.side_effect = lambda x: variables.get(
+            x.lstrip("$"), ""
+        )
+        mock_shell.syscall.list_glob.return_value = ["/a.txt", "/b.txt"]
+
+        def expand(line: str) -> List[str]:
+            return interpreter_program.shell_expansion(mock_shell, line)[0]
+
+        line = "echo a{x,y} $A ~ '$A' *.txt"
+        expected = [
+            "echo",
+            "ax",
+            "ay",
+            "one",
+            "/home",
+            "$A",
+            "/a.txt",
+            "/b.txt",
+        ]
+        assert expand(line) == expected
+        hits = interpreter_program.expansion_cache.hits
+        assert expand(line) == expected
+        assert interpreter_program.expansion_cache.hits == hits + 1
+        variables["A"] = "two"
+        assert expand(line)[3] == "two"
+
+        # many words are not kept, the parse of their line is
+        line = "echo {a,b}{c,d}{e,f}{g,h}{i,j}{k,l}{m,n}"
+        assert len(expand(line)) == 129
+        quote, _, names = interpreter_program.parse_cache.get(line)
+        assert quote == tuple(line.split()) and names == ()
+        assert (quote, ()) not in interpreter_program.expansion_cache
+
+        assert expand("!! -l") == ["ls", "/", "-l"]
+        mock_shell.prevcommands = ["ls /tmp"]
+        assert expand("!! -l") == ["ls", "/tmp", "-l"]
+
+        mock_shell.hist_get.side_effect = lambda n: {0: "cat a"}.get(n, "")
+        assert expand("!0 b") == ["cat", "a", "b"]
+        with pytest.raises(ExpansionError, match="!7: event not found"):
+            expand("!7")
+
+    def test_brace_expansion(self) -> None:
+        """Test that braces expand lazily and within the limit."""
+        expand = interpreter_program.brace_expansion
+        assert list(expand(None, ["a{b,c}d{e,f}g", "'{x,y}'", "{z}"])) == [
+            "abdeg",
+            "abdfg",
+            "acdeg",
+            "acdfg",
+            "'{x,y}'",
+            "z",
+        ]
+        words = expand(None, ["{a,b}" * 16])
+        assert next(words) == "a" * 16
+        with patch.object(interpreter_program, "BRACEEXPANSIONMAX", 4):
+            words = expand(None, ["ls", "{a,b}", "{c,d}"])
+            assert next(words) == "ls"
+            with pytest.raises(ExpansionError):
+                list(words)
+
+    def test_static_expansion(self) -> None:
+        """Test that braces and tildes expand into a stream of words."""
+        words = interpreter_program.static_expansion(None, ["~/{a,b}" * 16])
+        assert next(words) == "$HOME/a" * 16
+        words = interpreter_program.static_expansion(None, ["~-", "$A{x,y}"])
+        names = interpreter_program.expansion_names(words)
+        assert names == ("$Ax", "$Ay", "$OLDPWD")
+
+    def test_fuse_stages(self) -> None:
+        """Test that consecutive filters are grouped into one stage."""
+        mock_shell = MagicMock()
+        mock_shell.aliases = {}
+        mock_shell.system.processes.accepts.return_value = False
+        mock_shell.find_program.side_effect = {
+            "cat": cat_program,
+            "grep": grep_program,
+            "head": head_program,
+        }.get
+
+        def groups(line: str) -> List[List[str]]:
+            programs = interpreter_program.eval_input(mock_shell, line.split())
+            return [
+                [stage[0] for _, stage in group]
+                for group in interpreter_program.fuse_stages(
+                    mock_shell, programs
+                )
+            ]
+
+        assert groups("cat a | grep b | head -n 2") == [
+            ["cat"],
+            ["grep", "head"],
+        ]
+        assert groups("grep b > out | head | grep c") == [
+            ["grep"],
+            ["head", "grep"],
+        ]
+        assert groups("grep b | head < in") == [["grep"], ["head"]]
+        assert groups("grep b | head -h") == [["grep"], ["head"]]
+
+    def test_run_builtin(self, clean_database: Any) -> None:
+        """Test that lone builtins run in place, without a new shell."""
+        system = kernel.system.System()
+        parent = system.new_shell(program="interpreter", path="/")
+        processes = len(system.pids)
+
+        def builtin(line: str) -> bool:
+            programs = interpreter_program.eval_input(parent, line.split())
+            return interpreter_program.run_builtin(parent, programs)
+
+        with patch("kernel.stream.logger") as mock_logger:
+            assert builtin("echo hi")
+        mock_logger.info.assert_called_once_with("<%s>\n%s", "out", "hi")
+        assert builtin("cd kernel")
+        assert parent.path == "/kernel"
+        assert builtin("alias ll=ls")
+        assert parent.aliases["ll"] == "ls"
+        assert len(system.pids) == processes
+
+        assert not builtin("echo hi | grep hi")
+        assert not builtin("echo hi > out")
+        assert not builtin("ls")
+
+        # a program of the same name earlier on PATH runs in its own shell
+        with patch.object(
+            parent,
+            "resolve_program",
+            return_value=(MagicMock(), "/bin/echo.py"),
+        ):
+            assert not builtin("echo hi")
+
+    def test_fused_filters(self) -> None:
+        """Test that fused filters give the output of separate stages."""
+        mock_shell = MagicMock()
+        mock_shell.stdin.read.return_value = iter(
+            ["line %d" % i for i in range(100)]
+        )
+        mock_shell.stdout = Pipe()
+        fused = interpreter_program.FusedFilters(
+            [(grep_program, ["7"]), (head_program, ["-n", "3"])]
+        )
+        fused.run(mock_shell, [])
+        assert mock_shell.stdout.value == ["line 7", "line 17", "line 27", ""]
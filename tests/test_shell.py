@@ -1,9 +1,18 @@
+import asyncio
+import os
+import io
+import threading
 import pytest
 from unittest.mock import patch, MagicMock
 
 import kernel.shell as shell
+import kernel.stream as stream
+from kernel.environment import History
+import programs.head as head_program
+from kernel.exceptions import BrokenPipeError
+from kernel.system import System
 from kernel.constants import PROGRAMSDIR
-from typing import Any
+from typing import Any, List, MutableMapping, Sequence
 
 
 class TestShell:
@@ -26,9 +35,9 @@ class TestShell:
             assert hasattr(mock_shell, "stdin")
             assert hasattr(mock_shell, "stdout")
             assert hasattr(mock_shell, "stderr")
-            assert isinstance(mock_shell.vars, dict)
-            assert isinstance(mock_shell.aliases, dict)
-            assert isinstance(mock_shell.prevcommands, list)
+            assert isinstance(mock_shell.vars, MutableMapping)
+            assert isinstance(mock_shell.aliases, MutableMapping)
+            assert isinstance(mock_shell.prevcommands, Sequence)
 
     def test_shell_initialization_with_parent(self) -> None:
         """Test shell initialization with parent shell."""
@@ -44,6 +53,64 @@ class TestShell:
             assert mock_shell.aliases["test_alias"] == "test_command"
             assert mock_shell.prevcommands == ["command1", "command2"]
 
+    def test_child_environment_copy_on_write(self) -> None:
+        """Test that parent and child do not see each other's changes."""
+        with patch("kernel.system.SysCall"):
+            parent_shell = shell.Shell(0, path="/parent")
+            parent_shell.set_var("A", "1")
+            child = shell.Shell(1, parent=parent_shell)
+            parent_shell.set_var("A", "2")
+            child.set_var("B", "3")
+            grandchild = shell.Shell(2, parent=child)
+
+            assert child.get_var("A") == "1"
+            assert parent_shell.get_var("A") == "2"
+            assert parent_shell.get_var("B") == ""
+            assert grandchild.get_var("A") == "1"
+            assert grandchild.get_var("B") == "3"
+            assert grandchild.get_var("PATH") == PROGRAMSDIR
+
+    def test_child_history_is_shared(self) -> None:
+        """Test that a child sees the history up to its creation."""
+        with patch("kernel.system.SysCall"):
+            parent_shell = shell.Shell(0, path="/parent")
+            history: Any = parent_shell.prevcommands
+            history.append("ls")
+            child = shell.Shell(1, parent=parent_shell)
+            history.append("pwd")
+            child_history: Any = child.prevcommands
+            child_history.append("cat")
+
+            assert list(parent_shell.prevcommands) == ["ls", "pwd"]
+            assert list(child.prevcommands) == ["ls", "cat"]
+            assert child.prevcommands[-1] == "cat"
+            assert child.prevcommands[0] == "ls"
+            assert child.hist_find("l") == "ls"
+
+    def test_child_history_of_full_parent(self) -> None:
+        """Test that a full parent appending does not shift a child's view."""
+        with patch("kernel.environment.HISTSIZE", 3):
+            parent = History()
+            for command in "abcd":
+                parent.append(command)
+            child = History(parent)
+            assert list(child) == ["b", "c", "d"]
+
+            parent.append("e")
+            # b is gone from the parent, c and d stay where they were
+            assert list(parent) == ["c", "d", "e"]
+            assert list(child) == ["c", "d"]
+            assert child[0] == "c" and child[-1] == "d"
+
+            child.append("x")
+            child.append("y")
+            assert list(child) == ["d", "x", "y"]
+            assert list(reversed(child)) == ["y", "x", "d"]
+            assert child[0] == "d"
+            grandchild = History(child)
+            child.append("z")
+            assert list(grandchild) == ["x", "y"]
+
     def test_get_path(self, mock_shell: Any) -> None:
         """Test get_path method."""
         assert mock_shell.path == "/test"
@@ -140,6 +207,37 @@ class TestShell:
         result = mock_shell.hist_find("file", start=False)
         assert result == "cat file.txt"
 
+    def test_hist_find_stored(self, mock_shell: Any) -> None:
+        """Test that hist_find looks up older commands in the store."""
+        mock_shell.prevcommands = ["ls -l"]
+        mock_shell.syscall.find_history.return_value = "cat old.txt"
+        assert mock_shell.hist_find("ls") == "ls -l"
+        assert mock_shell.hist_find("cat") == ""
+        mock_shell.syscall.find_history.assert_not_called()
+
+        mock_shell.set_var("USER", "root")
+        assert mock_shell.hist_find("cat") == "cat old.txt"
+        mock_shell.syscall.find_history.assert_called_once_with(
+            "root", "cat", True
+        )
+
+    def test_hist_get(self, mock_shell: Any) -> None:
+        """Test that hist_get numbers commands like history does."""
+        mock_shell.prevcommands = ["ls -l", "cat a"]
+        assert mock_shell.hist_get(0) == "ls -l"
+        assert mock_shell.hist_get(-1) == "cat a"
+        assert mock_shell.hist_get(2) == ""
+        assert mock_shell.hist_get(-3) == ""
+
+        # with a user, numbered over every session as the store is
+        mock_shell.set_var("USER", "root")
+        mock_shell.syscall.count_history.return_value = 5
+        mock_shell.syscall.get_history_command.return_value = "pwd"
+        assert mock_shell.hist_get(0) == "pwd"
+        assert mock_shell.hist_get(-2) == "pwd"
+        mock_shell.syscall.get_history_command.assert_called_with("root", 3)
+        assert mock_shell.hist_get(-6) == ""
+
     def test_find_program(self, mock_shell: Any) -> None:
         """Test find_program method."""
         mock_syscall = MagicMock()
@@ -167,3 +265,381 @@ class TestShell:
         ):
             result = mock_shell.find_program("test")
             assert result is False
+
+    def test_program_looked_up_once(self, mock_shell: Any) -> None:
+        """Test that a missing program is not searched for again by run."""
+        mock_shell.system = MagicMock()
+        mock_shell.system.processes.accepts.return_value = False
+        with pytest.raises(RuntimeError):
+            mock_shell.join()
+        with patch.object(
+            mock_shell, "find_program", return_value=False
+        ) as find:
+            mock_shell.start()
+            mock_shell.run()
+            assert find.call_count == 1
+        assert mock_shell.program is False
+        mock_shell.join(0)
+
+    def test_find_program_hashed(self, mock_shell: Any) -> None:
+        """Test that a resolved program is looked up directly next time."""
+        mock_syscall = MagicMock()
+        mock_syscall.open_program.side_effect = (
+            lambda x: x == "/programs/test.py" and "program_module"
+        )
+        mock_syscall.join_path.side_effect = os.path.join
+        mock_shell.syscall = mock_syscall
+        mock_shell.vars["PATH"] = "/bin:/programs"
+
+        assert mock_shell.find_program("test") == "program_module"
+        assert mock_syscall.open_program.call_count == 3
+        assert mock_shell.system.commands.stats()["misses"] == 1
+
+        mock_syscall.open_program.reset_mock()
+        assert mock_shell.find_program("test") == "program_module"
+        mock_syscall.open_program.assert_called_once_with("/programs/test.py")
+        assert mock_shell.system.commands.stats()["hits"] == 1
+
+    def test_find_program_hash_follows_path(self, mock_shell: Any) -> None:
+        """Test that hashed entries are not used with a different PATH."""
+        mock_syscall = MagicMock()
+        mock_syscall.open_program.side_effect = (
+            lambda x: x.endswith(".py") and x
+        )
+        mock_syscall.join_path.side_effect = os.path.join
+        mock_shell.syscall = mock_syscall
+
+        assert mock_shell.find_program("test") == "/programs/test.py"
+        mock_shell.vars["PATH"] = "/bin"
+        assert mock_shell.find_program("test") == "/bin/test.py"
+        assert [x[0] for x in mock_shell.system.commands.items()] == ["test"]
+
+
+class TestPipe:
+
+    def test_unread_pipe_keeps_lines(self) -> None:
+        """Test that a pipe without a reader collects everything."""
+        pipe = stream.Pipe(size=2)
+        for i in range(5):
+            pipe.write(i)
+        pipe.close()
+        assert pipe.value == ["0", "1", "2", "3", "4", None]
+        assert list(pipe.read()) == ["0", "1", "2", "3", "4"]
+
+    def test_write_blocks_when_full(self) -> None:
+        """Test that a writer waits for the reader once the buffer is full."""
+        pipe = stream.Pipe(size=2)
+        pipe.set_reader(MagicMock())
+
+        def produce() -> None:
+            for i in range(10):
+                pipe.write(i)
+            pipe.close()
+
+        writer = threading.Thread(target=produce)
+        writer.start()
+        writer.join(0.1)
+        assert writer.is_alive()
+        assert len(pipe._buffer) == 2
+
+        assert list(pipe.read()) == [str(i) for i in range(10)]
+        writer.join(1)
+        assert not writer.is_alive()
+
+    def test_read_blocks_until_close(self) -> None:
+        """Test that a reader sees lines written while it waits."""
+        pipe = stream.Pipe()
+        pipe.set_reader(MagicMock())
+        lines: List[str] = []
+        reader = threading.Thread(target=lambda: lines.extend(pipe.read()))
+        reader.start()
+        pipe.write("a\nb")
+        reader.join(0.1)
+        assert reader.is_alive()
+        pipe.write("c")
+        pipe.close()
+        reader.join(1)
+        assert lines == ["a", "b", "c"]
+        assert pipe.readline() == ""
+
+    def test_close_reader_breaks_pipe(self) -> None:
+        """Test that writers fail with BrokenPipeError once the reader left."""
+        pipe = stream.Pipe(size=1)
+        pipe.set_reader(MagicMock())
+        pipe.write("a")
+        errors: List[Exception] = []
+
+        def produce() -> None:
+            try:
+                pipe.write("b\nc")
+            except BrokenPipeError as e:
+                errors.append(e)
+
+        writer = threading.Thread(target=produce)
+        writer.start()
+        writer.join(0.1)
+        assert writer.is_alive()
+        pipe.close_reader()
+        writer.join(1)
+        assert not writer.is_alive()
+        assert len(errors) == 1
+        with pytest.raises(BrokenPipeError):
+            pipe.write_bytes(b"d")
+        pipe.close()
+        assert list(pipe.read()) == []
+
+    def test_head_stops_pipeline(self) -> None:
+        """Test that head ends an endless producer upstream."""
+        sys = System()
+
+        def produce(shell: Any, args: List[str]) -> None:
+            while True:
+                shell.stdout.write("y")
+
+        producer = shell.Shell(0, program="yes", system_instance=sys)
+        consumer = shell.Shell(
+            1, program="head", args=["-n", "3"], system_instance=sys
+        )
+        producer.stdout.set_reader(consumer)
+        with (
+            patch.object(
+                producer, "find_program", return_value=MagicMock(run=produce)
+            ),
+            patch.object(consumer, "find_program", return_value=head_program),
+        ):
+            producer.start()
+            consumer.start()
+            consumer.join(5)
+            producer.join(5)
+        assert not producer.is_alive()
+        assert [x for x in consumer.stdout.value if x] == ["y", "y", "y"]
+
+    @pytest.mark.parametrize("compress", [False, True])
+    def test_spill_to_disk(self, compress: bool) -> None:
+        """Test that a spilling pipe never blocks and keeps line order."""
+        pipe = stream.Pipe(size=2, spill=100, compress=compress)
+        pipe.set_reader(MagicMock())
+        expected = ["line %d" % i for i in range(50000)]
+        for line in expected:
+            pipe.write(line)
+        assert len(pipe._buffer) < 20
+        assert pipe._spill._file is not None
+
+        assert pipe.readline() == "line 0"
+        pipe.write("last")
+        pipe.close()
+        assert list(pipe.read()) == expected[1:] + ["last"]
+        assert pipe._spill._file is None
+
+    def test_bytes_to_lines(self) -> None:
+        """Test that chunks are split into lines across chunk borders."""
+        pipe = stream.Pipe()
+        pipe.set_reader(MagicMock())
+        pipe.write_bytes(b"one\ntw")
+        pipe.write_bytes(bytearray(b"o\nthree"))
+        pipe.write("four")
+        pipe.write_bytes(b"five")
+        pipe.close()
+        assert list(pipe.read()) == ["one", "two", "three", "four", "five"]
+
+    def test_lines_to_chunks(self) -> None:
+        """Test that chunks pass unchanged and lines are joined."""
+        pipe = stream.Pipe()
+        pipe.set_reader(MagicMock())
+        chunk = bytes(range(256))
+        pipe.write("a\nb")
+        pipe.write_bytes(chunk)
+        pipe.write("c")
+        pipe.close()
+        chunks = list(pipe.read_chunks())
+        assert chunks == [b"a\nb\n", chunk, b"c\n"]
+        assert chunks[1] is chunk
+
+    def test_readinto(self) -> None:
+        """Test that readinto copies the stream into a caller buffer."""
+        pipe = stream.Pipe(size=2)
+        pipe.set_reader(MagicMock())
+        data = bytes(range(256)) * 40
+
+        def produce() -> None:
+            for i in range(0, len(data), 1000):
+                pipe.write_bytes(data[i : i + 1000])
+            pipe.close()
+
+        writer = threading.Thread(target=produce)
+        writer.start()
+        out = bytearray()
+        buffer = bytearray(4096)
+        while n := pipe.readinto(buffer):
+            out += buffer[:n]
+        writer.join(1)
+        assert out == data
+
+    def test_unread_pipe_bytes(self) -> None:
+        """Test that bytes written to the terminal end up as lines."""
+        pipe = stream.Pipe()
+        pipe.write_bytes(b"a\nb")
+        pipe.write_bytes(b"c\n")
+        pipe.write_bytes(b"d")
+        pipe.close()
+        assert pipe.value == ["a", "bc", "d", None]
+
+    def test_spill_chunks(self) -> None:
+        """Test that spilled chunks and lines come back in order."""
+        pipe = stream.Pipe(spill=10, compress=True)
+        pipe.set_reader(MagicMock())
+        pipe.write("first line")
+        pipe.write_bytes(b"x" * 100000)
+        pipe.write("last")
+        pipe.close()
+        assert list(pipe.read_chunks()) == [
+            b"first line\n",
+            b"x" * 100000,
+            b"last\n",
+        ]
+
+    def test_async_read_write(self) -> None:
+        """Test that coroutines on one loop pass a full pipe along."""
+        pipe = stream.Pipe(size=2)
+        pipe.set_reader(MagicMock())
+        expected = ["line %d" % i for i in range(100)]
+
+        async def produce() -> None:
+            for line in expected:
+                await pipe.awrite(line)
+            await pipe.awrite_bytes(b"last\n")
+            pipe.close()
+
+        async def consume() -> List[str]:
+            return [line async for line in pipe.aread()]
+
+        async def main() -> List[str]:
+            lines = await asyncio.gather(produce(), consume())
+            return lines[1]
+
+        assert asyncio.run(main()) == expected + ["last"]
+
+    def test_async_reader_thread_writer(self) -> None:
+        """Test that a coroutine is woken by a writing thread."""
+        pipe = stream.Pipe(size=2)
+        pipe.set_reader(MagicMock())
+
+        def produce() -> None:
+            for i in range(50):
+                pipe.write(str(i))
+            pipe.close()
+
+        async def consume() -> List[str]:
+            writer = threading.Thread(target=produce)
+            writer.start()
+            lines = [line async for line in pipe.aread()]
+            writer.join(1)
+            return lines
+
+        assert asyncio.run(consume()) == [str(i) for i in range(50)]
+
+    def test_async_write_broken_pipe(self) -> None:
+        """Test that a waiting coroutine sees the reader go away."""
+        pipe = stream.Pipe(size=1)
+        pipe.set_reader(MagicMock())
+
+        async def produce() -> None:
+            await pipe.awrite("a")
+            asyncio.get_running_loop().call_later(0.01, pipe.close_reader)
+            await pipe.awrite("b")
+
+        with pytest.raises(BrokenPipeError):
+            asyncio.run(produce())
+
+    def test_async_program(self) -> None:
+        """Test that an async program runs on the scheduler."""
+        sys = System()
+
+        async def produce(shell: Any, args: List[str]) -> None:
+            assert await shell.asyscall.join_path("/a", "b") == "/a/b"
+            for i in range(int(args[0])):
+                await shell.stdout.awrite(i)
+
+        producer = shell.Shell(
+            0, program="count", args=["3"], system_instance=sys
+        )
+        consumer = shell.Shell(
+            1, program="head", args=["-n", "2"], system_instance=sys
+        )
+        producer.stdout.set_reader(consumer)
+        producer.program = MagicMock(run=produce)
+        consumer.program = head_program
+        try:
+            producer.start()
+            consumer.start()
+            producer.join(5)
+            consumer.join(5)
+            assert not producer.is_alive()
+            # only head needed a thread
+            assert sys.scheduler.stats()["submitted"] == 1
+            assert sys.workers.stats()["started"] == 1
+        finally:
+            sys.scheduler.close()
+        assert [x for x in consumer.stdout.value if x] == ["0", "1"]
+
+
+class TestFileStreams:
+
+    class Buffer(io.BytesIO):
+        def close(self) -> None:
+            self.data = self.getvalue()
+            super().close()
+
+    def test_file_reader(self) -> None:
+        """Test that a file reader yields lines and raw chunks."""
+        reader = stream.FileReader(io.BytesIO(b"one\ntwo\nthree"))
+        assert reader.readline() == "one"
+        assert list(reader.read()) == ["two", "three"]
+        reader = stream.FileReader(io.BytesIO(b"a\x00b\n"))
+        assert list(reader.read_chunks()) == [b"a\x00b\n"]
+        reader.close_reader()
+        assert list(reader.read()) == []
+
+    def test_file_writer(self) -> None:
+        """Test that a file writer stores lines and chunks in order."""
+        f = self.Buffer()
+        writer = stream.FileWriter(f)
+        writer.write("one")
+        writer.write_bytes(b"\x00two\n")
+        writer.close()
+        writer.write("dropped")
+        assert f.data == b"one\n\x00two\n"
+
+    def test_redirects(self) -> None:
+        """Test that < and > bind stdin and stdout to the opened files."""
+        with patch("kernel.system.SysCall"):
+            mock_shell: Any = shell.Shell(0, path="/test")
+        mock_shell.syscall.join_path.side_effect = os.path.join
+        mock_shell.syscall.iabs_path.side_effect = lambda x: x
+        source, target = io.BytesIO(b"in\n"), self.Buffer()
+        mock_shell.syscall.open_file.side_effect = [source, target]
+        piped = mock_shell.stdout
+        piped.set_reader(MagicMock())
+
+        mock_shell.redirect(stdin="in.txt", stdout=("out.txt", "a"))
+        assert mock_shell.open_redirects()
+        assert mock_shell.syscall.open_file.call_args_list == [
+            (("/test/in.txt", "rb"),),
+            (("/test/out.txt", "ab"),),
+        ]
+        assert list(mock_shell.stdin.read()) == ["in"]
+        mock_shell.stdout.write("out")
+        mock_shell.stdout.close()
+        assert target.data == b"out\n"
+        assert list(piped.read()) == []
+
+    def test_redirect_missing_file(self) -> None:
+        """Test that a file that cannot be opened stops the command."""
+        with patch("kernel.system.SysCall"):
+            mock_shell: Any = shell.Shell(0, path="/test")
+        mock_shell.syscall.join_path.side_effect = os.path.join
+        mock_shell.syscall.iabs_path.side_effect = lambda x: x
+        mock_shell.syscall.open_file.side_effect = IOError
+        mock_shell.redirect(stdin="missing.txt")
+        assert not mock_shell.open_redirects()
+        assert mock_shell.stderr.value == ["/test/missing.txt does not exist"]
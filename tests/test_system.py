@@ -1,9 +1,14 @@
+import threading
 import pytest
 from unittest.mock import patch, MagicMock
-from typing import Generator, Any
+from typing import Generator, Any, List
 
 import kernel.system as system
+from kernel.commandhash import CommandHash
 from kernel.constants import SystemState
+from kernel.proctable import RUNNING, ProcessTable
+from kernel.scheduler import Scheduler
+from kernel.workers import WorkerPool
 
 
 class TestSystem:
@@ -20,7 +25,7 @@ class TestSystem:
         sys = system.System()
 
         assert sys.state == SystemState.IDLE
-        assert sys.pids == []
+        assert len(sys.pids) == 0
         assert hasattr(sys, "filesystem")
         assert hasattr(sys, "metadata")
         assert hasattr(sys, "userdata")
@@ -144,6 +149,18 @@ class TestSysCall:
         assert hasattr(syscall, "md_service")
         assert hasattr(syscall, "ud_service")
 
+    def test_open_file_uses_own_metadata_service(self, syscall: Any) -> None:
+        """Test that opening a file does not set up another System."""
+        syscall.fs_service = MagicMock()
+        syscall.md_service = MagicMock()
+        with patch.object(system, "System") as mock_system:
+            f = system.SysCall.open_file.__wrapped__(  # type: ignore
+                syscall, "/a", "r"
+            )
+            f.close()
+        mock_system.assert_not_called()
+        assert syscall.md_service.set_time.call_count == 2
+
     # Test path-related methods
     def test_abs_path(self, syscall: Any) -> None:
         """Test absolute path method."""
@@ -334,3 +351,279 @@ class TestFileDecorator:
             # Check that the method was called on the underlying file
             mock_file.test_method.assert_called_once()
             assert result == "test_result"
+
+
+class TestPermissions:
+
+    @pytest.fixture
+    def tree(self, clean_database: Any) -> Generator[Any, None, None]:
+        """Create metadata for /a/b/c owned by chris."""
+        import kernel.metadata as md
+
+        md.add_path("/", "root", "rwxr-xr-x")
+        md.add_path("/a", "root", "rwxr-xr-x")
+        md.add_path("/a/b", "chris", "rwx------")
+        md.add_path("/a/b/c", "chris", "rw-------")
+        md.cache.clear()
+        yield system.System()
+
+    def test_ancestor_chain_single_query(self, tree: Any) -> None:
+        """Test that the whole ancestor chain is read with one query."""
+        import kernel.metadata as md
+
+        with patch.object(md, "execute_query", wraps=md.execute_query) as query:
+            assert system.has_permission("/a/b/c", "chris", "r", tree)
+            assert query.call_count == 1
+
+    def test_ancestor_chain_denied(self, tree: Any) -> None:
+        """Test that a missing permission on an ancestor denies access."""
+        assert not system.has_permission("/a/b/c", "root", "r", tree)
+        assert system.has_permission("/a", "root", "w", tree)
+        assert not system.has_permission("/a", "chris", "w", tree)
+        assert not system.compare_permission("/missing", "root", "r", tree)
+        assert system.compare_permission("/a/b", "chris", 5, tree)
+
+    def test_decisions_are_cached(self, tree: Any) -> None:
+        """Test that repeated checks do not touch the metadata."""
+        import kernel.metadata as md
+
+        assert system.has_permission("/a/b/c", "chris", "r", tree)
+        with patch.object(md, "get_many_meta_data") as lookup:
+            assert system.has_permission("/a/b/c", "chris", "r", tree)
+            lookup.assert_not_called()
+
+    def test_decisions_invalidated_by_writes(self, tree: Any) -> None:
+        """Test that permission and owner changes invalidate decisions."""
+        import kernel.metadata as md
+
+        assert system.has_permission("/a/b/c", "chris", "r", tree)
+        md.set_permission("/a/b", "---------")
+        assert not system.has_permission("/a/b/c", "chris", "r", tree)
+        md.set_permission("/a/b", "700")
+        assert system.has_permission("/a/b/c", "chris", "r", tree)
+        md.set_owner("/a/b", "root")
+        assert not system.has_permission("/a/b/c", "chris", "r", tree)
+
+    def test_missing_paths_not_cached(self, tree: Any) -> None:
+        """Test that creating a path is seen by later checks."""
+        import kernel.metadata as md
+
+        assert not system.has_permission("/new/file", "root", "w", tree)
+        md.add_path("/new", "root", "rwxr-xr-x")
+        assert system.has_permission("/new/file", "root", "w", tree)
+
+
+class TestProcessTable:
+
+    def test_pids_increase(self) -> None:
+        """Test that PIDs are never reused after a process exits."""
+        table = ProcessTable()
+        first, second = MagicMock(), MagicMock()
+        assert table.add(first) == 0
+        assert table.add(second) == 1
+        assert table.remove(first)
+        assert not table.remove(first)
+        assert table.add(MagicMock()) == 2
+        assert list(table) == [1, 2]
+        assert table.pid_of(second) == 1
+        assert table.pid_of(first) is None
+
+    def test_parents(self) -> None:
+        """Test parent and child links and per-process state."""
+        table = ProcessTable()
+        parent, child = MagicMock(), MagicMock()
+        table.add(parent)
+        pid = table.allocate()
+        assert table.add(child, pid, parent=parent) == pid
+        info = table.get(pid)
+        assert info is not None and info.ppid == 0 and info.state == "new"
+        assert table.get(0).children == {pid}  # type: ignore[union-attr]
+
+        table.set_state(child, RUNNING)
+        assert [x.state for x in table.processes()] == ["new", RUNNING]
+        table.remove(child)
+        assert table.get(0).children == set()  # type: ignore[union-attr]
+
+    def test_new_shell_links_parent(self) -> None:
+        """Test that shells started by a shell are its children."""
+        sys = system.System()
+        parent = sys.new_shell(program="interpreter")
+        child = sys.new_shell(parent, program="ls")
+        assert child.pid == parent.pid + 1
+        assert sys.get_process(child.pid) is child
+        assert sys.pids.get(child.pid).ppid == parent.pid  # type: ignore
+        sys.kill(child)
+        assert sys.get_pid(child) is None
+        assert sys.new_shell(program="ls").pid == child.pid + 1
+
+
+class TestCommandHash:
+
+    def test_lookup(self) -> None:
+        """Test that entries only match the PATH they were found with."""
+        commands = CommandHash()
+        assert commands.lookup("ls", "/programs") is None
+        commands.remember("ls", "/programs/ls.py", "/programs")
+        assert commands.lookup("ls", "/programs") == "/programs/ls.py"
+        assert commands.lookup("ls", "/bin:/programs") is None
+        assert commands.stats() == {"size": 1, "hits": 1, "misses": 2}
+        assert commands.items() == [("ls", "/programs/ls.py", 2)]
+
+    def test_invalidate(self) -> None:
+        """Test that changes drop stale and possibly shadowed entries."""
+        commands = CommandHash()
+        commands.remember("ls", "/programs/ls.py", "/bin:/programs")
+        commands.remember("cat", "/programs/cat.py", "/bin:/programs")
+        commands.remember("tool", "/bin/tool", "/bin:/programs")
+
+        commands.invalidate("/bin/ls.py")
+        assert [x[0] for x in commands.items()] == ["cat", "tool"]
+        commands.invalidate("/bin")
+        assert [x[0] for x in commands.items()] == ["cat"]
+        commands.forget()
+        assert len(commands) == 0
+
+    def test_syscall_invalidates(self, clean_database: Any) -> None:
+        """Test that creating a file in a PATH directory drops its entry."""
+        sys = system.System()
+        call = system.SysCall(MagicMock(), sys)
+        sys.commands.remember("new", "/programs/new.py", "/bin:/programs")
+        with patch.object(call.fs_service, "make_dir"):
+            call.make_dir("/bin")
+        assert len(sys.commands) == 1
+        with patch.object(call.fs_service, "copy"):
+            call.copy("/programs/cat.py", "/bin/new.py")
+        assert len(sys.commands) == 0
+
+
+class TestWorkerPool:
+
+    def wait_for(self, pool: WorkerPool, key: str, value: int) -> None:
+        for _ in range(100):
+            if pool.stats()[key] == value:
+                return
+            threading.Event().wait(0.01)
+        assert pool.stats()[key] == value
+
+    def test_workers_reused(self) -> None:
+        """Test that tasks run one after another share a thread."""
+        pool = WorkerPool(2)
+        names = []
+        for i in range(5):
+            pool.submit(lambda: names.append(threading.current_thread().name))
+            self.wait_for(pool, "completed", i + 1)
+            self.wait_for(pool, "idle", 1)
+        assert names == ["worker-1"] * 5
+        assert pool.stats()["started"] == 1
+        pool.close()
+        self.wait_for(pool, "workers", 0)
+
+    def test_blocked_tasks_get_workers(self) -> None:
+        """Test that a task waiting on a later one does not starve it."""
+        pool = WorkerPool(1)
+        first, second = threading.Event(), threading.Event()
+
+        def wait_for_second() -> None:
+            if second.wait(1):
+                first.set()
+
+        pool.submit(wait_for_second)
+        pool.submit(second.set)
+        assert first.wait(1)
+        assert pool.stats()["started"] == 2
+
+    def test_queue_when_full(self) -> None:
+        """Test that tasks beyond max_workers wait for a free worker."""
+        pool = WorkerPool(1, max_workers=1)
+        release = threading.Event()
+        done = threading.Event()
+
+        def block() -> None:
+            release.wait(1)
+
+        pool.submit(block)
+        pool.submit(done.set)
+        assert pool.stats()["queued"] == 1
+        assert not done.is_set()
+        release.set()
+        assert done.wait(1)
+        assert pool.stats()["started"] == 1
+
+    def test_idle_workers_exit(self) -> None:
+        """Test that idle workers leave after the keepalive timeout."""
+        pool = WorkerPool(2, keepalive=0.01)
+        pool.submit(lambda: None)
+        self.wait_for(pool, "completed", 1)
+        self.wait_for(pool, "workers", 0)
+
+
+class TestProcessPool:
+
+    def test_accepts(self) -> None:
+        """Test that only programs marked cpu_bound run in processes."""
+        import programs.grep
+        import programs.head
+
+        assert not system.System().processes.accepts(programs.grep)
+        pool = system.System().processes
+        pool.size = 1
+        assert pool.accepts(programs.grep)
+        assert not pool.accepts(programs.head)
+        assert not pool.accepts(MagicMock())
+
+    def test_run_in_process(self, clean_database: Any) -> None:
+        """Test a program in a worker reading stdin and files."""
+        import kernel.stream
+
+        sys = system.System()
+        sys.processes.size = 1
+        try:
+            first = sys.new_shell(program="grep", args=["-i", "B"], path="/")
+            first.stdin = kernel.stream.Pipe()
+            first.stdin.set_reader(first)
+            for line in ["a", "b", "B c", "d"]:
+                first.stdin.write(line)
+            first.stdin.close()
+            first.run()
+            assert first.stdout.value[:2] == ["b", "B c"]
+
+            second = sys.new_shell(
+                program="grep", args=["pronounced", "/README.md"], path="/"
+            )
+            second.run()
+            assert second.stdout.value[0].startswith("pyOS (pronounced")
+            assert sys.processes.stats()["started"] == 1
+        finally:
+            sys.processes.close()
+        assert sys.processes.stats()["workers"] == 0
+
+
+class TestScheduler:
+
+    def test_run_and_blocking(self) -> None:
+        """Test that blocking calls leave the loop thread free."""
+        scheduler = Scheduler(2)
+
+        async def task() -> List[str]:
+            names = [threading.current_thread().name]
+            names.append(
+                await scheduler.blocking(
+                    lambda: threading.current_thread().name
+                )
+            )
+            return names
+
+        try:
+            loop, blocking = scheduler.run(task())
+            assert loop == "scheduler"
+            assert blocking.startswith("blocking")
+        finally:
+            scheduler.close()
+        # a closed scheduler starts again when used
+        assert scheduler.run(task())[0] == "scheduler"
+        scheduler.close()
+        assert scheduler.stats() == {
+            "submitted": 2,
+            "running": 0,
+            "completed": 2,
+        }
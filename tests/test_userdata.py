@@ -238,3 +238,28 @@ class TestUserDataDatabase:
         # Test non-existent user
         result = ud.correct_password("nonexistent", "anypassword")
         assert result is False
+
+    def test_history(self, clean_database: Tuple[str, str]) -> None:
+        """Test storing, paging and searching the history of a user."""
+        for command in ["ls -l", "cat a", "ls -a", "grep ls b"]:
+            ud.add_history("root", command)
+        ud.add_history("chris", "ls /chris")
+
+        assert ud.count_history("root") == 4
+        assert ud.get_recent_history("root", 2) == ["ls -a", "grep ls b"]
+        assert ud.get_history_command("root", 0) == "ls -l"
+        assert ud.get_history_command("root", 3) == "grep ls b"
+        assert ud.get_history_command("root", 4) == ""
+        assert ud.get_history_command("chris", 0) == "ls /chris"
+        assert ud.count_history("chris") == 1
+        assert ud.count_history("nonexistent") == 0
+        page = ud.get_history("root", 0, 2)
+        assert [x[1] for x in page] == ["ls -l", "cat a"]
+        page = ud.get_history("root", page[-1][0], 10)
+        assert [x[1] for x in page] == ["ls -a", "grep ls b"]
+
+        assert ud.find_history("root", "ls") == "ls -a"
+        assert ud.find_history("root", "LS") == ""
+        assert ud.find_history("root", "ls", False) == "grep ls b"
+        assert ud.find_history("root", "chris", False) == ""
+        assert ud.find_history("nonexistent", "ls") == ""
@@ -1,3 +1,4 @@
+import threading
 from unittest.mock import MagicMock
 
 import kernel.utils as utils
@@ -50,6 +51,32 @@ class TestParser:
         assert parser.help is True
         mock_shell.stdout.write.assert_called_once()
 
+    def test_add_shell_resets_help(self) -> None:
+        """Test that a reused parser starts every run without help set."""
+        parser = utils.Parser("test_program")
+        parser.add_shell(MagicMock())
+        parser.print_help()
+        assert parser.help is True
+        parser.add_shell(MagicMock())
+        assert parser.help is False
+
+    def test_state_per_thread(self) -> None:
+        """Test that concurrent runs of one parser do not share a shell."""
+        parser = utils.Parser("test_program")
+        main_shell = MagicMock()
+        parser.add_shell(main_shell)
+
+        def other() -> None:
+            parser.add_shell(MagicMock())
+            parser.print_usage()
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+        assert parser.shell is main_shell
+        assert parser.help is False
+        main_shell.stderr.write.assert_not_called()
+
     def test_help_msg(self) -> None:
         """Test help_msg method."""
         parser = utils.Parser("test_program", name="Test Program")